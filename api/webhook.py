@@ -1,32 +1,36 @@
 import json
 import os
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
 # Добавляем путь к родительской директории
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bot import start_command, help_command, handle_message
+# При загрузке - только стандартная библиотека; asyncio, telegram и Langflow
+# импортируются при первом update, которому они действительно нужны
+import fast_path
+import update_filter
 
-TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Повторные доставки update в тёплом инстансе отбрасываются
+deduplicator = update_filter.UpdateDeduplicator()
 
 def handler(event, context):
     try:
         # Vercel передает данные в event['body']
         body = json.loads(event.get('body', '{}'))
         
-        # Создаем Application
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-        
-        # Регистрируем хендлеры
-        application.add_handler(CommandHandler('start', start_command))
-        application.add_handler(CommandHandler('help', help_command))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        
-        # Обработка update
-        update = Update.de_json(body, application.bot)
-        application.process_update(update)
+        if update_filter.is_valid_update(body) and not deduplicator.check_and_add(body['update_id']):
+            # /start и /help: ответ в теле webhook без построения Application
+            reply = fast_path.webhook_reply(body)
+            if reply is not None:
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps(reply, ensure_ascii=False)
+                }
+            
+            # Обработка update общим Application, переживающим вызовы в тёплом инстансе
+            import app_lifecycle
+            app_lifecycle.run_sync(app_lifecycle.process_update_data(body))
         
         return {
             'statusCode': 200,
@@ -36,4 +40,4 @@ def handler(event, context):
         return {
             'statusCode': 500,
             'body': json.dumps({"status": "error", "message": str(e)})
-        }
\ No newline at end of file
+        }
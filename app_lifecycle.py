@@ -0,0 +1,266 @@
+"""
+Жизненный цикл Telegram Application, общий для всех вызовов webhook.
+
+Application (Bot, HTTP-клиент, таблица хендлеров) строится и инициализируется
+один раз на процесс - лениво, при первом запросе - и переиспользуется для всех
+последующих update. Все корутины выполняются в одном постоянном event loop,
+который живёт в фоновом потоке (или loop ASGI-сервера, см. adopt_running_loop),
+поэтому пул соединений Bot переживает запрос.
+
+Модуль не импортирует telegram и хендлеры при загрузке: они нужны только
+при первой обработке update, а быстрый путь webhook обходится без них.
+"""
+import asyncio
+import atexit
+import functools
+import importlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from log_setup import setup_logging
+import inline_reply
+import metrics
+import tracing
+
+if TYPE_CHECKING:
+    from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Адрес Bot API (переопределяется для локальных тестов и бенчмарков)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
+
+# Файл хендлеров start_command/help_command/handle_message: bot.py (webhook)
+# или "bot copy.py" (ответы Langflow, как у бота в режиме polling)
+BOT_HANDLERS = os.getenv('BOT_HANDLERS', 'bot.py')
+
+# Таймаут ожидания завершения shutdown при выходе процесса
+SHUTDOWN_TIMEOUT = 10
+
+_application = None
+_init_lock = asyncio.Lock()
+
+_loop = None
+_loop_thread = None
+_loop_guard = threading.Lock()
+
+# cold - запросы, заплатившие за построение и initialize(), warm - переиспользовавшие Application
+_stats = {
+    'cold': 0,
+    'warm': 0,
+    'setup_seconds': 0.0,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_handlers(path: str = None):
+    """
+    Модуль с хендлерами бота.
+
+    :param path: Файл модуля относительно корня проекта (по умолчанию BOT_HANDLERS)
+    :return: Модуль с start_command, help_command и handle_message
+    """
+    path = path or BOT_HANDLERS
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.isidentifier():
+        return importlib.import_module(name)
+
+    # Имя файла не годится для import (например, "bot copy.py")
+    module_name = '_'.join(name.split())
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(os.path.dirname(os.path.abspath(__file__)), path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def build_application(token: str = None, handlers: str = None) -> 'Application':
+    """
+    Построение Application с зарегистрированными хендлерами.
+
+    :param token: Токен бота (по умолчанию TELEGRAM_BOT_TOKEN)
+    :param handlers: Файл хендлеров (по умолчанию BOT_HANDLERS)
+    :return: Неинициализированный Application
+    """
+    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+
+    from update_scheduler import ChatUpdateProcessor
+
+    module = load_handlers(handlers)
+    setup_logging()
+
+    application = (
+        Application.builder()
+        .token(token or TELEGRAM_BOT_TOKEN)
+        .base_url(f'{TELEGRAM_API_BASE_URL}/bot')
+        # Размер пула как у HTTPXRequest по умолчанию в ApplicationBuilder
+        .request(inline_reply.build_request(connection_pool_size=256))
+        # Исходящая очередь модуля хендлеров (если есть) ограничивает и ответы о перегрузке
+        .concurrent_updates(ChatUpdateProcessor(sender=getattr(module, 'sender', None)))
+        .build()
+    )
+
+    application.add_handler(CommandHandler('start', module.start_command))
+    application.add_handler(CommandHandler('help', module.help_command))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, module.handle_message))
+
+    return application
+
+
+async def get_application() -> 'Application':
+    """
+    Получение общего Application, построенного и инициализированного один раз.
+
+    :return: Инициализированный Application
+    """
+    global _application
+
+    if _application is not None:
+        _stats['warm'] += 1
+        return _application
+
+    async with _init_lock:
+        if _application is not None:
+            _stats['warm'] += 1
+            return _application
+
+        started = time.perf_counter()
+        application = build_application()
+        await application.initialize()
+        elapsed = time.perf_counter() - started
+        metrics.observe_stage('application_setup', elapsed)
+
+        _stats['cold'] += 1
+        _stats['setup_seconds'] += elapsed
+        logger.info("Application инициализирован за %.3f с", elapsed)
+
+        _application = application
+        return application
+
+
+async def process_update_data(update_data: dict, inline: inline_reply.InlineReply = None) -> None:
+    """
+    Обработка сырого update от Telegram общим Application.
+    Update проходит через планировщик: порядок внутри чата и быстрая полоса команд.
+
+    :param update_data: JSON-тело update
+    :param inline: Сборщик ответа в теле webhook (None - ответы обычными запросами)
+    """
+    from telegram import Update
+
+    try:
+        application = await get_application()
+        with metrics.stage_timer('update_de_json'):
+            update = Update.de_json(update_data, application.bot)
+        with inline_reply.collecting(inline):
+            await application.update_processor.process_update(update, application.process_update(update))
+    finally:
+        await inline_reply.finish(inline)
+
+
+async def shutdown() -> None:
+    """Корректное завершение общего Application"""
+    global _application
+
+    async with _init_lock:
+        if _application is None:
+            return
+        application, _application = _application, None
+        await application.shutdown()
+        logger.info("Application остановлен")
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Получение постоянного event loop процесса (запускается при первом вызове).
+
+    :return: Event loop, работающий в фоновом потоке
+    """
+    global _loop, _loop_thread
+
+    with _loop_guard:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_run_loop, args=(_loop,), name='app-lifecycle-loop', daemon=True
+            )
+            _loop_thread.start()
+        return _loop
+
+
+def adopt_running_loop() -> None:
+    """
+    Использование текущего event loop (например, ASGI-сервера) как постоянного
+    loop процесса вместо фонового потока. Вызывается при старте сервера;
+    остановку Application тогда выполняет сервер через shutdown().
+    """
+    global _loop
+
+    loop = asyncio.get_running_loop()
+    with _loop_guard:
+        if _loop is not None and _loop is not loop:
+            raise RuntimeError("Постоянный event loop уже запущен")
+        _loop = loop
+
+
+def run_sync(coro, timeout: float = None):
+    """
+    Выполнение корутины в постоянном event loop из синхронного кода.
+
+    :param coro: Корутина
+    :param timeout: Максимальное время ожидания результата
+    :return: Результат корутины
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def get_stats() -> dict:
+    """
+    Статистика жизненного цикла: сколько запросов заплатили за инициализацию.
+
+    :return: Словарь со счётчиками cold/warm, суммарным временем setup
+             и метриками планировщика
+    """
+    stats = dict(_stats, initialized=_application is not None)
+    if _application is not None:
+        stats['scheduler'] = _application.update_processor.stats()
+    return stats
+
+
+def _shutdown_at_exit() -> None:
+    global _loop, _loop_thread
+
+    # Loop, принятый через adopt_running_loop(), останавливает его владелец
+    if _loop is None or _loop_thread is None:
+        return
+
+    try:
+        run_sync(shutdown(), timeout=SHUTDOWN_TIMEOUT)
+    except Exception as e:
+        logger.error("Ошибка при остановке Application: %s", e)
+    finally:
+        _loop.call_soon_threadsafe(_loop.stop)
+        _loop_thread.join(SHUTDOWN_TIMEOUT)
+        _loop = _loop_thread = None
+
+
+atexit.register(_shutdown_at_exit)
+metrics.register_collector('tbot_application', get_stats)
+metrics.register_collector('tbot_tracing', tracing.tracer.stats)
+metrics.register_collector('tbot_inline_reply', inline_reply.stats)
@@ -0,0 +1,256 @@
+"""
+ASGI-сервер webhook: все запросы и обработка update выполняются в одном
+постоянном event loop сервера (uvloop, если установлен).
+
+Flask (main.py) обслуживает запросы в потоках и передаёт update в loop
+фонового потока app_lifecycle. Здесь loop сервера сам становится постоянным
+loop процесса: webhook ставит update в очередь без перехода между потоками,
+а Application, пул соединений Bot и клиент Langflow живут, пока живёт сервер.
+
+Маршруты те же, что у main.py: / (проверка работы), /metrics, /stats,
+/set_webhook и POST /<TELEGRAM_BOT_TOKEN>.
+
+Остановка (SIGTERM/SIGINT): сервер перестаёт принимать соединения и
+дожидается текущих запросов, затем новые update получают 503 (Telegram
+доставит их повторно), принятые update дорабатываются не дольше
+ASGI_DRAIN_TIMEOUT, после чего Application останавливается.
+
+Запуск: python asgi.py [--host 0.0.0.0] [--port 8080]
+    или uvicorn asgi:app --loop uvloop
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+import app_lifecycle
+import inline_reply
+import metrics
+import update_queue
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Адрес webhook без токена (обязателен для /set_webhook)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+# Сколько дорабатывать принятые update при остановке
+ASGI_DRAIN_TIMEOUT = float(os.getenv('ASGI_DRAIN_TIMEOUT', '25'))
+# Максимальный размер тела запроса
+ASGI_MAX_BODY = int(os.getenv('ASGI_MAX_BODY', str(1024 * 1024)))
+
+setup_logging()
+
+dispatcher = update_queue.UpdateDispatcher()
+metrics.register_collector('tbot_webhook_queue', dispatcher.stats)
+
+WEBHOOK_PATH = f'/{TELEGRAM_BOT_TOKEN}'
+
+_draining = False
+
+
+class _Response:
+    __slots__ = ('status', 'body', 'content_type')
+
+    def __init__(self, body, status: int = 200, content_type: str = 'text/html; charset=utf-8'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False)
+            content_type = 'application/json'
+        self.status = status
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.content_type = content_type
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > ASGI_MAX_BODY:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def webhook(body: bytes) -> _Response:
+    """
+    Приём update: постановка в очередь и, если успеет, короткий ответ в теле.
+
+    :param body: Тело запроса Telegram
+    :return: Ответ webhook
+    """
+    try:
+        update_data = json.loads(body)
+    except ValueError:
+        update_data = None
+    if not update_queue.is_valid_update(update_data):
+        return _Response('Bad Request', 400)
+    if _draining:
+        return _Response('Service Unavailable', 503)
+
+    inline = inline_reply.InlineReply(update_data) if inline_reply.INLINE_REPLY_BUDGET > 0 else None
+    result = await dispatcher.submit(update_data, inline)
+    if result == update_queue.QUEUE_FULL:
+        return _Response('Service Unavailable', 503)
+
+    if result == update_queue.ACCEPTED and inline is not None:
+        reply = await inline.wait_async(inline_reply.INLINE_REPLY_BUDGET)
+        if reply is not None:
+            return _Response(reply)
+    return _Response('OK')
+
+
+async def set_webhook() -> _Response:
+    """
+    Установка webhook через общий Bot (переиспользуется его пул соединений).
+    Адрес берётся только из WEBHOOK_URL: заголовки запроса задаёт кто угодно,
+    и webhook с токеном в пути ушёл бы на чужой сервер.
+
+    :return: Ответ Bot API
+    """
+    if not WEBHOOK_URL:
+        logger.error("WEBHOOK_URL не задан, webhook не установлен")
+        return _Response({'ok': False, 'description': 'WEBHOOK_URL is not set'}, 500)
+    base_url = WEBHOOK_URL
+    application = await app_lifecycle.get_application()
+    try:
+        result = await application.bot.set_webhook(url=f'{base_url.rstrip("/")}{WEBHOOK_PATH}')
+    except Exception as e:
+        logger.error("Ошибка установки webhook: %s", e)
+        return _Response({'ok': False, 'description': str(e)}, 502)
+    return _Response({'ok': True, 'result': result})
+
+
+async def route(scope: dict, body: bytes) -> _Response:
+    method, path = scope['method'], scope['path']
+
+    if path == WEBHOOK_PATH and TELEGRAM_BOT_TOKEN:
+        if method != 'POST':
+            return _Response('Method Not Allowed', 405)
+        return await webhook(body)
+
+    if method not in ('GET', 'HEAD'):
+        return _Response('Method Not Allowed', 405)
+    if path == '/':
+        return _Response("Бот работает!")
+    if path == '/metrics':
+        return _Response(metrics.render_prometheus(), content_type='text/plain; version=0.0.4')
+    if path == '/stats':
+        return _Response({'application': app_lifecycle.get_stats(), 'queue': dispatcher.stats()})
+    if path == '/set_webhook':
+        return await set_webhook()
+    return _Response('Not Found', 404)
+
+
+async def startup() -> None:
+    """Старт сервера: его loop становится постоянным, Application прогревается"""
+    app_lifecycle.adopt_running_loop()
+    try:
+        await app_lifecycle.get_application()
+    except Exception as e:
+        # Application будет построен при первом update
+        logger.error("Не удалось инициализировать Application при старте: %s", e)
+
+
+async def shutdown() -> None:
+    """Остановка: новые update отклоняются, принятые дорабатываются"""
+    global _draining
+
+    _draining = True
+    await dispatcher.stop(ASGI_DRAIN_TIMEOUT)
+    await app_lifecycle.shutdown()
+
+    # Клиент Langflow закрывается, только если хендлеры его загрузили
+    langflow_client = sys.modules.get('langflow_client')
+    if langflow_client is not None:
+        await langflow_client.close_async_client()
+    logger.info("Сервер остановлен")
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await startup()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await shutdown()
+            except Exception as e:
+                logger.exception("Ошибка остановки")
+                await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """ASGI-приложение"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    body = await _read_body(receive)
+    if body is None:
+        response = _Response('Payload Too Large', 413)
+    else:
+        try:
+            response = await route(scope, body)
+        except Exception:
+            logger.exception("Ошибка обработки запроса %s", scope['path'])
+            response = _Response('Internal Server Error', 500)
+
+    await send({
+        'type': 'http.response.start',
+        'status': response.status,
+        'headers': [
+            (b'content-type', response.content_type.encode('latin-1')),
+            (b'content-length', str(len(response.body)).encode('latin-1')),
+        ],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': b'' if scope['method'] == 'HEAD' else response.body,
+    })
+
+
+def event_loop_name() -> str:
+    """uvloop, если установлен, иначе стандартный asyncio"""
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return 'asyncio'
+    return 'uvloop'
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='ASGI-сервер webhook')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8080')))
+    args = parser.parse_args()
+
+    loop = event_loop_name()
+    logger.info("Запуск ASGI-сервера на %s:%s, event loop: %s", args.host, args.port, loop)
+    # Один процесс: Application и очередь update общие для всех запросов
+    uvicorn.run(
+        app, host=args.host, port=args.port, loop=loop, lifespan='on',
+        access_log=False, log_config=None, timeout_graceful_shutdown=ASGI_DRAIN_TIMEOUT,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Пакетный прогон вопросов через поток Langflow: прогрев кэша, проверка
+ответов после изменения потока, оценка качества.
+
+Вход - JSONL (файл или stdin): строка вида {"id": "q1", "message": "..."}
+или просто JSON-строка с вопросом; без id используется номер строки.
+Запросы выполняются параллельно (не больше --concurrency одновременно)
+через общий пул соединений, endpoint'ы, повторы и circuit breaker
+langflow_client. Кэш ответов не используется: каждый вопрос идёт в поток.
+
+Результаты пишутся в JSONL по мере готовности, в порядке входа
+(--order input) или завершения (--order completion):
+    {"id", "message", "answer", "flow_id", "latency", "error"}
+Выходной файл служит контрольной точкой: при повторном запуске с --resume
+вопросы, уже получившие ответ, пропускаются, а неудачные повторяются.
+Этот же файл загружается в кэш ответов бота через ANSWER_CACHE_WARM_FILE.
+
+Пример:
+  python batch_runner.py prompts.jsonl -o answers.jsonl --concurrency 16 --resume
+  cat prompts.jsonl | python batch_runner.py --order completion > answers.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, List, Optional
+
+import langflow_client
+from langflow_client import ERROR_RESPONSES, FLOW_ID, extract_response_text, run_flow_async
+from log_setup import setup_logging
+from resilience import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+# Во сколько раз число принятых в работу вопросов может превышать
+# параллельность, пока в порядке входа ждём медленный вопрос
+INPUT_ORDER_WINDOW = 4
+# Как часто писать прогресс в лог
+PROGRESS_EVERY = 50
+
+
+def read_items(stream) -> List[dict]:
+    """
+    Разбор входного JSONL.
+
+    :param stream: Текстовый поток
+    :return: Список {'id', 'message'}
+    """
+    items = []
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            logger.warning("Строка %s пропущена: %s", number, e)
+            continue
+
+        if isinstance(data, str):
+            data = {'message': data}
+        message = data.get('message') if isinstance(data, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            logger.warning("Строка %s пропущена: нет поля message", number)
+            continue
+        items.append({'id': data.get('id', number), 'message': message})
+    return items
+
+
+def load_checkpoint(path: str) -> set:
+    """
+    ID вопросов, уже получивших ответ. Недописанная последняя строка
+    (процесс прервали во время записи) отрезается.
+
+    :param path: Выходной файл предыдущего запуска
+    :return: Множество id
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            f.truncate(complete)
+            logger.warning("Отрезана недописанная строка в %s", path)
+
+    done = set()
+    for line in data[:complete].decode('utf-8').splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not record.get('error'):
+            done.add(record['id'])
+    return done
+
+
+async def run_item(item: dict, flow: Optional[str] = None) -> dict:
+    """
+    Один вопрос через поток.
+
+    :param item: {'id', 'message'}
+    :param flow: ID потока (None - пул LANGFLOW_ENDPOINTS)
+    :return: Запись результата
+    """
+    started = time.perf_counter()
+    answer, error = None, None
+    try:
+        with deadline_scope(langflow_client.LANGFLOW_DEADLINE):
+            response = await run_flow_async(item['message'], endpoint=flow)
+        answer = extract_response_text(response, flow or FLOW_ID)
+        if answer in ERROR_RESPONSES:
+            error = 'no_answer'
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        'id': item['id'],
+        'message': item['message'],
+        'answer': answer,
+        'flow_id': flow or FLOW_ID,
+        'latency': round(time.perf_counter() - started, 4),
+        'error': error,
+    }
+
+
+async def run_batch(items: List[dict],
+                    write: Callable[[dict], None],
+                    concurrency: int = 8,
+                    order: str = 'input',
+                    flow: Optional[str] = None) -> List[dict]:
+    """
+    Параллельный прогон вопросов с выдачей результатов по мере готовности.
+
+    :param items: Вопросы
+    :param write: Запись одного результата
+    :param concurrency: Максимум одновременных запросов к потоку
+    :param order: 'input' - порядок входа, 'completion' - порядок завершения
+    :param flow: ID потока (None - пул LANGFLOW_ENDPOINTS)
+    :return: Все результаты в порядке записи
+    """
+    running = asyncio.Semaphore(concurrency)
+    # Ограничение на результаты, ожидающие записи в порядке входа
+    slots = asyncio.Semaphore(concurrency * (INPUT_ORDER_WINDOW if order == 'input' else 1))
+    buffered = {}
+    written = []
+    next_seq = 0
+    started = time.monotonic()
+
+    def emit(record: dict) -> None:
+        write(record)
+        written.append(record)
+        slots.release()
+        if len(written) % PROGRESS_EVERY == 0:
+            elapsed = time.monotonic() - started
+            logger.info("Готово %s из %s (%.1f вопросов/с)", len(written), len(items), len(written) / elapsed)
+
+    async def process(seq: int, item: dict) -> None:
+        nonlocal next_seq
+        async with running:
+            record = await run_item(item, flow)
+        if order == 'completion':
+            emit(record)
+            return
+        buffered[seq] = record
+        while next_seq in buffered:
+            emit(buffered.pop(next_seq))
+            next_seq += 1
+
+    tasks = []
+    for seq, item in enumerate(items):
+        await slots.acquire()
+        tasks.append(asyncio.ensure_future(process(seq, item)))
+    await asyncio.gather(*tasks)
+    return written
+
+
+def summarize(records: List[dict], elapsed: float) -> str:
+    """
+    Итог прогона: ошибки, задержки, пропускная способность.
+
+    :param records: Результаты
+    :param elapsed: Длительность прогона в секундах
+    :return: Текст отчёта
+    """
+    errors = sum(1 for record in records if record['error'])
+    latencies = sorted(record['latency'] for record in records)
+    if not latencies:
+        return "Нет вопросов для обработки"
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    return (
+        f"Вопросов: {len(records)}, ошибок: {errors}, "
+        f"p50 {percentile(0.5):.2f} с, p95 {percentile(0.95):.2f} с, "
+        f"{len(records) / elapsed if elapsed else 0.0:.1f} вопросов/с за {elapsed:.1f} с"
+    )
+
+
+async def main_async(args) -> int:
+    if args.input == '-':
+        items = read_items(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            items = read_items(f)
+
+    if args.resume:
+        done = load_checkpoint(args.output)
+        skipped = len(items)
+        items = [item for item in items if item['id'] not in done]
+        logger.info("Продолжение: %s вопросов уже с ответом", skipped - len(items))
+
+    if args.output:
+        out = open(args.output, 'a' if args.resume else 'w', encoding='utf-8')
+    else:
+        out = sys.stdout
+
+    def write(record: dict) -> None:
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        # Сброс после каждой строки: выходной файл - контрольная точка
+        out.flush()
+
+    started = time.monotonic()
+    try:
+        records = await run_batch(items, write, args.concurrency, args.order, args.flow)
+    finally:
+        await langflow_client.close_async_client()
+        if out is not sys.stdout:
+            out.close()
+
+    print(summarize(records, time.monotonic() - started), file=sys.stderr)
+    return 1 if any(record['error'] for record in records) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетный прогон вопросов через поток Langflow')
+    parser.add_argument('input', nargs='?', default='-', help='JSONL с вопросами (- для stdin)')
+    parser.add_argument('-o', '--output', help='Выходной JSONL (по умолчанию stdout)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--order', choices=('input', 'completion'), default='input')
+    parser.add_argument('--flow', help='ID потока вместо пула LANGFLOW_ENDPOINTS')
+    parser.add_argument('--resume', action='store_true', help='Пропустить вопросы, уже получившие ответ в --output')
+    args = parser.parse_args()
+
+    if args.resume and not args.output:
+        parser.error('--resume требует --output')
+
+    # stdout может быть занят результатами
+    setup_logging(stream=sys.stderr)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Сравнение webhook на Flask (main.py) и ASGI-сервера (asgi.py) под
+конкурентной нагрузкой.
+
+Для каждого уровня параллельности обе цели получают одинаковый поток update
+через loadgen с локальными Langflow и Bot API. Выводятся пропускная
+способность, задержка ответа webhook (ack) и задержка до ответа в чат.
+
+Запуск: python benchmarks/bench_asgi_vs_flask.py [--concurrency 8,32,128]
+        [--count 1000] [--output results/asgi_vs_flask.json]
+Дополнительные параметры после '--' передаются loadgen, например:
+        python benchmarks/bench_asgi_vs_flask.py -- --langflow-latency fixed:0.2
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import loadgen
+from bench_common import write_json
+
+TARGETS = ('webhook', 'asgi')
+
+
+def run_target(target: str, concurrency: int, count: int, extra: list) -> dict:
+    args = loadgen.parse_args(['--target', target, '--count', str(count),
+                               '--concurrency', str(concurrency)] + extra)
+    return loadgen.run(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flask против ASGI под конкурентной нагрузкой')
+    parser.add_argument('--concurrency', default='8,32,128')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--output', help='куда сохранить результаты (JSON)')
+    parser.add_argument('loadgen_args', nargs=argparse.REMAINDER, help='параметры loadgen после --')
+    args = parser.parse_args()
+    extra = [arg for arg in args.loadgen_args if arg != '--']
+
+    print(f"{'парал.':>6} {'цель':>8} {'update/s':>9} {'ack p50, мс':>12} {'ack p99, мс':>12} "
+          f"{'ответ p50, мс':>14} {'ответ p99, мс':>14} {'ошибки':>7}")
+    results = []
+    for concurrency in (int(value) for value in args.concurrency.split(',')):
+        for target in TARGETS:
+            result = run_target(target, concurrency, args.count, extra)
+            results.append(result)
+            ack, latency = result['ack_latency_seconds'], result['latency_seconds']
+            print(f"{concurrency:>6} {target:>8} {result['throughput_per_second']:>9.1f} "
+                  f"{ack['p50'] * 1e3:>12.1f} {ack['p99'] * 1e3:>12.1f} "
+                  f"{latency['p50'] * 1e3:>14.1f} {latency['p99'] * 1e3:>14.1f} "
+                  f"{result['send_errors'] + result['timed_out']:>7}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        write_json(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Общие функции бенчмарков: распределения задержек, перцентили,
+запуск локальных HTTP-серверов в фоновом потоке.
+"""
+import json
+import math
+import random
+import threading
+from http.server import ThreadingHTTPServer
+
+
+def parse_latency(spec: str):
+    """
+    Разбор распределения задержки.
+
+    Поддерживаемые форматы (секунды):
+      fixed:0.5              - постоянная задержка
+      uniform:0.2,1.5        - равномерное распределение
+      normal:1.0,0.3         - нормальное (среднее, отклонение), не меньше 0
+      lognormal:-0.5,0.6     - логнормальное (mu, sigma)
+      exp:0.8                - экспоненциальное со средним 0.8
+
+    :param spec: Строка распределения
+    :return: Функция без аргументов, возвращающая задержку
+    """
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value.strip()]
+
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(values[0], values[1])
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Перцентиль по отсортированному списку (метод ближайшего ранга).
+
+    :param sorted_values: Отсортированные значения
+    :param q: Квантиль от 0 до 1
+    :return: Значение перцентиля или 0.0 для пустого списка
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(q * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def latency_summary(latencies: list) -> dict:
+    """
+    Сводка по задержкам: p50/p95/p99, среднее, максимум.
+
+    :param latencies: Задержки в секундах
+    :return: Словарь со статистикой
+    """
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else 0.0,
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else 0.0,
+    }
+
+
+def start_server(handler_class, host: str = '127.0.0.1', port: int = 0, **attrs) -> ThreadingHTTPServer:
+    """
+    Запуск HTTP-сервера в фоновом потоке.
+
+    :param handler_class: Класс обработчика запросов
+    :param host: Адрес
+    :param port: Порт (0 - любой свободный)
+    :param attrs: Атрибуты, которые будут доступны обработчику через self.server
+    :return: Запущенный сервер (адрес в server.server_address)
+    """
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    for name, value in attrs.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def write_json(path: str, data) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
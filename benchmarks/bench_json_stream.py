@@ -0,0 +1,113 @@
+"""
+Бенчмарк извлечения ответа из больших ответов Langflow: полный разбор
+(json.loads + ResponseExtractor) против потокового разбора по выученному
+пути (json_stream.StreamingResponseReader).
+
+Ответ строится как у реального потока: results с ответом, затем артефакты,
+логи, дубли сообщений и метаданные заданного объёма. Сценарий 'first' -
+путь к ответу идёт в начале тела (обычный случай), 'last' - в самом конце
+(худший случай для потокового разбора). Для каждого варианта выводятся
+медиана времени и пиковая память по tracemalloc.
+
+Запуск: python benchmarks/bench_json_stream.py [--sizes 100000,1000000,10000000]
+        [--repeat 5] [--chunk 16384]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_stream import StreamingResponseReader
+from response_extractor import ResponseExtractor
+
+ANSWER = 'Мы работаем ежедневно с 10:00 до 23:00, бронь столиков по телефону. ' * 10
+PATH = ('outputs', 0, 'outputs', 0, 'results', 'message', 'text')
+FLOW_ID = 'bench'
+
+
+def make_payload(size: int, answer_first: bool = True) -> bytes:
+    """
+    Ответ потока примерно заданного размера.
+
+    :param size: Целевой размер тела в байтах
+    :param answer_first: Идёт ли results перед объёмными полями
+    :return: Тело в UTF-8
+    """
+    log_entry = {'message': 'Обработка компонента ' * 5, 'type': 'text', 'level': 'debug', 'ts': 1700000000.5}
+    entry_size = len(json.dumps(log_entry, ensure_ascii=False).encode())
+    count = max(1, size // entry_size // 7)
+
+    results = {'message': {'text': ANSWER, 'sender': 'Machine', 'sender_name': 'AI', 'files': []}}
+    heavy = {
+        'artifacts': {'message': ANSWER, 'raw': [log_entry] * count, 'type': 'object'},
+        'logs': {'ChatOutput': [log_entry] * count},
+        'messages': [{'message': ANSWER, 'sender': 'Machine', 'extra': log_entry}] * count,
+        'component_display_name': 'Chat Output',
+    }
+    output = dict(results=results, **heavy) if answer_first else dict(heavy, results=results)
+    payload = {'session_id': 'bench', 'outputs': [{'inputs': {'input_value': 'вопрос'}, 'outputs': [output]}]}
+    return json.dumps(payload, ensure_ascii=False).encode()
+
+
+def chunked(body: bytes, size: int):
+    return (body[pos:pos + size] for pos in range(0, len(body), size))
+
+
+def full_parse(body: bytes, extractor: ResponseExtractor, chunk: int) -> str:
+    # Тело собирается из фрагментов, как при чтении из сети
+    return extractor.extract(json.loads(b''.join(chunked(body, chunk))), FLOW_ID)
+
+
+def stream_parse(body: bytes, extractor: ResponseExtractor, chunk: int) -> str:
+    reader = StreamingResponseReader(extractor)
+    return extractor.extract(reader.read(chunked(body, chunk), FLOW_ID), FLOW_ID)
+
+
+def measure(fn, body: bytes, extractor: ResponseExtractor, chunk: int, repeat: int):
+    """
+    :return: (медиана времени в секундах, пиковая память в байтах, результат)
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(body, extractor, chunk)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn(body, extractor, chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000,10000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunk', type=int, default=16 * 1024)
+    args = parser.parse_args()
+
+    extractor = ResponseExtractor()
+    # Путь выучивается на первом ответе, как в рабочем процессе
+    extractor.extract(json.loads(make_payload(1000)), FLOW_ID)
+    assert extractor.preferred_path(FLOW_ID) == PATH
+
+    print(f"{'ответ':>6} {'тело, КБ':>10} {'полный, мс':>11} {'поток, мс':>10} "
+          f"{'полный, КБ':>11} {'поток, КБ':>10}")
+    for placement in ('first', 'last'):
+        for size in (int(value) for value in args.sizes.split(',')):
+            body = make_payload(size, answer_first=placement == 'first')
+            full_time, full_peak, full_answer = measure(full_parse, body, extractor, args.chunk, args.repeat)
+            stream_time, stream_peak, stream_answer = measure(stream_parse, body, extractor, args.chunk, args.repeat)
+            assert full_answer == stream_answer
+            print(f"{placement:>6} {len(body) / 1024:>10.0f} {full_time * 1e3:>11.2f} {stream_time * 1e3:>10.2f} "
+                  f"{full_peak / 1024:>11.0f} {stream_peak / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Бенчмарк стоимости логирования одного сообщения в горячем пути.
+
+"До": basicConfig(DEBUG) с синхронной записью и f-строками, как раньше
+логировали run_flow и handle_message (полные заголовки, тело ответа и ответ).
+"После": log_setup.setup_logging() - очередь, ленивое форматирование,
+выборка и усечение объёмных записей.
+
+Запуск: python benchmarks/bench_logging.py [--messages N] [--body-size BYTES]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_setup
+from log_setup import truncate
+
+
+def make_payload(size: int) -> tuple:
+    answer = ('Наше меню включает блюда русской и европейской кухни. ' * (size // 55 + 1))[:size]
+    body = json.dumps({'outputs': [{'outputs': [{'results': {'message': {'text': answer}}}]}]}, ensure_ascii=False)
+    headers = {'content-type': 'application/json', 'content-length': str(len(body)), 'server': 'bench'}
+    return answer, body, headers
+
+
+def log_message_before(logger, message, answer, body, headers):
+    logger.debug(f"API URL: https://example/lf/id/api/v1/run/flow")
+    logger.debug(f"Message: {message}")
+    logger.debug(f"Response Status Code: {200}")
+    logger.debug(f"Response Headers: {headers}")
+    logger.debug(f"Response Content: {body}")
+    logger.info(f"Получен ответ: {answer}")
+    logger.info(f"Получено сообщение от Иван (ID: 12345): '{message}'")
+    logger.info(f"Сгенерирован ответ: {answer}")
+
+
+def log_message_after(logger, message, answer, body, headers):
+    logger.debug("API URL: %s, message: %s", "https://example/lf/id/api/v1/run/flow", truncate(message))
+    logger.debug("Response Status Code: %s", 200)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response Headers: %s", headers, extra={'verbose': True})
+        logger.debug("Response Content: %s", truncate(body), extra={'verbose': True})
+    logger.info("Получен ответ: %s", truncate(answer))
+    logger.info("Получено сообщение от %s (ID: %s): '%s'", "Иван", 12345, truncate(message))
+    logger.info("Сгенерирован ответ: %s", truncate(answer))
+
+
+def run(log_fn, logger, messages, payload) -> float:
+    answer, body, headers = payload
+    started = time.perf_counter()
+    for i in range(messages):
+        log_fn(logger, f"Что у вас в меню? #{i}", answer, body, headers)
+    return (time.perf_counter() - started) / messages
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--body-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    payload = make_payload(args.body_size)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reset_root()
+        with open(os.path.join(tmp, 'before.log'), 'w', encoding='utf-8') as out:
+            logging.basicConfig(
+                format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                level=logging.DEBUG,
+                stream=out,
+            )
+            results['before'] = run(log_message_before, logging.getLogger('bench'), args.messages, payload)
+            reset_root()
+
+        with open(os.path.join(tmp, 'after.log'), 'w', encoding='utf-8') as out:
+            log_setup.setup_logging(stream=out)
+            results['after'] = run(log_message_after, logging.getLogger('bench'), args.messages, payload)
+            log_setup.shutdown_logging()
+
+    for name, per_message in results.items():
+        print(f"{name:>6}: {per_message * 1e6:10.1f} мкс на сообщение")
+    print(f"ускорение: x{results['before'] / results['after']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
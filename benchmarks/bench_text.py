@@ -0,0 +1,101 @@
+"""
+Бенчмарк постобработки длинных ответов: очистка пробелов и разбиение на сообщения.
+
+"До": clean_text из двух проходов (regex + split/join по строкам) и разбиение
+с копированием остатка строки на каждой итерации, как было в send_long_message.
+"Два прохода": clean_text, затем split_message по индексам с выбором границ.
+"После": путь бота (handle_message) - text_processing.prepare_message, очистка
+и разбиение за один проход по строкам; отдельно - потоковый ответ:
+StreamSplitter и clean_text каждой части, как в StreamingReply.
+
+Запуск: python benchmarks/bench_text.py [--sizes 10000,30000,100000] [--limit N] [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_processing import MAX_MESSAGE_LENGTH, StreamSplitter, clean_text, prepare_message, split_message
+
+# Текст с двойными пробелами и пробелами по краям строк (нужна очистка)
+PARAGRAPH = (
+    'Наше меню включает блюда русской и европейской кухни.  Завтраки подаются до полудня,  '
+    'а сезонные десерты меняются каждый месяц!  \n'
+    '  Для гостей с детьми есть отдельное меню и игровая комната.\n\n'
+)
+
+# Уже чистый текст - типичный ответ модели
+CLEAN_PARAGRAPH = (
+    'Наше меню включает блюда русской и европейской кухни. Завтраки подаются до полудня, '
+    'а сезонные десерты меняются каждый месяц!\n'
+    'Для гостей с детьми есть отдельное меню и игровая комната.\n\n'
+)
+
+
+def make_text(size: int, paragraph: str = PARAGRAPH) -> str:
+    return (paragraph * (size // len(paragraph) + 1))[:size]
+
+
+def prepare_before(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list:
+    text = re.sub(r'([.,?!…])  +', r'\1 ', text)
+    text = '\n'.join(line.strip() for line in text.split('\n'))
+
+    parts = []
+    while text:
+        parts.append(text[:limit])
+        text = text[limit:]
+    return parts
+
+
+def prepare_two_pass(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list:
+    return split_message(clean_text(text), limit)
+
+
+def prepare_stream(text: str, limit: int = MAX_MESSAGE_LENGTH, chunk_size: int = 16) -> list:
+    splitter = StreamSplitter(limit)
+    parts = []
+    for pos in range(0, len(text), chunk_size):
+        parts.extend(clean_text(part) for part in splitter.feed(text[pos:pos + chunk_size]))
+    rest = splitter.finish()
+    if rest:
+        parts.append(clean_text(rest))
+    return parts
+
+
+def measure(fn, text: str, limit: int, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text, limit)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,30000,100000')
+    parser.add_argument('--limit', type=int, default=MAX_MESSAGE_LENGTH)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'текст':>8} {'символов':>10} {'до, мс':>10} {'2 прохода, мс':>14} {'после, мс':>10} "
+          f"{'поток, мс':>10} {'частей до/после':>16}")
+    for kind, paragraph in (('грязный', PARAGRAPH), ('чистый', CLEAN_PARAGRAPH)):
+        for size in (int(value) for value in args.sizes.split(',')):
+            text = make_text(size, paragraph)
+            before = measure(prepare_before, text, args.limit, args.repeat)
+            two_pass = measure(prepare_two_pass, text, args.limit, args.repeat)
+            after = measure(prepare_message, text, args.limit, args.repeat)
+            stream = measure(prepare_stream, text, args.limit, args.repeat)
+            counts = f"{len(prepare_before(text, args.limit))}/{len(prepare_message(text, args.limit))}"
+            # Один проход должен давать те же части, что и два
+            assert prepare_message(text, args.limit) == prepare_two_pass(text, args.limit)
+            print(f"{kind:>8} {size:>10} {before * 1e3:>10.2f} {two_pass * 1e3:>14.2f} {after * 1e3:>10.2f} "
+                  f"{stream * 1e3:>10.2f} {counts:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Локальная замена endpoint'а Langflow /lf/<id>/api/v1/run/<flow> для нагрузочных тестов.
+
+Задержка, форма ответа, размер ответа и доля ошибок настраиваются.
+Поддерживается потоковый режим (?stream=true) с NDJSON-событиями token/end.
+
+Запуск: python benchmarks/fake_langflow.py --port 7860 --latency lognormal:-0.7,0.5
+Бот направляется на сервер переменной LANGFLOW_BASE_URL=http://127.0.0.1:7860
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_common import parse_latency, server_url, start_server
+
+RUN_PATH_RE = re.compile(r'^/lf/[^/]+/api/v1/run/[^/]+$')
+
+FILLER = 'Наше меню включает блюда русской и европейской кухни, завтраки до полудня и сезонные десерты. '
+
+
+def make_answer(message: str, size: int) -> str:
+    answer = f"Ответ на вопрос «{message}». "
+    if len(answer) < size:
+        answer += (FILLER * (size // len(FILLER) + 1))[:size - len(answer)]
+    return answer
+
+
+def shape_chat(text: str, message: str) -> dict:
+    return {
+        'session_id': 'bench',
+        'outputs': [{
+            'inputs': {'input_value': message},
+            'outputs': [{'results': {'message': {'text': text, 'sender': 'Machine'}}}],
+        }],
+    }
+
+
+def shape_messages(text: str, message: str) -> dict:
+    return {'messages': [{'message': text, 'sender': 'Machine'}]}
+
+
+def shape_artifacts(text: str, message: str) -> dict:
+    """Ответ с объёмными артефактами и логами, которые многократно больше самого текста"""
+    noise = [{'log': FILLER * 20, 'index': i} for i in range(50)]
+    return {
+        'session_id': 'bench',
+        'outputs': [{
+            'inputs': {'input_value': message},
+            'outputs': [{
+                'results': {'message': {'text': text, 'sender': 'Machine'}},
+                'artifacts': {'message': text, 'raw': noise},
+                'logs': {'ChatOutput': noise},
+                'messages': [{'message': text}] * 5,
+            }],
+        }],
+    }
+
+
+def shape_unknown(text: str, message: str) -> dict:
+    return {'result': {'payload': [{'meta': {'n': 1}}, {'content_block': text}]}}
+
+
+SHAPES = {
+    'chat': shape_chat,
+    'messages': shape_messages,
+    'artifacts': shape_artifacts,
+    'unknown': shape_unknown,
+}
+
+
+class FakeLangflowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        config = self.server.config
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if not RUN_PATH_RE.match(parts.path):
+            return self._send_json(404, {'detail': 'Not Found'})
+
+        try:
+            message = json.loads(body or b'{}').get('input_value', '')
+        except json.JSONDecodeError:
+            return self._send_json(422, {'detail': 'Invalid JSON'})
+
+        self.server.stats['requests'] += 1
+        delay = config['latency']()
+
+        if random.random() < config['error_rate']:
+            self.server.stats['errors'] += 1
+            time.sleep(delay)
+            return self._send_json(500, {'detail': 'Internal Server Error'})
+
+        answer = make_answer(message, config['answer_size'])
+        if parse_qs(parts.query).get('stream') == ['true']:
+            return self._stream(answer, message, delay)
+
+        time.sleep(delay)
+        self._send_json(200, SHAPES[config['shape']](answer, message))
+
+    def _stream(self, answer: str, message: str, delay: float):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        tokens = re.findall(r'\S+\s*', answer) or [answer]
+        # Первый токен приходит через долю общей задержки, остальные равномерно
+        time.sleep(delay * self.server.config['ttft_fraction'])
+        per_token = delay * (1 - self.server.config['ttft_fraction']) / len(tokens)
+
+        for token in tokens:
+            self._write_event('token', {'chunk': token})
+            time.sleep(per_token)
+        self._write_event('end', {'result': SHAPES['chat'](answer, message)})
+
+    def _write_event(self, event: str, data: dict):
+        line = json.dumps({'event': event, 'data': data}, ensure_ascii=False) + '\n\n'
+        self.wfile.write(line.encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data: dict):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_config(latency: str = 'fixed:0.05',
+                shape: str = 'chat',
+                error_rate: float = 0.0,
+                answer_size: int = 300,
+                ttft_fraction: float = 0.1) -> dict:
+    """
+    Конфигурация поддельного Langflow.
+
+    :param latency: Распределение задержки (см. bench_common.parse_latency)
+    :param shape: Форма ответа: chat, messages, artifacts, unknown
+    :param error_rate: Доля ответов 500
+    :param answer_size: Длина текста ответа
+    :param ttft_fraction: Доля задержки до первого токена в потоковом режиме
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Неизвестная форма ответа: {shape}")
+    return {
+        'latency': parse_latency(latency),
+        'latency_spec': latency,
+        'shape': shape,
+        'error_rate': error_rate,
+        'answer_size': answer_size,
+        'ttft_fraction': ttft_fraction,
+    }
+
+
+def start(host: str = '127.0.0.1', port: int = 0, **config):
+    """
+    Запуск поддельного Langflow в фоновом потоке.
+
+    :return: Сервер; статистика запросов в server.stats
+    """
+    return start_server(
+        FakeLangflowHandler, host, port,
+        config=make_config(**config),
+        stats={'requests': 0, 'errors': 0},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поддельный Langflow для нагрузочных тестов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7860)
+    parser.add_argument('--latency', default='fixed:0.05')
+    parser.add_argument('--shape', default='chat', choices=sorted(SHAPES))
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--answer-size', type=int, default=300)
+    args = parser.parse_args()
+
+    server = start(args.host, args.port, latency=args.latency, shape=args.shape,
+                   error_rate=args.error_rate, answer_size=args.answer_size)
+    print(f"Fake Langflow: {server_url(server)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
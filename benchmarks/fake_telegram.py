@@ -0,0 +1,211 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Отвечает на методы, которые использует бот (getMe, sendMessage, editMessageText,
+sendChatAction, getUpdates, setWebhook, ...), и записывает время каждого
+исходящего сообщения. Служебные маршруты:
+  POST /_bench/updates  - поставить update в очередь для getUpdates (polling)
+  GET  /_bench/replies  - записанные исходящие сообщения
+  POST /_bench/reset    - очистить очередь и записи
+
+Запуск: python benchmarks/fake_telegram.py --port 8081
+Бот направляется на сервер переменной TELEGRAM_API_BASE_URL=http://127.0.0.1:8081
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_common import parse_latency, server_url, start_server
+
+METHOD_PATH_RE = re.compile(r'^/bot[^/]+/(\w+)$')
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+# Методы, отправляющие сообщение пользователю
+REPLY_METHODS = frozenset({'sendMessage', 'editMessageText'})
+
+
+class FakeTelegramState:
+    """Очередь входящих update и журнал исходящих сообщений"""
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.updates = []
+        self.replies = []
+        self.next_message_id = 1
+        self.calls = {}
+
+    def push_updates(self, updates: list) -> None:
+        with self.lock:
+            self.updates.extend(updates)
+            self.lock.notify_all()
+
+    def take_updates(self, offset: int, limit: int, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            # Подтверждённые update (id < offset) удаляются, как в настоящем API
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.lock.wait(remaining)
+            return self.updates[:limit]
+
+    def record(self, method: str, params: dict) -> dict:
+        now = time.time()
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            message_id = params.get('message_id')
+            if method == 'sendMessage':
+                message_id = self.next_message_id
+                self.next_message_id += 1
+            if method in REPLY_METHODS:
+                self.replies.append({
+                    'time': now,
+                    'method': method,
+                    'chat_id': params.get('chat_id'),
+                    'message_id': message_id,
+                    'text': params.get('text', ''),
+                })
+        return {
+            'message_id': message_id or 0,
+            'date': int(now),
+            'chat': {'id': params.get('chat_id'), 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.updates = []
+            self.replies = []
+            self.calls = {}
+
+
+def _decode_value(value: str):
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        return value
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        parts = urlsplit(self.path)
+        state = self.server.state
+        params = self._read_params(parts.query)
+
+        if parts.path == '/_bench/updates':
+            state.push_updates(params if isinstance(params, list) else params.get('updates', []))
+            return self._send_json({'ok': True})
+        if parts.path == '/_bench/replies':
+            with state.lock:
+                return self._send_json({'replies': list(state.replies), 'calls': dict(state.calls)})
+        if parts.path == '/_bench/reset':
+            state.reset()
+            return self._send_json({'ok': True})
+
+        match = METHOD_PATH_RE.match(parts.path)
+        if not match:
+            return self._send_json({'ok': False, 'error_code': 404, 'description': 'Not Found'}, 404)
+
+        method = match.group(1)
+        if method != 'getUpdates':
+            time.sleep(self.server.latency())
+        self._send_json({'ok': True, 'result': self._call(method, params)})
+
+    def _call(self, method: str, params: dict):
+        state = self.server.state
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return state.take_updates(
+                int(params.get('offset') or 0),
+                int(params.get('limit') or 100),
+                float(params.get('timeout') or 0),
+            )
+        if method in REPLY_METHODS:
+            return state.record(method, params)
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        state.record(method, params)
+        return True
+
+    def _read_params(self, query: str):
+        params = {key: _decode_value(value) for key, value in parse_qsl(query)}
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return params
+
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            data = json.loads(body or b'{}')
+            if isinstance(data, list):
+                return data
+            params.update(data)
+        elif content_type.startswith('application/x-www-form-urlencoded'):
+            params.update({key: _decode_value(value) for key, value in parse_qsl(body.decode('utf-8'))})
+        return params
+
+    def _send_json(self, data, status: int = 200):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start(host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0'):
+    """
+    Запуск поддельного Bot API в фоновом потоке.
+
+    :param latency: Распределение задержки ответа на вызовы методов
+    :return: Сервер; журнал сообщений в server.state
+    """
+    return start_server(
+        FakeTelegramHandler, host, port,
+        state=FakeTelegramState(),
+        latency=parse_latency(latency),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поддельный Telegram Bot API для нагрузочных тестов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', default='fixed:0')
+    args = parser.parse_args()
+
+    server = start(args.host, args.port, args.latency)
+    print(f"Fake Telegram Bot API: {server_url(server)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Отчёт о времени импорта на холодном старте serverless-входа.
+
+Каждый сценарий запускается в отдельном процессе с `python -X importtime`;
+из нескольких запусков берётся медиана по каждому модулю. Отчёт показывает
+самые дорогие модули (собственное и накопленное время) и итог по пакетам
+верхнего уровня. Для CI: --budget-ms задаёт предел суммарного времени
+импорта, --forbid - пакеты, которые не должны загружаться в сценарии;
+при нарушении код выхода 1.
+
+Сценарии:
+  index       - загрузка index.py (холодный старт Vercel)
+  fast-path   - загрузка index.py и обработка /start
+  application - построение Application со всеми хендлерами (нужен telegram)
+
+Запуск: python benchmarks/import_time.py [--scenario fast-path] [--runs 5]
+        [--budget-ms 50] [--forbid telegram,httpx,langflow_client]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bench_common import write_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+START_UPDATE = (
+    '{"update_id": 1, "message": {"message_id": 1, "date": 0, '
+    '"chat": {"id": 1, "type": "private"}, "text": "/start", '
+    '"entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}'
+)
+
+SCENARIOS = {
+    'index': 'import index',
+    'fast-path': f"import index; index.handler({{'body': {START_UPDATE!r}}}, None)",
+    'application': "import app_lifecycle; app_lifecycle.build_application('123456:BENCH-TOKEN')",
+}
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(output: str) -> dict:
+    """
+    Разбор вывода -X importtime.
+
+    :param output: stderr процесса
+    :return: {модуль: {'self': мкс, 'cumulative': мкс, 'depth': вложенность}}
+    """
+    modules = {}
+    for line in output.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                'self': int(self_us),
+                'cumulative': int(cumulative_us),
+                'depth': len(indent) // 2,
+            }
+    return modules
+
+
+def measure(statement: str) -> dict:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Сценарий завершился с ошибкой:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def median_report(runs: list) -> dict:
+    """
+    Медиана времени каждого модуля по нескольким запускам.
+
+    :param runs: Результаты parse_importtime
+    :return: {модуль: {'self', 'cumulative', 'depth'}}
+    """
+    report = {}
+    for name in set().union(*runs):
+        samples = [run[name] for run in runs if name in run]
+        report[name] = {
+            'self': statistics.median(s['self'] for s in samples),
+            'cumulative': statistics.median(s['cumulative'] for s in samples),
+            'depth': samples[0]['depth'],
+        }
+    return report
+
+
+def by_package(report: dict) -> dict:
+    """Собственное время импорта, просуммированное по пакетам верхнего уровня (мкс)"""
+    totals = {}
+    for name, entry in report.items():
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + entry['self']
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', default='fast-path', choices=sorted(SCENARIOS))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--budget-ms', type=float, help='Предел суммарного времени импорта')
+    parser.add_argument('--forbid', default='', help='Пакеты через запятую, которые не должны импортироваться')
+    parser.add_argument('--output', help='Сохранить отчёт в JSON')
+    args = parser.parse_args()
+
+    # Первый запуск прогревает кэш байткода и не учитывается
+    measure(SCENARIOS[args.scenario])
+    report = median_report([measure(SCENARIOS[args.scenario]) for _ in range(args.runs)])
+
+    total_us = sum(entry['self'] for entry in report.values())
+    packages = by_package(report)
+
+    print(f"Сценарий: {args.scenario}, модулей: {len(report)}, всего: {total_us / 1000:.1f} мс")
+    print(f"\n{'модуль':<40} {'своё, мс':>10} {'накопл., мс':>12}")
+    top = sorted(report.items(), key=lambda item: item[1]['cumulative'], reverse=True)[:args.top]
+    for name, entry in top:
+        print(f"{'  ' * entry['depth'] + name:<40} {entry['self'] / 1000:>10.1f} {entry['cumulative'] / 1000:>12.1f}")
+
+    print(f"\n{'пакет':<40} {'своё, мс':>10}")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<40} {self_us / 1000:>10.1f}")
+
+    if args.output:
+        write_json(args.output, {
+            'scenario': args.scenario,
+            'total_ms': total_us / 1000,
+            'packages_ms': {name: value / 1000 for name, value in packages.items()},
+            'modules': report,
+        })
+
+    failures = []
+    forbidden = [name for name in args.forbid.split(',') if name]
+    loaded = sorted(name for name in forbidden if name in packages)
+    if loaded:
+        failures.append(f"загружены запрещённые пакеты: {', '.join(loaded)}")
+    if args.budget_ms is not None and total_us / 1000 > args.budget_ms:
+        failures.append(f"время импорта {total_us / 1000:.1f} мс превышает бюджет {args.budget_ms:.1f} мс")
+
+    for failure in failures:
+        print(f"ОШИБКА: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
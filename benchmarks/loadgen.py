@@ -0,0 +1,372 @@
+"""
+Генератор нагрузки: прогон синтетических или записанных update через бота
+с локальными заменами Langflow и Telegram Bot API.
+
+Цели (--target):
+  webhook      - Flask-приложение main.py (запускается отдельным процессом)
+  asgi         - ASGI-сервер asgi.py (запускается отдельным процессом)
+  handler      - index.handler (Vercel), вызывается в этом процессе
+  api-handler  - api/webhook.handler (Vercel), вызывается в этом процессе
+  polling      - "bot copy.py" с run_polling (отдельный процесс, update через getUpdates)
+
+Задержка считается от отправки update до первого sendMessage в его чат,
+записанного поддельным Bot API (ответ в теле webhook передаётся ему же,
+как это делает Telegram). Для точного сопоставления по умолчанию
+каждый update идёт в свой чат (--chats 0).
+
+Пример:
+  python benchmarks/loadgen.py --target webhook --count 500 --rate 50 \\
+      --langflow-latency lognormal:-1,0.4 --output results/webhook.json
+  python benchmarks/loadgen.py --target polling --baseline results/webhook.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+
+import fake_langflow
+import fake_telegram
+from bench_common import latency_summary, server_url, write_json
+
+BENCH_TOKEN = '123456:BENCH-TOKEN'
+
+PROMPTS = (
+    'Что у вас в меню?',
+    'Во сколько вы открываетесь?',
+    'Где вы находитесь?',
+    'Есть ли вегетарианские блюда?',
+    'Можно забронировать столик на вечер?',
+    'Сколько стоит бизнес-ланч?',
+)
+
+TARGETS = ('webhook', 'asgi', 'handler', 'api-handler', 'polling')
+# Цели, принимающие update по HTTP
+HTTP_TARGETS = ('webhook', 'asgi')
+
+
+def make_updates(count: int, chats: int, first_update_id: int = 1, recorded: list = None) -> list:
+    """
+    Генерация update. Записанные update переиспользуются по кругу с новыми update_id.
+
+    :param count: Число update
+    :param chats: Число чатов (0 - отдельный чат на каждый update)
+    :param first_update_id: Первый update_id
+    :param recorded: Записанные update (JSON-объекты) или None
+    :return: Список update
+    """
+    updates = []
+    now = int(time.time())
+    for i in range(count):
+        update_id = first_update_id + i
+        if recorded:
+            update = json.loads(json.dumps(recorded[i % len(recorded)]))
+            update['update_id'] = update_id
+            if chats == 0 and 'message' in update:
+                update['message']['chat']['id'] = 10_000_000 + i
+            updates.append(update)
+            continue
+
+        chat_id = 10_000_000 + (i % chats if chats else i)
+        updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': i + 1,
+                'date': now,
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Bench'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+                'text': PROMPTS[i % len(PROMPTS)],
+            },
+        })
+    return updates
+
+
+def load_recorded(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def http_post_json(url: str, data, timeout: float = 30):
+    """
+    :return: Тело ответа как JSON или None, если ответ не JSON
+    """
+    request = urllib.request.Request(
+        url, data=json.dumps(data).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        if not response.headers.get('Content-Type', '').startswith('application/json'):
+            return None
+        return json.loads(body)
+
+
+def wait_http(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Сервер не ответил: {url}")
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Target:
+    """Способ доставки update боту"""
+
+    def __init__(self, kind: str, env: dict, telegram_url: str):
+        self.kind = kind
+        self.env = env
+        self.telegram_url = telegram_url
+        self.process = None
+        self.url = None
+        self.handler = None
+
+    def start(self) -> None:
+        if self.kind in HTTP_TARGETS:
+            port = free_port()
+            script = 'main.py' if self.kind == 'webhook' else 'asgi.py'
+            self.process = subprocess.Popen(
+                [sys.executable, script], cwd=ROOT_DIR, env=dict(self.env, PORT=str(port)),
+            )
+            base = f"http://127.0.0.1:{port}"
+            wait_http(base + '/')
+            self.url = f"{base}/{BENCH_TOKEN}"
+        elif self.kind == 'polling':
+            self.process = subprocess.Popen([sys.executable, 'bot copy.py'], cwd=ROOT_DIR, env=self.env)
+        else:
+            os.environ.update(self.env)
+            sys.path.insert(0, ROOT_DIR)
+            path = 'index.py' if self.kind == 'handler' else os.path.join('api', 'webhook.py')
+            self.handler = load_module(f"bench_{self.kind.replace('-', '_')}", os.path.join(ROOT_DIR, path)).handler
+
+    def send(self, update: dict):
+        """
+        :return: Вызов метода из тела ответа webhook или None
+        """
+        if self.kind in HTTP_TARGETS:
+            reply = http_post_json(self.url, update)
+        elif self.kind == 'polling':
+            http_post_json(f"{self.telegram_url}/_bench/updates", [update])
+            return None
+        else:
+            result = self.handler({'body': json.dumps(update)}, None)
+            if result.get('statusCode') != 200:
+                raise RuntimeError(result.get('body'))
+            reply = json.loads(result.get('body') or 'null')
+        return reply if isinstance(reply, dict) and 'method' in reply else None
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def match_replies(sent: list, replies: list) -> list:
+    """
+    Сопоставление update с первым ответом в их чат (FIFO внутри чата).
+
+    :param sent: Список (update, время отправки)
+    :param replies: Записанные поддельным Bot API сообщения
+    :return: Задержки для update, получивших ответ
+    """
+    by_chat = {}
+    for reply in sorted(replies, key=lambda r: r['time']):
+        if reply['method'] == 'sendMessage':
+            by_chat.setdefault(reply['chat_id'], []).append(reply['time'])
+
+    latencies = []
+    for update, sent_at in sorted(sent, key=lambda item: item[1]):
+        chat_id = update.get('message', {}).get('chat', {}).get('id')
+        chat_replies = by_chat.get(chat_id, [])
+        while chat_replies and chat_replies[0] < sent_at:
+            chat_replies.pop(0)
+        if chat_replies:
+            latencies.append(chat_replies.pop(0) - sent_at)
+    return latencies
+
+
+def run(args) -> dict:
+    langflow = fake_langflow.start(
+        latency=args.langflow_latency, shape=args.langflow_shape,
+        error_rate=args.langflow_error_rate, answer_size=args.answer_size,
+    )
+    telegram = fake_telegram.start(latency=args.telegram_latency)
+    telegram_url = server_url(telegram)
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=BENCH_TOKEN,
+        TELEGRAM_API_BASE_URL=telegram_url,
+        LANGFLOW_BASE_URL=server_url(langflow),
+        LOG_LEVEL=args.log_level,
+    )
+    recorded = load_recorded(args.updates) if args.updates else None
+    updates = make_updates(args.count, args.chats, recorded=recorded)
+
+    target = Target(args.target, env, telegram_url)
+    target.start()
+
+    sent, ack_latencies, errors = [], [], []
+    sent_lock = threading.Lock()
+
+    def send(update):
+        started_wall, started = time.time(), time.perf_counter()
+        try:
+            reply = target.send(update)
+        except Exception as e:
+            errors.append(repr(e))
+            return
+        if reply is not None:
+            # Telegram выполняет метод из тела ответа webhook сам
+            telegram.state.record(reply['method'], reply)
+        ack_latencies.append(time.perf_counter() - started)
+        with sent_lock:
+            sent.append((update, started_wall))
+
+    try:
+        if args.target == 'polling':
+            time.sleep(args.warmup)
+
+        started = time.time()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for i, update in enumerate(updates):
+                if args.rate:
+                    delay = started + i / args.rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                pool.submit(send, update)
+
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            if sum(1 for r in telegram.state.replies if r['method'] == 'sendMessage') >= len(sent):
+                break
+            time.sleep(0.05)
+    finally:
+        target.stop()
+
+    with telegram.state.lock:
+        replies = list(telegram.state.replies)
+        calls = dict(telegram.state.calls)
+
+    latencies = match_replies(sent, replies)
+    finished = max((r['time'] for r in replies), default=time.time())
+    duration = max(finished - started, 1e-9)
+
+    langflow.shutdown()
+    telegram.shutdown()
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'target': args.target,
+        'config': {
+            'count': args.count,
+            'rate': args.rate,
+            'concurrency': args.concurrency,
+            'chats': args.chats,
+            'langflow_latency': args.langflow_latency,
+            'langflow_shape': args.langflow_shape,
+            'langflow_error_rate': args.langflow_error_rate,
+            'telegram_latency': args.telegram_latency,
+            'answer_size': args.answer_size,
+            'recorded_updates': args.updates,
+        },
+        'sent': len(sent),
+        'send_errors': len(errors),
+        'completed': len(latencies),
+        'timed_out': len(sent) - len(latencies),
+        'duration_seconds': duration,
+        'throughput_per_second': len(latencies) / duration,
+        'latency_seconds': latency_summary(latencies),
+        'ack_latency_seconds': latency_summary(ack_latencies),
+        'langflow': dict(langflow.stats),
+        'telegram_calls': calls,
+    }
+
+
+def print_report(result: dict, baseline: dict = None) -> None:
+    latency = result['latency_seconds']
+    print(f"target: {result['target']}  sent: {result['sent']}  completed: {result['completed']}  "
+          f"timed out: {result['timed_out']}  send errors: {result['send_errors']}")
+    print(f"throughput: {result['throughput_per_second']:.1f} update/s")
+    print(f"latency p50/p95/p99: {latency['p50'] * 1000:.1f} / {latency['p95'] * 1000:.1f} / "
+          f"{latency['p99'] * 1000:.1f} ms")
+
+    if baseline:
+        print(f"vs baseline ({baseline['target']}, {baseline['timestamp']}):")
+        for key, new, old in (
+            ('throughput', result['throughput_per_second'], baseline['throughput_per_second']),
+            ('p50', latency['p50'], baseline['latency_seconds']['p50']),
+            ('p95', latency['p95'], baseline['latency_seconds']['p95']),
+            ('p99', latency['p99'], baseline['latency_seconds']['p99']),
+        ):
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {key:>10}: {old:.4f} -> {new:.4f} ({change:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота с локальными Langflow и Bot API')
+    parser.add_argument('--target', choices=TARGETS, default='webhook')
+    parser.add_argument('--count', type=int, default=200, help='число update')
+    parser.add_argument('--rate', type=float, default=0, help='update в секунду (0 - без ограничения)')
+    parser.add_argument('--concurrency', type=int, default=16, help='одновременных отправителей')
+    parser.add_argument('--chats', type=int, default=0, help='число чатов (0 - чат на каждый update)')
+    parser.add_argument('--updates', help='JSONL с записанными update')
+    parser.add_argument('--langflow-latency', default='lognormal:-1.5,0.5')
+    parser.add_argument('--langflow-shape', default='chat', choices=sorted(fake_langflow.SHAPES))
+    parser.add_argument('--langflow-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', default='fixed:0.005')
+    parser.add_argument('--answer-size', type=int, default=300)
+    parser.add_argument('--timeout', type=float, default=60, help='ожидание ответов после отправки')
+    parser.add_argument('--warmup', type=float, default=2, help='пауза на запуск polling-бота')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help='куда сохранить результат (JSON)')
+    parser.add_argument('--baseline', help='результат предыдущего прогона для сравнения')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    result = run(args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        write_json(args.output, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,21 @@ from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from dotenv import load_dotenv
 import os
-import re
+from typing import List
 
-from langflow_client import get_langflow_response
+from langflow_client import get_langflow_response_async, stream_langflow_response, close_async_client
+from telegram_stream import StreamingReply
+from text_processing import clean_text, prepare_message
+from telegram_sender import OutboundSender, PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NORMAL
+from update_scheduler import ChatUpdateProcessor
+from burst_aggregator import message_text as burst_text
+from resilience import deadline_scope
+from log_setup import setup_logging, truncate
+import metrics
+import tracing
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
-    level=logging.INFO
-)
+# Настройка неблокирующего логирования
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Загрузка переменных окружения
@@ -19,6 +25,32 @@ load_dotenv()
 
 # Токен бота из переменных окружения
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Адрес Bot API (переопределяется для локальных тестов и бенчмарков)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
+
+# Потоковые ответы: текст появляется в чате по мере генерации
+STREAMING_ENABLED = os.getenv('LANGFLOW_STREAMING', '').lower() in ('1', 'true', 'yes')
+
+# Бюджет времени на ответ одному сообщению; передаётся до HTTP-вызовов Langflow
+MESSAGE_DEADLINE = float(os.getenv('MESSAGE_DEADLINE', '90'))
+
+# Исходящая очередь с учётом лимитов Telegram
+sender = OutboundSender()
+metrics.register_collector('tbot_outbound_sender', sender.stats)
+
+async def reply(update: Update, text: str, priority: int = PRIORITY_INTERACTIVE):
+    """
+    Ответ на сообщение через исходящую очередь.
+    
+    :param update: Входящий update
+    :param text: Текст ответа
+    :param priority: Приоритет отправки
+    """
+    return await sender.send(
+        update.effective_chat.id,
+        lambda: update.message.reply_text(text),
+        priority,
+    )
 
 async def start_command(update: Update, context):
     """Обработчик команды /start"""
@@ -31,7 +63,7 @@ async def start_command(update: Update, context):
         "- Предоставлю подробную информацию по ресторану\n\n"
         "Просто напишите мне!"
     )
-    await update.message.reply_text(welcome_text)
+    await reply(update, welcome_text)
 
 async def help_command(update: Update, context):
     """Обработчик команды /help"""
@@ -41,40 +73,45 @@ async def help_command(update: Update, context):
         "/help - Показать справку\n\n"
         "Просто напишите мне сообщение, и я постараюсь помочь!"
     )
-    await update.message.reply_text(help_text)
+    await reply(update, help_text)
 
-async def send_long_message(update: Update, response: str):
-    """Отправка длинных сообщений с разбиением"""
-    MAX_MESSAGE_LENGTH = 4096
+async def send_long_message(update: Update, parts: List[str]):
+    """Отправка ответа, разбитого prepare_message по абзацам, предложениям и словам"""
+    
+    # Короткий ответ отправляется вне очереди частей длинных ответов
+    priority = PRIORITY_INTERACTIVE if len(parts) == 1 else PRIORITY_NORMAL
     
-    while response:
-        # Отправляем первые MAX_MESSAGE_LENGTH символов
-        current_message = response[:MAX_MESSAGE_LENGTH]
-        await update.message.reply_text(current_message)
-        response = response[MAX_MESSAGE_LENGTH:]
+    with tracing.span('send_long_message', parts=len(parts)):
+        for part in parts:
+            await reply(update, part, priority)
+            priority = PRIORITY_BULK
 
-def clean_text(text: str) -> str:
+async def close_langflow_client(application: Application):
+    """Закрытие пула соединений Langflow при остановке бота"""
+    await close_async_client()
+
+async def stream_answer(update: Update, message_text: str) -> str:
     """
-    Очищает текст от лишних пробелов после точек и запятых.
+    Потоковый ответ: первое сообщение отправляется с первым фрагментом,
+    затем дописывается редактированием.
     
-    :param text: Исходный текст
-    :return: Очищенный текст
+    :param update: Входящий update
+    :param message_text: Текст сообщения пользователя
+    :return: Полный отправленный ответ
     """
-    # Удаляем двойные пробелы после точек и запятых
-    text = re.sub(r'([.,?!…])  +', r'\1 ', text)
-    
-    # Дополнительно удаляем пробелы в начале и конце строк
-    text = '\n'.join(line.strip() for line in text.split('\n'))
-    
-    return text
+    streaming = StreamingReply(update.message, transform=clean_text, sender=sender)
+    async for chunk in stream_langflow_response(message_text, update.effective_chat.id):
+        await streaming.append(chunk)
+    return await streaming.finish()
 
 async def handle_message(update: Update, context):
     """Обработка всех входящих сообщений"""
     try:
         # Логируем входящее сообщение
         user = update.effective_user
-        message_text = update.message.text
-        logger.info(f"Получено сообщение от {user.first_name} (ID: {user.id}): '{message_text}'")
+        # Серия быстрых сообщений приходит одним текстом (BURST_WINDOW)
+        message_text = burst_text(update)
+        logger.info("Получено сообщение от %s (ID: %s): '%s'", user.first_name, user.id, truncate(message_text))
         
         # Показываем индикатор набора текста
         await context.bot.send_chat_action(
@@ -82,26 +119,36 @@ async def handle_message(update: Update, context):
             action='typing'
         )
         
+        if STREAMING_ENABLED:
+            with deadline_scope(MESSAGE_DEADLINE):
+                response = await stream_answer(update, message_text)
+            logger.info("Отправлен потоковый ответ: %s", truncate(response))
+            return
+        
         # Получаем ответ от Langflow
-        response = get_langflow_response(message_text)
+        with deadline_scope(MESSAGE_DEADLINE):
+            response = await get_langflow_response_async(message_text, update.effective_chat.id)
         
-        # Очищаем текст от лишних пробелов
-        response = clean_text(response)
+        # Очищаем текст от лишних пробелов и разбиваем на сообщения за один проход
+        with metrics.stage_timer('prepare_message'):
+            parts = prepare_message(response)
         
         # Логируем полученный ответ
-        logger.info(f"Сгенерирован ответ: {response}")
+        logger.info("Сгенерирован ответ: %s", truncate(response))
         
         # Отправляем ответ с обработкой длинных сообщений
-        await send_long_message(update, response)
+        await send_long_message(update, parts)
     
     except Exception as e:
+        metrics.record_error(e)
+        tracing.mark_failed(e)
         error_message = f"Произошла ошибка: {str(e)}"
         logger.exception(error_message)
         
         try:
-            await update.message.reply_text(error_message)
+            await reply(update, error_message)
         except Exception as reply_error:
-            logger.error(f"Не удалось отправить сообщение об ошибке: {reply_error}")
+            logger.error("Не удалось отправить сообщение об ошибке: %s", reply_error)
 
 def main():
     """Основная функция запуска бота"""
@@ -111,7 +158,14 @@ def main():
         return
     
     # Создаем приложение
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(f'{TELEGRAM_API_BASE_URL}/bot')
+        .concurrent_updates(ChatUpdateProcessor(sender=sender))
+        .post_shutdown(close_langflow_client)
+        .build()
+    )
     
     # Регистрируем обработчики
     application.add_handler(CommandHandler('start', start_command))
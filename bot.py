@@ -1,36 +1,43 @@
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from typing import TYPE_CHECKING
 import os
 import logging
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
-    level=logging.INFO
-)
+from burst_aggregator import message_text
+from fast_path import HELP_TEXT, START_TEXT
+from log_setup import setup_logging
+
+# telegram нужен только для запуска; хендлеры импортируются без него
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import Application
 
 # Токен и webhook
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 VERCEL_WEBHOOK_URL = 'https://tbot-snowy.vercel.app/api/webhook'
 
-async def setup_webhook(application: Application):
+async def setup_webhook(application: 'Application'):
     try:
         await application.bot.set_webhook(url=VERCEL_WEBHOOK_URL)
-        logging.info(f"Webhook установлен на {VERCEL_WEBHOOK_URL}")
+        logging.info("Webhook установлен на %s", VERCEL_WEBHOOK_URL)
     except Exception as e:
-        logging.error(f"Ошибка установки webhook: {e}")
+        logging.error("Ошибка установки webhook: %s", e)
 
-async def start_command(update: Update, context):
-    await update.message.reply_text('Привет! Я бот.')
+async def start_command(update: 'Update', context):
+    await update.message.reply_text(START_TEXT)
 
-async def help_command(update: Update, context):
-    await update.message.reply_text('Чем могу помочь?')
+async def help_command(update: 'Update', context):
+    await update.message.reply_text(HELP_TEXT)
 
-async def handle_message(update: Update, context):
-    text = update.message.text
+async def handle_message(update: 'Update', context):
+    text = message_text(update)
     await update.message.reply_text(f'Вы сказали: {text}')
 
 async def main():
+    from telegram.ext import Application, CommandHandler, MessageHandler, filters
+
+    # Настройка неблокирующего логирования
+    setup_logging()
+
     application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
     
     # Установка webhook
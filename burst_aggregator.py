@@ -0,0 +1,255 @@
+"""
+Склейка серии быстрых сообщений одного чата в один вопрос.
+
+Пользователи часто пишут одну мысль несколькими сообщениями подряд.
+Первое текстовое сообщение серии ждёт окно тишины: сообщения, пришедшие
+за это время, присоединяются к нему, а их собственная обработка
+пропускается. Когда окно истекает без новых сообщений (или серия достигла
+предела), хендлер первого сообщения получает склеенный текст через
+message_text() и отвечает один раз.
+
+Окно подстраивается под темп набора каждого чата: после серии из
+нескольких сообщений оно равно сглаженному (EWMA) интервалу между ними
+с запасом BURST_GAP_FACTOR, а после одиночного сообщения сокращается,
+чтобы не задерживать тех, кто пишет одним сообщением.
+
+Склейка выключена по умолчанию (BURST_WINDOW=0): она добавляет задержку
+к каждому ответу.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Начальное окно тишины в секундах (0 - склейка выключена)
+BURST_WINDOW = float(os.getenv('BURST_WINDOW', '0'))
+# Границы адаптивного окна
+BURST_MIN_WINDOW = float(os.getenv('BURST_MIN_WINDOW', '0.3'))
+BURST_MAX_WINDOW = float(os.getenv('BURST_MAX_WINDOW', '3'))
+# Окно = интервал между сообщениями серии * коэффициент
+BURST_GAP_FACTOR = float(os.getenv('BURST_GAP_FACTOR', '1.5'))
+# Множитель окна после одиночного сообщения
+BURST_SHRINK = float(os.getenv('BURST_SHRINK', '0.8'))
+# Предел серии: число сообщений и общее ожидание первого из них
+BURST_MAX_MESSAGES = int(os.getenv('BURST_MAX_MESSAGES', '10'))
+BURST_MAX_DELAY = float(os.getenv('BURST_MAX_DELAY', '8'))
+# Сколько чатов помнить
+BURST_MAX_CHATS = int(os.getenv('BURST_MAX_CHATS', '10000'))
+
+_current = contextvars.ContextVar('burst', default=None)
+
+
+class Burst:
+    """
+    Серия сообщений одного чата, обрабатываемая одним update.
+    """
+
+    __slots__ = ('updates', 'texts', 'started', 'last', 'closed', 'changed')
+
+    def __init__(self, update, text: str, now: float):
+        self.updates = [update]
+        self.texts = [text]
+        self.started = now
+        self.last = now
+        self.closed = False
+        self.changed = asyncio.Event()
+
+    @property
+    def leader(self):
+        """Update, от имени которого отвечает бот"""
+        return self.updates[0]
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.texts)
+
+
+class _ChatState:
+    __slots__ = ('window', 'gap', 'last_message', 'burst')
+
+    def __init__(self, window: float):
+        self.window = window
+        self.gap = None
+        self.last_message = None
+        self.burst = None
+
+
+class BurstAggregator:
+    """
+    Окна склейки сообщений по чатам с адаптацией к темпу набора.
+    """
+
+    def __init__(self,
+                 window: float = BURST_WINDOW,
+                 min_window: float = BURST_MIN_WINDOW,
+                 max_window: float = BURST_MAX_WINDOW,
+                 gap_factor: float = BURST_GAP_FACTOR,
+                 shrink: float = BURST_SHRINK,
+                 max_messages: int = BURST_MAX_MESSAGES,
+                 max_delay: float = BURST_MAX_DELAY,
+                 max_chats: int = BURST_MAX_CHATS,
+                 ewma_alpha: float = 0.3,
+                 clock=time.monotonic):
+        """
+        :param window: Начальное окно тишины в секундах
+        :param min_window: Нижняя граница окна
+        :param max_window: Верхняя граница окна
+        :param gap_factor: Запас окна относительно интервала между сообщениями
+        :param shrink: Множитель окна после одиночного сообщения
+        :param max_messages: Максимум сообщений в серии
+        :param max_delay: Максимальное ожидание первого сообщения серии
+        :param max_chats: Сколько чатов помнить
+        :param ewma_alpha: Вес нового интервала в EWMA
+        :param clock: Источник времени
+        """
+        self.window = window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.gap_factor = gap_factor
+        self.shrink = shrink
+        self.max_messages = max_messages
+        self.max_delay = max_delay
+        self.max_chats = max_chats
+        self.ewma_alpha = ewma_alpha
+        self._clock = clock
+        self._chats = OrderedDict()
+        self._stats = {
+            'bursts': 0,
+            'merged_bursts': 0,
+            'messages': 0,
+            'calls_saved': 0,
+            'wait_seconds_total': 0.0,
+        }
+
+    @staticmethod
+    def accepts(update) -> bool:
+        """
+        Можно ли склеивать update: новое текстовое сообщение, не команда.
+
+        :param update: Объект update
+        """
+        message = getattr(update, 'message', None)
+        text = getattr(message, 'text', None)
+        return bool(text) and not text.startswith('/')
+
+    async def collect(self, chat_id, update) -> Optional[Burst]:
+        """
+        Добавление сообщения в серию чата.
+
+        :param chat_id: ID чата
+        :param update: Update с текстовым сообщением
+        :return: Закрытая серия, если update начал её и должен быть обработан,
+                 или None, если сообщение присоединено к чужой серии
+        """
+        now = self._clock()
+        state = self._chat(chat_id)
+        self._observe_gap(state, now)
+        self._stats['messages'] += 1
+
+        burst = state.burst
+        if burst is not None and not burst.closed:
+            burst.updates.append(update)
+            burst.texts.append(update.message.text)
+            burst.last = now
+            burst.changed.set()
+            self._stats['calls_saved'] += 1
+            return None
+
+        burst = state.burst = Burst(update, update.message.text, now)
+        try:
+            while len(burst.updates) < self.max_messages:
+                deadline = min(burst.last + state.window, burst.started + self.max_delay)
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    break
+                burst.changed.clear()
+                try:
+                    await asyncio.wait_for(burst.changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            burst.closed = True
+            if state.burst is burst:
+                state.burst = None
+
+        self._finish(state, burst)
+        return burst
+
+    def stats(self) -> dict:
+        """
+        Сколько серий склеено и сколько вызовов Langflow это сэкономило.
+
+        :return: Словарь со статистикой
+        """
+        windows = [state.window for state in self._chats.values()]
+        return dict(
+            self._stats,
+            chats=len(self._chats),
+            window_seconds_avg=sum(windows) / len(windows) if windows else self.window,
+        )
+
+    def _chat(self, chat_id) -> _ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState(self.window)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return state
+
+    def _observe_gap(self, state: _ChatState, now: float) -> None:
+        # Учитываются только интервалы, похожие на продолжение мысли
+        if state.last_message is not None:
+            gap = now - state.last_message
+            if gap <= self.max_window:
+                state.gap = gap if state.gap is None else state.gap + self.ewma_alpha * (gap - state.gap)
+        state.last_message = now
+
+    def _finish(self, state: _ChatState, burst: Burst) -> None:
+        self._stats['bursts'] += 1
+        self._stats['wait_seconds_total'] += self._clock() - burst.started
+
+        if len(burst.updates) > 1:
+            self._stats['merged_bursts'] += 1
+            logger.info("Склеено сообщений: %d, сэкономлено вызовов: %d",
+                        len(burst.updates), len(burst.updates) - 1)
+            if state.gap is not None:
+                state.window = state.gap * self.gap_factor
+        else:
+            state.window *= self.shrink
+        state.window = min(self.max_window, max(self.min_window, state.window))
+
+
+@contextmanager
+def processing(burst: Optional[Burst]):
+    """
+    Обработка update-лидера серии: хендлер видит склеенный текст.
+
+    :param burst: Серия или None
+    """
+    token = _current.set(burst)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def message_text(update) -> str:
+    """
+    Текст сообщения для ответа: склеенная серия для её первого update,
+    иначе текст самого сообщения.
+
+    :param update: Объект update
+    :return: Текст
+    """
+    burst = _current.get()
+    if burst is not None and burst.leader is update:
+        return burst.text
+    return update.message.text
@@ -0,0 +1,199 @@
+"""
+Ограниченное хранилище контекста переписки по чатам.
+
+Каждому чату соответствует стабильный session_id Langflow, чтобы поток мог
+хранить память на стороне сервера. Локально хранится компактный кольцевой
+буфер последних реплик в пределах бюджета токенов. Память ограничена:
+неактивные чаты вытесняются по таймауту, общее число реплик - жёстким лимитом.
+"""
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Пространство имён для стабильных session_id
+SESSION_NAMESPACE = uuid.UUID('5d1b8f0e-3c2a-4c8e-9a57-2f0c6d3e7b41')
+
+# Максимальная длина одной реплики в локальном буфере
+MAX_TURN_CHARS = 500
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка числа токенов (около 4 символов на токен).
+
+    :param text: Текст
+    :return: Оценка числа токенов
+    """
+    return len(text) // 4 + 1
+
+
+def compact(text: str, limit: int = MAX_TURN_CHARS) -> str:
+    """
+    Сжатие реплики для хранения: схлопывание пробелов и усечение.
+
+    :param text: Исходный текст
+    :param limit: Максимальная длина
+    :return: Компактный текст
+    """
+    text = _SPACES_RE.sub(' ', text).strip()
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+class _ChatContext:
+    __slots__ = ('turns', 'tokens', 'bytes', 'last_seen')
+
+    def __init__(self, now: float):
+        self.turns = deque()
+        self.tokens = 0
+        self.bytes = 0
+        self.last_seen = now
+
+
+class ChatContextStore:
+    """
+    Потокобезопасное хранилище: session_id и последние реплики для каждого чата.
+    """
+
+    def __init__(self,
+                 max_chats: int = 10000,
+                 max_turns_total: int = 50000,
+                 token_budget: int = 400,
+                 idle_ttl: float = 1800,
+                 clock=time.monotonic):
+        """
+        :param max_chats: Максимальное число чатов с локальным контекстом
+        :param max_turns_total: Жёсткий лимит реплик по всем чатам
+        :param token_budget: Бюджет токенов локального буфера одного чата
+        :param idle_ttl: Через сколько секунд бездействия контекст чата удаляется
+        :param clock: Источник времени
+        """
+        self.max_chats = max_chats
+        self.max_turns_total = max_turns_total
+        self.token_budget = token_budget
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._chats = OrderedDict()
+        self._turns_total = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'evicted_idle': 0, 'evicted_capacity': 0}
+
+    @staticmethod
+    def session_id(chat_id) -> str:
+        """
+        Стабильный session_id Langflow для чата.
+
+        :param chat_id: ID чата
+        :return: Строка UUID
+        """
+        return str(uuid.uuid5(SESSION_NAMESPACE, str(chat_id)))
+
+    def add_turn(self, chat_id, question: str, answer: str) -> None:
+        """
+        Запись пары вопрос-ответ в буфер чата.
+
+        :param chat_id: ID чата
+        :param question: Сообщение пользователя
+        :param answer: Ответ ассистента
+        """
+        now = self._clock()
+        with self._lock:
+            self._evict_idle()
+
+            context = self._chats.get(chat_id)
+            if context is None:
+                context = self._chats[chat_id] = _ChatContext(now)
+            else:
+                self._chats.move_to_end(chat_id)
+            context.last_seen = now
+
+            for role, text in (('user', question), ('assistant', answer)):
+                self._append(context, role, compact(text))
+
+            while len(context.turns) > 2 and context.tokens > self.token_budget:
+                self._pop_oldest(context)
+
+            while self._chats and (len(self._chats) > self.max_chats
+                                   or self._turns_total > self.max_turns_total):
+                self._drop_chat(next(iter(self._chats)))
+                self._stats['evicted_capacity'] += 1
+
+    def history(self, chat_id) -> list:
+        """
+        Последние реплики чата.
+
+        :param chat_id: ID чата
+        :return: Список пар (роль, текст) от старых к новым
+        """
+        with self._lock:
+            self._evict_idle()
+            context = self._chats.get(chat_id)
+            return [(role, text) for role, text, _ in context.turns] if context else []
+
+    def render_history(self, chat_id) -> str:
+        """
+        Компактное текстовое представление истории для передачи в поток.
+
+        :param chat_id: ID чата
+        :return: Строки вида 'user: ...'
+        """
+        return '\n'.join(f"{role}: {text}" for role, text in self.history(chat_id))
+
+    def reset(self, chat_id) -> None:
+        """
+        Удаление контекста чата.
+
+        :param chat_id: ID чата
+        """
+        with self._lock:
+            if chat_id in self._chats:
+                self._drop_chat(chat_id)
+
+    def stats(self) -> dict:
+        """
+        Размер хранилища: число чатов и реплик, оценка занимаемой памяти.
+
+        :return: Словарь со статистикой
+        """
+        with self._lock:
+            return dict(
+                self._stats,
+                chats=len(self._chats),
+                turns=self._turns_total,
+                bytes=self._bytes + sys.getsizeof(self._chats),
+            )
+
+    def _append(self, context: _ChatContext, role: str, text: str) -> None:
+        size = sys.getsizeof(text)
+        context.turns.append((role, text, size))
+        context.tokens += estimate_tokens(text)
+        context.bytes += size
+        self._turns_total += 1
+        self._bytes += size
+
+    def _pop_oldest(self, context: _ChatContext) -> None:
+        _, text, size = context.turns.popleft()
+        context.tokens -= estimate_tokens(text)
+        context.bytes -= size
+        self._turns_total -= 1
+        self._bytes -= size
+
+    def _drop_chat(self, chat_id) -> None:
+        context = self._chats.pop(chat_id)
+        self._turns_total -= len(context.turns)
+        self._bytes -= context.bytes
+
+    def _evict_idle(self) -> None:
+        # Чаты упорядочены по последней активности, неактивные - в начале
+        deadline = self._clock() - self.idle_ttl
+        while self._chats:
+            chat_id, context = next(iter(self._chats.items()))
+            if context.last_seen > deadline:
+                break
+            self._drop_chat(chat_id)
+            self._stats['evicted_idle'] += 1
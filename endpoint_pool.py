@@ -0,0 +1,313 @@
+"""
+Пул равнозначных endpoint'ов Langflow с выбором по задержке и хеджированием.
+
+Запрос направляется на здоровый endpoint с наименьшей сглаженной (EWMA)
+задержкой. Если ответ не пришёл за p95 задержки этого endpoint'а, тот же
+запрос отправляется на следующий по скорости; побеждает первый успешный
+ответ, проигравший запрос отменяется. После нескольких ошибок подряд
+endpoint выводится из ротации на время охлаждения.
+
+Endpoint'ы пула должны обслуживать один и тот же поток (копии с одинаковыми
+входами и выходами): ответ любого из них разбирается и кэшируется как ответ
+основного потока.
+"""
+import asyncio
+import logging
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, List, Optional
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """
+    Поток Langflow на конкретном сервере и статистика его ответов.
+    """
+
+    def __init__(self, base_url: str, langflow_id: str, flow_id: str, window: int = 100):
+        """
+        :param base_url: Адрес сервера Langflow
+        :param langflow_id: ID проекта Langflow
+        :param flow_id: ID или имя потока
+        :param window: Сколько последних задержек хранить для p95
+        """
+        self.base_url = base_url.rstrip('/')
+        self.langflow_id = langflow_id
+        self.flow_id = flow_id
+        self.ewma = None
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.hedge_wins = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.base_url}/{self.flow_id}"
+
+    @property
+    def server(self) -> tuple:
+        """Сервер, на котором хранится память сессий"""
+        return self.base_url, self.langflow_id
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/lf/{self.langflow_id}/api/v1/run/{self.flow_id}"
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Квантиль последних задержек.
+
+        :param q: Квантиль от 0 до 1
+        :return: Задержка в секундах или None без наблюдений
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def parse_endpoints(spec: str, base_url: str, langflow_id: str, flow_id: str) -> List[Endpoint]:
+    """
+    Разбор списка endpoint'ов из переменной окружения.
+
+    Элементы разделяются запятыми; каждый - это ID потока на сервере
+    по умолчанию либо 'base_url|langflow_id|flow_id'. Все элементы должны
+    быть копиями одного потока: пул считает их равнозначными.
+
+    :param spec: Строка конфигурации (пустая - единственный endpoint по умолчанию)
+    :return: Список endpoint'ов
+    """
+    endpoints = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        fields = [field.strip() for field in item.split('|')]
+        if len(fields) == 1:
+            endpoints.append(Endpoint(base_url, langflow_id, fields[0]))
+        elif len(fields) == 3:
+            endpoints.append(Endpoint(*fields))
+        else:
+            raise ValueError(f"Неверный формат endpoint'а Langflow: {item}")
+    return endpoints or [Endpoint(base_url, langflow_id, flow_id)]
+
+
+class EndpointPool:
+    """
+    Выбор endpoint'а по задержке, хеджирование и учёт здоровья.
+    """
+
+    def __init__(self,
+                 endpoints: List[Endpoint],
+                 ewma_alpha: float = 0.2,
+                 hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20,
+                 hedge_min_delay: float = 0.05,
+                 failure_threshold: int = 3,
+                 cooldown: float = 30.0,
+                 failover: Callable[[Exception], bool] = lambda error: False,
+                 clock=time.monotonic):
+        """
+        :param endpoints: Равнозначные endpoint'ы
+        :param ewma_alpha: Вес нового наблюдения в EWMA
+        :param hedge_quantile: Квантиль задержки, после которой отправляется второй запрос
+        :param hedge_min_samples: Сколько наблюдений нужно, чтобы начать хеджировать
+        :param hedge_min_delay: Минимальная задержка перед вторым запросом
+        :param failure_threshold: Ошибок подряд до вывода endpoint'а из ротации
+        :param cooldown: Время вне ротации в секундах
+        :param failover: Признак ошибки, после которой запрос безопасно
+                         отправить на другой endpoint (запрос не дошёл до потока)
+        :param clock: Источник времени
+        """
+        if not endpoints:
+            raise ValueError("Пул endpoint'ов не может быть пустым")
+        self.endpoints = list(endpoints)
+        self.ewma_alpha = ewma_alpha
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failover = failover
+        self._clock = clock
+        self._servers = sorted({endpoint.server for endpoint in self.endpoints})
+        self._stats = {'hedged': 0, 'hedge_wins': 0, 'failovers': 0}
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def select(self, exclude=(), affinity: Hashable = None) -> Endpoint:
+        """
+        Выбор endpoint'а с наименьшей EWMA среди здоровых.
+        Endpoint'ы без наблюдений выбираются первыми, чтобы получить оценку.
+
+        :param exclude: Уже использованные endpoint'ы
+        :param affinity: Ключ сессии: запросы одной сессии идут на один сервер
+        :return: Endpoint
+        """
+        now = self._clock()
+        candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+        healthy = [e for e in candidates if e.unhealthy_until <= now]
+
+        if affinity is not None and len(self._servers) > 1:
+            server = self._servers[zlib.crc32(str(affinity).encode()) % len(self._servers)]
+            local = [e for e in healthy if e.server == server]
+            healthy = local or healthy
+
+        if not healthy:
+            # Все выведены из ротации - пробуем тот, что вернётся раньше
+            return min(candidates, key=lambda e: e.unhealthy_until)
+        return min(healthy, key=lambda e: -1.0 if e.ewma is None else e.ewma)
+
+    def hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        """
+        Через сколько секунд отправлять второй запрос.
+
+        :param endpoint: Endpoint первого запроса
+        :return: Задержка или None, если наблюдений ещё мало
+        """
+        if len(endpoint.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, endpoint.quantile(self.hedge_quantile))
+
+    async def call(self,
+                   factory: Callable[[Endpoint], Awaitable[Any]],
+                   affinity: Hashable = None,
+                   hedge: bool = True) -> Any:
+        """
+        Выполнение запроса на лучшем endpoint'е с хеджированием.
+
+        :param factory: Функция, создающая корутину запроса к endpoint'у
+        :param affinity: Ключ сессии (session_id) для выбора сервера или None
+        :param hedge: Можно ли отправить запрос второй раз - хеджированием или на
+                      другой endpoint после ошибки (нельзя для потоков с памятью
+                      на сервере: второй запрос записал бы реплику дважды)
+        :return: Результат первого успешного запроса
+        :raises Exception: ошибка последнего запроса, если не удался ни один
+        """
+        primary = self.select(affinity=affinity)
+        if len(self.endpoints) == 1:
+            return await self._attempt(primary, factory)
+
+        delay = self.hedge_delay(primary) if hedge else None
+        tasks = {asyncio.ensure_future(self._attempt(primary, factory)): primary}
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                task = done.pop()
+                if not task.exception():
+                    return task.result()
+                error = task.exception()
+                # Быстрая ошибка: другой endpoint пробуется, только если запрос
+                # не дошёл до потока; остальное решают повторы вызывающего
+                if not hedge or not self.failover(error):
+                    raise error
+                self._stats['failovers'] += 1
+                tasks.clear()
+                hedged = False
+            else:
+                error = None
+                hedged = True
+
+            backup = self.select(exclude=(primary,), affinity=affinity)
+            if hedged and backup.unhealthy_until > self._clock():
+                # Хеджировать на выведенный из ротации endpoint бессмысленно
+                return await next(iter(tasks))
+            if hedged:
+                self._stats['hedged'] += 1
+            tasks[asyncio.ensure_future(self._attempt(backup, factory))] = backup
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    if task.exception():
+                        error = task.exception()
+                        continue
+                    if hedged and endpoint is backup:
+                        endpoint.hedge_wins += 1
+                        self._stats['hedge_wins'] += 1
+                    return task.result()
+            raise error
+        finally:
+            # Проигравший запрос отменяется
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, endpoint: Endpoint, factory: Callable[[Endpoint], Awaitable[Any]]) -> Any:
+        started = self._clock()
+        endpoint.requests += 1
+        try:
+            # Хеджированные запросы - соседние спаны одной трассы
+            with tracing.span('langflow_endpoint', endpoint=endpoint.name):
+                result = await factory(endpoint)
+        except asyncio.CancelledError:
+            # Отменённый запрос длился не меньше elapsed: это учитывается,
+            # иначе медленный endpoint выглядел бы быстрее, чем есть
+            elapsed = self._clock() - started
+            if endpoint.ewma is not None and elapsed > endpoint.ewma:
+                self._observe(endpoint, elapsed)
+            raise
+        except Exception:
+            self.record_failure(endpoint)
+            raise
+        self.record_success(endpoint, self._clock() - started)
+        return result
+
+    def record_success(self, endpoint: Endpoint, latency: float) -> None:
+        """
+        Учёт успешного ответа.
+
+        :param endpoint: Endpoint
+        :param latency: Задержка в секундах
+        """
+        endpoint.consecutive_failures = 0
+        endpoint.unhealthy_until = 0.0
+        endpoint.latencies.append(latency)
+        self._observe(endpoint, latency)
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        """
+        Учёт ошибки; после failure_threshold ошибок подряд endpoint выводится из ротации.
+
+        :param endpoint: Endpoint
+        """
+        endpoint.errors += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.unhealthy_until = self._clock() + self.cooldown
+            logger.warning("Endpoint %s выведен из ротации на %.0f с", endpoint.name, self.cooldown)
+
+    def stats(self) -> dict:
+        """
+        Статистика пула и каждого endpoint'а.
+
+        :return: Словарь со статистикой
+        """
+        now = self._clock()
+        stats = dict(self._stats)
+        for index, endpoint in enumerate(self.endpoints):
+            p95 = endpoint.quantile(0.95)
+            stats[f"endpoint{index}"] = {
+                'ewma_seconds': endpoint.ewma or 0.0,
+                'p95_seconds': p95 or 0.0,
+                'requests': endpoint.requests,
+                'errors': endpoint.errors,
+                'error_rate': endpoint.errors / endpoint.requests if endpoint.requests else 0.0,
+                'hedge_wins': endpoint.hedge_wins,
+                'healthy': int(endpoint.unhealthy_until <= now),
+            }
+        return stats
+
+    def _observe(self, endpoint: Endpoint, latency: float) -> None:
+        if endpoint.ewma is None:
+            endpoint.ewma = latency
+        else:
+            endpoint.ewma += self.ewma_alpha * (latency - endpoint.ewma)
@@ -0,0 +1,367 @@
+"""
+Локальный поиск по частым вопросам (FAQ) без обращения к Langflow.
+
+Источник - JSON-файл со списком записей вида
+    {"questions": ["Во сколько вы открываетесь?", "Часы работы"], "answer": "..."}
+(вопросы о меню, часах работы, адресе). Каждый вариант вопроса - документ
+инвертированного индекса BM25; слова нормализуются так же, как ключ кэша
+ответов, и приводятся к основе упрощённым стеммером Snowball для русского
+языка. Ответ отдаётся локально, только если уверенность совпадения выше
+порога и заметно выше, чем у другой записи; остальное уходит в поток.
+Порог рассчитан на точность: короткие формулировки вопроса лучше добавить
+в файл отдельными вариантами, чем снижать FAQ_MIN_CONFIDENCE.
+
+При изменении файла индекс обновляется инкрементально: удаляются
+и добавляются только изменившиеся документы.
+
+Проверка порога на своих данных: python faq_index.py "вопрос" [--path faq.json]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from response_cache import normalize_message
+
+logger = logging.getLogger(__name__)
+
+# Файл с вопросами и ответами (пустой - поиск выключен)
+FAQ_PATH = os.getenv('FAQ_PATH', '')
+# Минимальная уверенность (0..1), при которой ответ отдаётся локально
+FAQ_MIN_CONFIDENCE = float(os.getenv('FAQ_MIN_CONFIDENCE', '0.8'))
+# Насколько лучшая запись должна опережать другую, чтобы совпадение не считалось неоднозначным
+FAQ_MIN_MARGIN = float(os.getenv('FAQ_MIN_MARGIN', '0.1'))
+# Как часто проверять, изменился ли файл
+FAQ_RELOAD_INTERVAL = float(os.getenv('FAQ_RELOAD_INTERVAL', '5'))
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Служебные слова и вежливые обращения, не влияющие на смысл вопроса.
+# Вопросительные слова (где, когда, сколько) намеренно не входят в список.
+STOP_WORDS = frozenset((
+    'и', 'в', 'во', 'не', 'что', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'но', 'да',
+    'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'мне', 'вот', 'от', 'меня', 'о',
+    'об', 'из', 'ну', 'ли', 'или', 'ни', 'до', 'вас', 'вам', 'там', 'тут', 'мы',
+    'для', 'их', 'под', 'при', 'про', 'ваш', 'ваша', 'ваше', 'ваши', 'вашем',
+    'вашей', 'это', 'этот', 'эта', 'эти', 'нас', 'нам', 'мой', 'моя', 'уже',
+    'привет', 'здравствуйте', 'добрый', 'пожалуйста', 'подскажите', 'скажите',
+    'спасибо', 'хотел', 'хотела', 'хочу',
+))
+
+# Упрощённый стеммер Snowball для русского языка (работает в области RV)
+_VOWELS = 'аеиоуыэюя'
+_RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE_RE = re.compile(r'(с[яь])$')
+_ADJECTIVE_RE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB_RE = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL_RE = re.compile(r'[^аеиоуыэюя][аеиоуыэюя].*ость?$')
+_SUPERLATIVE_RE = re.compile(r'ейше?$')
+
+
+@lru_cache(maxsize=10000)
+def stem(word: str) -> str:
+    """
+    Основа русского слова; слова без кириллицы возвращаются как есть.
+
+    :param word: Слово в нижнем регистре (ё уже заменена на е)
+    :return: Основа слова
+    """
+    match = _RV_RE.match(word)
+    if match is None or not any(ch in _VOWELS for ch in word):
+        return word
+    prefix, rv = match.groups()
+
+    # Шаг 1: деепричастие, иначе возвратная частица и прилагательное/глагол/существительное
+    stripped = _PERFECTIVE_GERUND_RE.sub('', rv, 1)
+    if stripped == rv:
+        rv = _REFLEXIVE_RE.sub('', rv, 1)
+        stripped = _ADJECTIVE_RE.sub('', rv, 1)
+        if stripped != rv:
+            rv = _PARTICIPLE_RE.sub('', stripped, 1)
+        else:
+            stripped = _VERB_RE.sub('', rv, 1)
+            rv = _NOUN_RE.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+
+    # Шаг 2: конечная 'и'
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательный суффикс в области R2
+    if _DERIVATIONAL_RE.search(rv):
+        rv = re.sub(r'ость?$', '', rv)
+
+    # Шаг 4: превосходная степень, двойная 'н', мягкий знак
+    rv = _SUPERLATIVE_RE.sub('', rv, 1)
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Основы значимых слов текста.
+
+    :param text: Вопрос или его вариант
+    :return: Список основ (с повторами)
+    """
+    return [stem(word) for word in normalize_message(text).split() if word not in STOP_WORDS]
+
+
+class _Document:
+    __slots__ = ('entry', 'question', 'terms', 'length')
+
+    def __init__(self, entry: int, question: str, terms: dict):
+        self.entry = entry
+        self.question = question
+        self.terms = terms
+        self.length = sum(terms.values())
+
+
+class FaqIndex:
+    """
+    Инвертированный индекс BM25 по вариантам вопросов с проверкой уверенности.
+    """
+
+    def __init__(self,
+                 path: str = FAQ_PATH,
+                 min_confidence: float = FAQ_MIN_CONFIDENCE,
+                 min_margin: float = FAQ_MIN_MARGIN,
+                 reload_interval: float = FAQ_RELOAD_INTERVAL,
+                 clock=time.monotonic):
+        """
+        :param path: JSON-файл с записями {"questions": [...], "answer": "..."}
+        :param min_confidence: Порог уверенности для локального ответа
+        :param min_margin: Минимальный отрыв лучшей записи от следующей
+        :param reload_interval: Как часто проверять изменение файла (секунды)
+        :param clock: Источник времени
+        """
+        self.path = path
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._answers = []
+        # Ключ документа (нормализованный вопрос, ответ) -> документ
+        self._documents = {}
+        # Основа -> {ключ документа: частота}
+        self._postings = {}
+        self._total_length = 0
+        self._signature = None
+        self._checked_at = None
+        self._stats = {'hits': 0, 'misses': 0, 'ambiguous': 0, 'reloads': 0, 'reload_errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def answer(self, message: str) -> Optional[str]:
+        """
+        Локальный ответ на вопрос, если совпадение достаточно уверенное.
+
+        :param message: Вопрос пользователя
+        :return: Ответ или None (вопрос нужно передать в поток)
+        """
+        if not self.enabled:
+            return None
+
+        matches = self.search(message, limit=2)
+        if not matches or matches[0][0] < self.min_confidence:
+            self._stats['misses'] += 1
+            return None
+        if len(matches) > 1 and matches[0][0] - matches[1][0] < self.min_margin:
+            self._stats['ambiguous'] += 1
+            return None
+
+        self._stats['hits'] += 1
+        return matches[0][1]
+
+    def search(self, message: str, limit: int = 5) -> List[Tuple[float, str, str]]:
+        """
+        Лучшие записи для вопроса (по одной на запись).
+
+        :param message: Вопрос пользователя
+        :param limit: Сколько записей вернуть
+        :return: Список (уверенность, ответ, совпавший вариант вопроса) по убыванию
+        """
+        self.maybe_reload()
+        query = set(tokenize(message))
+        if not query:
+            return []
+
+        with self._lock:
+            if not self._documents:
+                return []
+            idf = {term: self._idf(term) for term in query}
+            query_weight = sum(idf.values())
+            avg_length = self._total_length / len(self._documents)
+
+            candidates = set()
+            for term in query:
+                candidates.update(self._postings.get(term, ()))
+
+            best = {}
+            for key in candidates:
+                document = self._documents[key]
+                matched = [term for term in query if term in document.terms]
+                score = sum(self._term_score(idf[t], document.terms[t], document.length, avg_length) for t in matched)
+                ideal = sum(
+                    self._term_score(self._idf(t), tf, document.length, avg_length)
+                    for t, tf in document.terms.items()
+                )
+                # Уверенность - гармоническое среднее покрытия документа и покрытия вопроса
+                document_coverage = min(1.0, score / ideal)
+                query_coverage = sum(idf[t] for t in matched) / query_weight
+                confidence = 2 * document_coverage * query_coverage / (document_coverage + query_coverage)
+
+                if confidence > best.get(document.entry, (0.0, ''))[0]:
+                    best[document.entry] = (confidence, document.question)
+
+            ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+            return [(confidence, self._answers[entry], question) for entry, (confidence, question) in ranked]
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """
+        Обновление индекса, если файл изменился (не чаще reload_interval).
+
+        :param force: Проверить файл независимо от интервала
+        :return: True, если индекс обновлён
+        """
+        if not self.enabled:
+            return False
+        now = self._clock()
+        if not force and self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = now
+
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return False
+            # Сломанный файл разбирается и попадает в лог один раз, до следующего изменения
+            self._signature = signature
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f)
+            self._rebuild(entries)
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # Остаётся прежний индекс: ошибка в файле не должна отключать FAQ
+            self._stats['reload_errors'] += 1
+            logger.error("Не удалось загрузить FAQ из %s: %s", self.path, e)
+            return False
+
+        self._stats['reloads'] += 1
+        logger.info("Индекс FAQ обновлён: записей %s, вариантов вопросов %s",
+                    len(self._answers), len(self._documents))
+        return True
+
+    def stats(self) -> dict:
+        """
+        Попадания, промахи и размер индекса.
+
+        :return: Словарь со статистикой
+        """
+        with self._lock:
+            return dict(
+                self._stats,
+                entries=len(self._answers),
+                documents=len(self._documents),
+                terms=len(self._postings),
+            )
+
+    def _rebuild(self, entries: list) -> None:
+        answers = []
+        wanted = {}
+        for entry in entries:
+            answer = entry['answer'].strip()
+            index = len(answers)
+            answers.append(answer)
+            for question in entry['questions']:
+                key = (normalize_message(question), answer)
+                if key[0] and key not in wanted:
+                    wanted[key] = (index, question)
+
+        with self._lock:
+            # Удаляются только исчезнувшие варианты, токенизируются только новые
+            for key in [key for key in self._documents if key not in wanted]:
+                self._remove_document(key)
+            for key, (index, question) in wanted.items():
+                document = self._documents.get(key)
+                if document is None:
+                    self._add_document(key, index, question)
+                else:
+                    document.entry = index
+                    document.question = question
+            self._answers = answers
+
+    def _add_document(self, key: tuple, entry: int, question: str) -> None:
+        terms = {}
+        for term in tokenize(question):
+            terms[term] = terms.get(term, 0) + 1
+        if not terms:
+            return
+        document = _Document(entry, question, terms)
+        self._documents[key] = document
+        self._total_length += document.length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[key] = tf
+
+    def _remove_document(self, key: tuple) -> None:
+        document = self._documents.pop(key)
+        self._total_length -= document.length
+        for term in document.terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+
+    def _idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        total = len(self._documents)
+        return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+    @staticmethod
+    def _term_score(idf: float, tf: int, length: int, avg_length: float) -> float:
+        return idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск по FAQ: уверенность совпадений для подбора порога')
+    parser.add_argument('question')
+    parser.add_argument('--path', default=FAQ_PATH)
+    parser.add_argument('--limit', type=int, default=5)
+    args = parser.parse_args()
+
+    index = FaqIndex(args.path)
+    print(f"Основы: {' '.join(tokenize(args.question))}")
+    for confidence, answer, question in index.search(args.question, args.limit):
+        print(f"{confidence:.2f}  {question}  ->  {answer[:60]}")
+    print(f"Локальный ответ: {'да' if index.answer(args.question) is not None else 'нет'} "
+          f"(порог {index.min_confidence}, отрыв {index.min_margin})")
+
+
+if __name__ == '__main__':
+    main()
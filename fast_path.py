@@ -0,0 +1,70 @@
+"""
+Быстрый путь webhook для /start и /help.
+
+Ответ на эти команды не зависит от Langflow и состояния бота, поэтому
+webhook возвращает его прямо в теле ответа Telegram (метод sendMessage),
+не импортируя telegram и не поднимая Application. Модуль намеренно
+использует только стандартную библиотеку.
+"""
+import os
+from typing import Optional
+
+# Имя бота без '@': команды вида /start@name обрабатываются, только если имя совпадает
+TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME', '')
+
+START_TEXT = 'Привет! Я бот.'
+HELP_TEXT = 'Чем могу помочь?'
+
+COMMAND_REPLIES = {
+    'start': START_TEXT,
+    'help': HELP_TEXT,
+}
+
+
+def command_name(update_data: dict) -> Optional[str]:
+    """
+    Имя команды из сырого update (только новые сообщения).
+
+    :param update_data: JSON-тело update
+    :return: Имя команды без '/' или None
+    """
+    message = update_data.get('message')
+    if not isinstance(message, dict):
+        return None
+
+    text = message.get('text')
+    if not isinstance(text, str) or not text.startswith('/'):
+        return None
+
+    # Как и CommandHandler, учитываем только команду в начале сообщения
+    entities = message.get('entities') or ()
+    if not any(e.get('type') == 'bot_command' and e.get('offset') == 0 for e in entities):
+        return None
+
+    command, _, username = text.split(maxsplit=1)[0][1:].partition('@')
+    if username and username.lower() != TELEGRAM_BOT_USERNAME.lower():
+        return None
+    return command.lower()
+
+
+def webhook_reply(update_data: dict) -> Optional[dict]:
+    """
+    Ответ на команду в виде вызова метода в теле ответа webhook.
+
+    :param update_data: JSON-тело update
+    :return: Тело ответа со sendMessage или None, если нужен полный путь
+    """
+    text = COMMAND_REPLIES.get(command_name(update_data))
+    if text is None:
+        return None
+
+    # Без message.chat (другой вид update) отвечать некуда - update идёт полным путём
+    chat = (update_data.get('message') or {}).get('chat') or {}
+    if 'id' not in chat:
+        return None
+
+    return {
+        'method': 'sendMessage',
+        'chat_id': chat['id'],
+        'text': text,
+    }
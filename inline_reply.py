@@ -0,0 +1,302 @@
+"""
+Ответ на update прямо в теле ответа webhook.
+
+Telegram позволяет вернуть из webhook один вызов метода Bot API. Во время
+обработки update первый sendMessage в тот же чат не отправляется, а
+задерживается: хендлер получает сообщение-заглушку, и вызов отдаётся
+webhook'у. Так короткий ответ (/start, /help, ответ из кэша, сообщение
+об ошибке) обходится без отдельного запроса к api.telegram.org.
+
+Если хендлер делает ещё один вызов, задержанный отправляется обычным
+запросом перед ним, и дальше всё идёт как раньше: многочастные ответы
+сохраняют порядок. Хендлеры, которым нужно настоящее отправленное сообщение
+(например, чтобы его редактировать при потоковом ответе), вызывают
+release(). Если обработка не уложилась в INLINE_REPLY_BUDGET, webhook
+отвечает 'OK', а задержанный вызов отправляется обычным запросом.
+
+Результат вызова из тела webhook Telegram не сообщает, поэтому заглушка
+не содержит настоящего message_id.
+
+Модуль при загрузке использует только стандартную библиотеку без asyncio
+(он нужен лишь wait_async): telegram импортируется при построении Application.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько webhook (main.py, asgi.py) ждёт окончания обработки, чтобы ответить в теле.
+# Выключено по умолчанию: ожидание держит поток webhook и у update, ответ на которые
+# долгий (вопросы к Langflow), съедая быстрое подтверждение. index.py обрабатывает
+# update до конца вызова и отвечает в теле независимо от этой настройки
+INLINE_REPLY_BUDGET = float(os.getenv('INLINE_REPLY_BUDGET', '0'))
+
+# Методы, которые можно вернуть в теле webhook
+INLINE_METHODS = frozenset({'sendMessage'})
+
+# Пути к чату update, на который отвечает хендлер
+_CHAT_PATHS = (
+    ('message', 'chat'),
+    ('edited_message', 'chat'),
+    ('channel_post', 'chat'),
+    ('callback_query', 'message', 'chat'),
+)
+
+_current = contextvars.ContextVar('inline_reply', default=None)
+
+_stats_lock = threading.Lock()
+_stats = {'inline': 0, 'released': 0, 'late': 0, 'empty': 0}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def stats() -> dict:
+    """
+    Сколько ответов ушло в теле webhook и сколько - обычными запросами.
+
+    :return: Словарь со статистикой
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _chat_of(update_data: dict) -> Optional[dict]:
+    for path in _CHAT_PATHS:
+        value = update_data
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, dict) and 'id' in value:
+            return value
+    return None
+
+
+class InlineReply:
+    """
+    Сборщик единственного вызова Bot API для ответа в теле webhook.
+    Связывает поток webhook (wait) и обработку update в event loop (hold, finish).
+    """
+
+    def __init__(self, update_data: dict):
+        """
+        :param update_data: JSON-тело update
+        """
+        self.chat = _chat_of(update_data)
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._body = None
+        self._send = None
+        # Задержка больше невозможна: уже был другой вызов, release() или обработка закончилась
+        self._closed = False
+        # Webhook перестал ждать: задержанный вызов нужно отправить обычным запросом
+        self._detached = False
+        # Пробуждение асинхронных ожидающих (ASGI)
+        self._waiters = []
+
+    def hold(self, method: str, parameters: dict, send: Callable[[], Awaitable[Any]]) -> Optional[dict]:
+        """
+        Попытка задержать вызов для ответа в теле webhook.
+
+        :param method: Метод Bot API
+        :param parameters: Параметры вызова в виде JSON
+        :param send: Отправка вызова обычным запросом
+        :return: Результат-заглушка для хендлера или None, если вызов нужно выполнить сразу
+        """
+        if method not in INLINE_METHODS or self.chat is None:
+            return None
+        if str(parameters.get('chat_id')) != str(self.chat['id']):
+            return None
+
+        with self._lock:
+            if self._closed or self._detached or self._body is not None:
+                return None
+            self._body = dict(parameters, method=method)
+            self._send = send
+
+        return {
+            'message_id': 0,
+            'date': int(time.time()),
+            'chat': self.chat,
+            'text': parameters.get('text'),
+        }
+
+    def release(self, close: bool = True) -> Optional[Callable[[], Awaitable[Any]]]:
+        """
+        Отказ от задержанного вызова.
+
+        :param close: Запретить задержку и последующих вызовов; без этого
+                      запрет наступает, только если вызов уже был задержан
+        :return: Отправка задержанного вызова или None
+        """
+        with self._lock:
+            send, self._send = self._send, None
+            self._body = None
+            if close or send is not None:
+                self._closed = True
+        if send is not None:
+            _count('released')
+        return send
+
+    def finish(self) -> Optional[Callable[[], Awaitable[Any]]]:
+        """
+        Обработка update закончена.
+
+        :return: Отправка задержанного вызова, если webhook его уже не ждёт
+        """
+        with self._lock:
+            self._closed = True
+            send = self._send if self._detached else None
+            self._finished.set()
+            waiters, self._waiters = self._waiters, []
+        for wake in waiters:
+            wake()
+        if send is not None:
+            _count('late')
+        return send
+
+    def wait(self, timeout: float) -> Optional[dict]:
+        """
+        Ожидание окончания обработки (вызывается потоком webhook).
+
+        :param timeout: Максимальное время ожидания в секундах
+        :return: Тело ответа webhook с вызовом метода или None
+        """
+        self._finished.wait(timeout)
+        with self._lock:
+            if not self._finished.is_set():
+                self._detached = True
+                return None
+            body = self._body
+        _count('inline' if body is not None else 'empty')
+        return body
+
+    async def wait_async(self, timeout: float) -> Optional[dict]:
+        """
+        Ожидание окончания обработки без блокировки event loop (ASGI).
+
+        :param timeout: Максимальное время ожидания в секундах
+        :return: Тело ответа webhook с вызовом метода или None
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+
+        with self._lock:
+            waiting = not self._finished.is_set()
+            if waiting:
+                self._waiters.append(wake)
+        if waiting:
+            try:
+                await asyncio.wait_for(finished, timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.wait(0)
+
+
+def current() -> Optional[InlineReply]:
+    """Сборщик обрабатываемого update или None"""
+    return _current.get()
+
+
+@contextmanager
+def collecting(reply: Optional[InlineReply]):
+    """
+    Вызовы Bot API внутри блока могут уйти в тело webhook.
+
+    :param reply: Сборщик (None - обычные запросы)
+    """
+    token = _current.set(reply)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+async def release() -> None:
+    """
+    Отказ от ответа в теле webhook для текущего update: задержанный вызов
+    отправляется сразу, последующие идут обычными запросами.
+    Нужен хендлерам, которые используют отправленное сообщение (редактируют его).
+    """
+    reply = _current.get()
+    if reply is None:
+        return
+    send = reply.release()
+    if send is not None:
+        await _deliver(send)
+
+
+async def finish(reply: Optional[InlineReply]) -> None:
+    """
+    Окончание обработки update: задержанный вызов отправляется, если webhook
+    его уже не ждёт.
+
+    :param reply: Сборщик update
+    """
+    if reply is None:
+        return
+    send = reply.finish()
+    if send is not None:
+        try:
+            await _deliver(send)
+        except Exception as e:
+            logger.error("Не удалось отправить задержанный ответ: %s", e)
+
+
+async def _deliver(send: Callable[[], Awaitable[Any]]) -> None:
+    # Хендлер уже получил заглушку, поэтому ошибка Bot API только логируется
+    code, payload = await send()
+    if code != HTTPStatus.OK:
+        logger.error("Задержанный ответ не доставлен: %s %s", code, payload[:200])
+
+
+@functools.lru_cache(maxsize=None)
+def _request_class():
+    from telegram.request import HTTPXRequest
+
+    class InlineReplyRequest(HTTPXRequest):
+        """HTTPXRequest, отдающий первый sendMessage update в тело webhook"""
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            reply = _current.get()
+            if reply is None or request_data is None:
+                return await super().do_request(url, method, request_data, **kwargs)
+
+            send = functools.partial(super().do_request, url, method, request_data, **kwargs)
+            if not request_data.contains_files:
+                result = reply.hold(url.rsplit('/', 1)[-1], request_data.parameters, send)
+                if result is not None:
+                    return HTTPStatus.OK, json.dumps({'ok': True, 'result': result}).encode()
+
+            # Второй вызов: задержанный уходит первым, чтобы сохранить порядок.
+            # Вызов до первого сообщения (например, sendChatAction) задержке не мешает
+            held = reply.release(close=False)
+            if held is not None:
+                await _deliver(held)
+            return await send()
+
+    return InlineReplyRequest
+
+
+def build_request(**kwargs):
+    """
+    HTTP-клиент Bot API с поддержкой ответа в теле webhook.
+
+    :param kwargs: Параметры HTTPXRequest
+    :return: Экземпляр HTTPXRequest
+    """
+    return _request_class()(**kwargs)
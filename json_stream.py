@@ -0,0 +1,382 @@
+"""
+Потоковое извлечение ответа из JSON Langflow без построения всего дерева.
+
+Ответ потока содержит артефакты, логи, дубли сообщений и метаданные, которые
+по объёму во много раз больше самого ответа. Когда путь к ответу для потока
+уже известен (его выучил ResponseExtractor), тело разбирается по мере
+получения: значения вне пути пропускаются сканированием скобок и строк
+регулярными выражениями (без создания объектов), значение на пути
+разбирается json.loads, и разбор на этом останавливается. Остаток тела
+вычитывается без разбора, чтобы соединение вернулось в пул.
+
+Если путь не найден или значение на нём не годится в ответ, тело
+разбирается целиком, как раньше.
+"""
+import codecs
+import json
+import logging
+import re
+import threading
+from typing import AsyncIterable, Iterable, Optional
+
+from response_extractor import ResponseExtractor, _as_answer, safe_get
+
+logger = logging.getLogger(__name__)
+
+# Строка JSON целиком либо открывающая кавычка незавершённой строки
+_STRING_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|"')
+# При пропуске контейнера важны только скобки вне строк: одно совпадение
+# поглощает всё до следующей скобки или незавершённой строки
+_SKIP_RE = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_SCALAR_RE = re.compile(r'[^\s,\]}]+')
+_WHITESPACE_RE = re.compile(r'\s*')
+
+# Сколько разобранного текста держать в буфере до его отбрасывания
+_TRIM_THRESHOLD = 64 * 1024
+
+# Ожидания разборщика внутри контейнера
+_KEY = 'key'
+_COLON = 'colon'
+_VALUE = 'value'
+_NEXT = 'next'
+
+
+class _Frame:
+    __slots__ = ('kind', 'key', 'expect')
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key = 0 if kind == '[' else None
+        self.expect = _VALUE if kind == '[' else _KEY
+
+
+class JsonPathScanner:
+    """
+    Инкрементальный поиск значения по пути в JSON-тексте.
+    Текст подаётся фрагментами; в стеке хранятся только контейнеры на пути.
+    """
+
+    def __init__(self, path: tuple):
+        """
+        :param path: Ключи и индексы до значения, например ('outputs', 0, 'results')
+        """
+        self.path = tuple(path)
+        self.found = False
+        self.done = False
+        self.value = None
+        self._buf = ''
+        self._pos = 0
+        self._stack = []
+        self._root_started = False
+        # Пропуск значения: глубина вложенности (0 - скаляр) или None
+        self._skip_depth = None
+        # Начало захватываемого значения в буфере
+        self._capture = None
+
+    def feed(self, text: str) -> bool:
+        """
+        Очередной фрагмент текста.
+
+        :param text: Фрагмент JSON
+        :return: True, когда разбор завершён (значение найдено или документ кончился)
+        :raises ValueError: если текст не является JSON
+        """
+        if self.done:
+            return True
+        self._buf += text
+        self._run()
+        self._trim()
+        return self.done
+
+    def close(self) -> None:
+        """Конец данных: незавершённый документ считается ненайденным значением"""
+        if not self.done and self._skip_depth == 0 and self._capture is not None:
+            # Скаляр в самом конце документа не имеет завершающего разделителя
+            self._finish_value(len(self._buf))
+        self.done = True
+
+    def _run(self) -> None:
+        while not self.done:
+            if self._skip_depth is not None:
+                if not self._skip():
+                    return
+                continue
+
+            self._pos = _WHITESPACE_RE.match(self._buf, self._pos).end()
+            if self._pos >= len(self._buf):
+                return
+
+            if not self._stack:
+                if self._root_started:
+                    self.done = True
+                    return
+                if not self._start_value(on_path=True):
+                    return
+                self._root_started = True
+                continue
+
+            frame = self._stack[-1]
+            char = self._buf[self._pos]
+
+            if frame.expect == _KEY:
+                if char == '}' and frame.key is None:
+                    self._close_container()
+                    continue
+                match = _STRING_RE.match(self._buf, self._pos)
+                if match is None:
+                    raise ValueError(f"Ожидался ключ в позиции {self._pos}")
+                if match.group() == '"':
+                    return
+                raw = match.group()
+                frame.key = json.loads(raw) if '\\' in raw else raw[1:-1]
+                self._pos = match.end()
+                frame.expect = _COLON
+
+            elif frame.expect == _COLON:
+                if char != ':':
+                    raise ValueError(f"Ожидалось ':' в позиции {self._pos}")
+                self._pos += 1
+                frame.expect = _VALUE
+
+            elif frame.expect == _VALUE:
+                if char == ']' and frame.kind == '[' and frame.key == 0:
+                    self._close_container()
+                    continue
+                depth = len(self._stack)
+                on_path = depth <= len(self.path) and self.path[depth - 1] == frame.key \
+                    and type(self.path[depth - 1]) is type(frame.key)
+                # Ожидание меняется до начала значения: вложенный контейнер уже в стеке
+                frame.expect = _NEXT
+                if not self._start_value(on_path):
+                    frame.expect = _VALUE
+                    return
+
+            else:
+                if char == ',':
+                    self._pos += 1
+                    if frame.kind == '[':
+                        frame.key += 1
+                        frame.expect = _VALUE
+                    else:
+                        frame.expect = _KEY
+                elif char == ('}' if frame.kind == '{' else ']'):
+                    self._close_container()
+                else:
+                    raise ValueError(f"Ожидался разделитель в позиции {self._pos}")
+
+    def _start_value(self, on_path: bool) -> bool:
+        char = self._buf[self._pos]
+        target = on_path and len(self._stack) == len(self.path)
+
+        if target:
+            self._capture = self._pos
+        elif on_path and char in '{[':
+            self._stack.append(_Frame(char))
+            self._pos += 1
+            return True
+
+        if char in '{[':
+            self._skip_depth = 1
+            self._pos += 1
+        elif char == '"':
+            match = _STRING_RE.match(self._buf, self._pos)
+            if match.group() == '"':
+                # Строка ещё не пришла целиком: значение начнётся заново
+                self._capture = None
+                return False
+            self._pos = match.end()
+            if target:
+                self._finish_value(self._pos)
+        else:
+            self._skip_depth = 0
+        return True
+
+    def _skip(self) -> bool:
+        buf = self._buf
+        if self._skip_depth == 0:
+            match = _SCALAR_RE.match(buf, self._pos)
+            end = match.end() if match else self._pos
+            if end >= len(buf):
+                # Число может продолжиться в следующем фрагменте
+                return False
+            self._pos = end
+            self._skip_depth = None
+            if self._capture is not None:
+                self._finish_value(end)
+            return True
+
+        size = len(buf)
+        while self._skip_depth:
+            end = _SKIP_RE.match(buf, self._pos).end()
+            if end >= size or buf[end] == '"':
+                # Конец буфера или строка, пришедшая не целиком
+                self._pos = end
+                return False
+            self._pos = end + 1
+            if buf[end] in '{[':
+                self._skip_depth += 1
+            else:
+                self._skip_depth -= 1
+
+        self._skip_depth = None
+        if self._capture is not None:
+            self._finish_value(self._pos)
+        return True
+
+    def _finish_value(self, end: int) -> None:
+        self.value = json.loads(self._buf[self._capture:end])
+        self.found = True
+        self.done = True
+        self._capture = None
+
+    def _close_container(self) -> None:
+        self._pos += 1
+        self._stack.pop()
+
+    def _trim(self) -> None:
+        keep = self._pos if self._capture is None else self._capture
+        if keep > _TRIM_THRESHOLD:
+            self._buf = self._buf[keep:]
+            self._pos -= keep
+            if self._capture is not None:
+                self._capture -= keep
+
+
+def prune_to_path(path: tuple, value) -> dict:
+    """
+    Минимальный ответ, содержащий только значение на пути:
+    извлечение по тому же пути даёт тот же результат, что и на полном ответе.
+
+    :param path: Путь к значению
+    :param value: Значение
+    :return: Дерево из словарей и списков вдоль пути
+    """
+    for key in reversed(path):
+        if isinstance(key, int):
+            value = [{}] * key + [value]
+        else:
+            value = {key: value}
+    return value
+
+
+class _ReadState:
+    """Общая часть синхронного и асинхронного чтения тела"""
+
+    def __init__(self, path: tuple):
+        self.path = path
+        self.scanner = JsonPathScanner(path)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.chunks = []
+        self.failed = False
+
+    def feed(self, chunk: bytes) -> bool:
+        # Сырые байты хранятся до находки: они нужны для полного разбора
+        self.chunks.append(chunk)
+        try:
+            return self.scanner.feed(self.decoder.decode(chunk))
+        except ValueError as e:
+            logger.warning("Потоковый разбор ответа прерван: %s", e)
+            self.failed = True
+            return True
+
+    def answer_found(self) -> bool:
+        if not self.failed:
+            self.scanner.close()
+        return self.scanner.found and _as_answer(safe_get(self.scanner.value)) is not None
+
+
+class StreamingResponseReader:
+    """
+    Чтение тела ответа Langflow с потоковым извлечением по выученному пути.
+    """
+
+    def __init__(self, extractor: ResponseExtractor):
+        """
+        :param extractor: Экстрактор, хранящий выученные пути потоков
+        """
+        self.extractor = extractor
+        self._lock = threading.Lock()
+        self._stats = {'streamed': 0, 'full': 0, 'fallbacks': 0, 'bytes_skipped': 0}
+
+    def path_for(self, flow_id: str) -> Optional[tuple]:
+        """
+        Путь для потокового разбора.
+
+        :param flow_id: ID потока
+        :return: Путь или None, если нужен полный разбор
+        """
+        return self.extractor.preferred_path(flow_id)
+
+    def read(self, chunks: Iterable[bytes], flow_id: str = '') -> dict:
+        """
+        Разбор тела из синхронного итератора фрагментов.
+
+        :param chunks: Фрагменты тела
+        :param flow_id: ID потока
+        :return: Усечённый до пути ответ или полный ответ
+        """
+        path = self.path_for(flow_id)
+        if path is None:
+            self._count('full')
+            return json.loads(b''.join(chunks))
+
+        state = _ReadState(path)
+        iterator = iter(chunks)
+        for chunk in iterator:
+            if state.feed(chunk):
+                break
+
+        if state.answer_found():
+            skipped = sum(len(chunk) for chunk in iterator)
+            return self._streamed(state, skipped)
+
+        self._count('fallbacks')
+        return json.loads(b''.join(state.chunks) + b''.join(iterator))
+
+    async def read_async(self, chunks: AsyncIterable[bytes], flow_id: str = '') -> dict:
+        """
+        Разбор тела из асинхронного итератора фрагментов.
+
+        :param chunks: Фрагменты тела
+        :param flow_id: ID потока
+        :return: Усечённый до пути ответ или полный ответ
+        """
+        path = self.path_for(flow_id)
+        if path is None:
+            self._count('full')
+            return json.loads(b''.join([chunk async for chunk in chunks]))
+
+        state = _ReadState(path)
+        iterator = chunks.__aiter__()
+        async for chunk in iterator:
+            if state.feed(chunk):
+                break
+
+        if state.answer_found():
+            skipped = 0
+            async for chunk in iterator:
+                skipped += len(chunk)
+            return self._streamed(state, skipped)
+
+        self._count('fallbacks')
+        rest = [chunk async for chunk in iterator]
+        return json.loads(b''.join(state.chunks) + b''.join(rest))
+
+    def stats(self) -> dict:
+        """
+        Сколько ответов разобрано потоково, целиком и с возвратом к полному разбору.
+
+        :return: Словарь со статистикой
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _streamed(self, state: _ReadState, skipped: int) -> dict:
+        with self._lock:
+            self._stats['streamed'] += 1
+            self._stats['bytes_skipped'] += skipped
+        return prune_to_path(state.path, state.scanner.value)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
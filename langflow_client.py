@@ -1,180 +1,793 @@
 import os
 import json
+import time
+import asyncio
 import logging
+import importlib.util
 import requests
-from typing import Optional
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
-    level=logging.DEBUG
+from response_cache import ResponseCache, normalize_message
+from response_extractor import ResponseExtractor, safe_get
+from single_flight import SingleFlight
+from context_store import ChatContextStore
+from endpoint_pool import EndpointPool, parse_endpoints
+from faq_index import FaqIndex
+from json_stream import StreamingResponseReader
+from resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, RetryPolicy, deadline_scope, request_timeout,
 )
+from log_setup import truncate
+import metrics
+
+# Логирование настраивается точкой входа (log_setup.setup_logging)
 logger = logging.getLogger(__name__)
 
 # Загрузка переменных окружения
 load_dotenv()
 
 # Константы из .env
-BASE_API_URL = "https://api.langflow.astra.datastax.com"
+BASE_API_URL = os.getenv('LANGFLOW_BASE_URL', "https://api.langflow.astra.datastax.com")
 LANGFLOW_ID = "cecec729-5bf1-4e50-b9c3-f9d55030a89e"
 FLOW_ID = "b18386ad-c0be-49b6-b609-6004d56aa1b2"
 APPLICATION_TOKEN = os.getenv('APPLICATION_TOKEN')
 
-def run_flow(message: str, 
-             endpoint: str = FLOW_ID, 
-             output_type: str = "chat",
-             input_type: str = "chat", 
-             tweaks: Optional[dict] = None) -> dict:
+# Настройки пула соединений с Langflow
+LANGFLOW_POOL_SIZE = int(os.getenv('LANGFLOW_POOL_SIZE', '20'))
+LANGFLOW_CONNECT_TIMEOUT = float(os.getenv('LANGFLOW_CONNECT_TIMEOUT', '5'))
+LANGFLOW_READ_TIMEOUT = float(os.getenv('LANGFLOW_READ_TIMEOUT', '60'))
+
+# Бюджет времени на получение ответа для одного сообщения
+LANGFLOW_DEADLINE = float(os.getenv('LANGFLOW_DEADLINE', '60'))
+# Повторы временных ошибок: сбой соединения и ответы 429/502/503/504
+LANGFLOW_RETRY_ATTEMPTS = int(os.getenv('LANGFLOW_RETRY_ATTEMPTS', '3'))
+LANGFLOW_RETRY_BASE_DELAY = float(os.getenv('LANGFLOW_RETRY_BASE_DELAY', '0.2'))
+LANGFLOW_RETRY_MAX_DELAY = float(os.getenv('LANGFLOW_RETRY_MAX_DELAY', '2'))
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# Circuit breaker: отказов подряд до размыкания и пауза до пробного запроса
+LANGFLOW_BREAKER_THRESHOLD = int(os.getenv('LANGFLOW_BREAKER_THRESHOLD', '5'))
+LANGFLOW_BREAKER_RECOVERY = float(os.getenv('LANGFLOW_BREAKER_RECOVERY', '30'))
+
+# Ответы-заглушки при ошибках: никогда не попадают в кэш
+NO_ANSWER_TEXT = "Извините, не удалось получить ответ от ассистента"
+CONNECTION_ERROR_TEXT = "Проблемы с подключением к серверу"
+PROCESSING_ERROR_TEXT = "Ошибка при обработке ответа"
+UNEXPECTED_ERROR_TEXT = "Произошла непредвиденная ошибка"
+UNAVAILABLE_TEXT = "Ассистент временно недоступен, пожалуйста, напишите чуть позже"
+ERROR_RESPONSES = frozenset({
+    NO_ANSWER_TEXT,
+    CONNECTION_ERROR_TEXT,
+    PROCESSING_ERROR_TEXT,
+    UNEXPECTED_ERROR_TEXT,
+    UNAVAILABLE_TEXT,
+})
+
+# Кэш ответов на частые вопросы
+answer_cache = ResponseCache(
+    max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1024')),
+    max_bytes=int(os.getenv('ANSWER_CACHE_MAX_BYTES', str(4 * 1024 * 1024))),
+    ttl=float(os.getenv('ANSWER_CACHE_TTL', '3600')),
+    uncacheable=ERROR_RESPONSES,
+)
+# Результаты batch_runner.py (JSONL), загружаемые в кэш при старте
+ANSWER_CACHE_WARM_FILE = os.getenv('ANSWER_CACHE_WARM_FILE')
+
+# Объединение одинаковых одновременных запросов. Для потоков с состоянием
+# (персонализированные ответы, память на сервере) объединение и хеджирование отключаются
+LANGFLOW_STATEFUL_FLOWS = frozenset(
+    flow_id.strip() for flow_id in os.getenv('LANGFLOW_STATEFUL_FLOWS', '').split(',') if flow_id.strip()
+)
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', str(LANGFLOW_CONNECT_TIMEOUT + LANGFLOW_READ_TIMEOUT)))
+single_flight = SingleFlight()
+
+# Контекст переписки по чатам: стабильный session_id и последние реплики
+context_store = ChatContextStore(
+    max_chats=int(os.getenv('CONTEXT_MAX_CHATS', '10000')),
+    max_turns_total=int(os.getenv('CONTEXT_MAX_TURNS', '50000')),
+    token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '400')),
+    idle_ttl=float(os.getenv('CONTEXT_IDLE_TTL', '1800')),
+)
+# Компонент потока, в поле которого передаётся локальная история (например, 'Prompt-a1b2c')
+LANGFLOW_HISTORY_COMPONENT = os.getenv('LANGFLOW_HISTORY_COMPONENT')
+LANGFLOW_HISTORY_FIELD = os.getenv('LANGFLOW_HISTORY_FIELD', 'history')
+
+# Локальные ответы на частые вопросы (FAQ_PATH), проверяются до кэша и потока
+faq_index = FaqIndex()
+
+# Защита от недоступного Langflow
+langflow_breaker = CircuitBreaker(
+    'langflow',
+    failure_threshold=LANGFLOW_BREAKER_THRESHOLD,
+    recovery_timeout=LANGFLOW_BREAKER_RECOVERY,
+)
+
+# Экстрактор текста, запоминающий рабочий путь для каждого потока
+response_extractor = ResponseExtractor()
+
+# Потоковый разбор тела по выученному пути вместо построения всего дерева ответа
+LANGFLOW_STREAM_PARSE = os.getenv('LANGFLOW_STREAM_PARSE', '1').lower() in ('1', 'true', 'yes')
+LANGFLOW_BODY_CHUNK_SIZE = 16 * 1024
+stream_reader = StreamingResponseReader(response_extractor)
+
+# Общая keep-alive сессия для синхронных вызовов
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LANGFLOW_POOL_SIZE)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+
+# Асинхронный клиент создаётся лениво и привязан к event loop, в котором создан
+_async_client = None
+_async_client_loop = None
+
+def _build_request(message: str, endpoint: str, output_type: str, input_type: str,
+                   tweaks: Optional[dict] = None, session_id: Optional[str] = None):
     """
-    Выполнение потока Langflow с заданным сообщением.
-    
-    :param message: Сообщение для отправки в поток
-    :param endpoint: ID или имя endpoint потока
-    :param tweaks: Опциональные настройки для кастомизации потока
-    :return: JSON-ответ от потока
+    Подготовка URL, тела и заголовков запроса к потоку Langflow.
+
+    :return: Кортеж (api_url, payload, headers)
     """
     api_url = f"{BASE_API_URL}/lf/{LANGFLOW_ID}/api/v1/run/{endpoint}"
-    
-    # Логирование параметров запроса
-    logger.debug(f"API URL: {api_url}")
-    logger.debug(f"Message: {message}")
-    logger.debug(f"Application Token: {'*' * len(APPLICATION_TOKEN) if APPLICATION_TOKEN else 'Not set'}")
+    return (api_url,) + _build_payload(message, output_type, input_type, tweaks, session_id)
 
+def _build_payload(message: str, output_type: str, input_type: str,
+                   tweaks: Optional[dict] = None, session_id: Optional[str] = None):
+    """
+    Подготовка тела и заголовков запроса к потоку Langflow.
+
+    :return: Кортеж (payload, headers)
+    """
     payload = {
         "input_value": message,
         "output_type": output_type,
         "input_type": input_type,
     }
+    if tweaks:
+        payload["tweaks"] = tweaks
+    if session_id:
+        payload["session_id"] = session_id
 
     headers = {
         "Authorization": f"Bearer {APPLICATION_TOKEN}",
         "Content-Type": "application/json"
     }
 
+    return payload, headers
+
+def _status_code(error: Exception) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Временная ошибка, которую безопасно повторить: запрос не дошёл до потока
+    (сбой соединения) или был отклонён до обработки (429/502/503/504).
+    Таймаут чтения не повторяется - поток мог уже выполниться.
+    
+    :param error: Исключение вызова
+    :return: True, если вызов можно повторить
+    """
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout,
+                          requests.exceptions.ConnectionError)):
+        return True
+    return _status_code(error) in RETRY_STATUSES
+
+def is_outage_error(error: Exception) -> bool:
+    """
+    Отказ Langflow для circuit breaker: всё, кроме ошибок самого запроса (4xx).
+    
+    :param error: Исключение вызова
+    :return: True, если ошибка говорит о недоступности сервиса
+    """
+    status = _status_code(error)
+    return status is None or status >= 500 or status == 429
+
+retry_policy = RetryPolicy(
+    attempts=LANGFLOW_RETRY_ATTEMPTS,
+    base_delay=LANGFLOW_RETRY_BASE_DELAY,
+    max_delay=LANGFLOW_RETRY_MAX_DELAY,
+    retryable=is_transient_error,
+)
+
+# Пул равнозначных потоков/серверов: 'flow_id' или 'base_url|langflow_id|flow_id' через запятую.
+# Все элементы - копии потока FLOW_ID (ответы разбираются и кэшируются под ним).
+# По умолчанию - единственный поток FLOW_ID на BASE_API_URL
+endpoint_pool = EndpointPool(
+    parse_endpoints(os.getenv('LANGFLOW_ENDPOINTS', ''), BASE_API_URL, LANGFLOW_ID, FLOW_ID),
+    hedge_quantile=float(os.getenv('LANGFLOW_HEDGE_QUANTILE', '0.95')),
+    hedge_min_samples=int(os.getenv('LANGFLOW_HEDGE_MIN_SAMPLES', '20')),
+    cooldown=float(os.getenv('LANGFLOW_ENDPOINT_COOLDOWN', '30')),
+    failover=is_transient_error,
+)
+
+def _http_timeout(timeout: float) -> httpx.Timeout:
+    return httpx.Timeout(timeout, connect=min(LANGFLOW_CONNECT_TIMEOUT, timeout))
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Получение общего асинхронного клиента с пулом keep-alive соединений.
+    HTTP/2 включается, если установлен пакет h2.
+
+    :return: httpx.AsyncClient текущего event loop
+    """
+    global _async_client, _async_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            http2=importlib.util.find_spec('h2') is not None,
+            limits=httpx.Limits(
+                max_connections=LANGFLOW_POOL_SIZE,
+                max_keepalive_connections=LANGFLOW_POOL_SIZE,
+            ),
+            timeout=httpx.Timeout(
+                LANGFLOW_READ_TIMEOUT,
+                connect=LANGFLOW_CONNECT_TIMEOUT,
+            ),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+async def close_async_client() -> None:
+    """Закрытие общего асинхронного клиента и его пула соединений"""
+    global _async_client, _async_client_loop
+
+    if _async_client is not None:
+        client, _async_client, _async_client_loop = _async_client, None, None
+        await client.aclose()
+
+def run_flow(message: str, 
+             endpoint: str = FLOW_ID, 
+             output_type: str = "chat",
+             input_type: str = "chat", 
+             tweaks: Optional[dict] = None,
+             session_id: Optional[str] = None) -> dict:
+    """
+    Выполнение потока Langflow с заданным сообщением.
+    
+    :param message: Сообщение для отправки в поток
+    :param endpoint: ID или имя endpoint потока
+    :param tweaks: Опциональные настройки для кастомизации потока
+    :param session_id: ID сессии для памяти потока на стороне сервера
+    :return: JSON-ответ от потока
+    :raises CircuitOpenError: если Langflow недоступен
+    :raises DeadlineExceeded: если время на сообщение истекло
+    """
+    api_url, payload, headers = _build_request(message, endpoint, output_type, input_type, tweaks, session_id)
+
+    def attempt():
+        timeout = request_timeout(LANGFLOW_READ_TIMEOUT)
+        return langflow_breaker.call_sync(
+            lambda: _post_flow(api_url, payload, headers, message, timeout, endpoint),
+            is_outage_error,
+        )
+
+    return retry_policy.run_sync(attempt)
+
+def _stream_parse_enabled() -> bool:
+    # Для отладочного лога нужно тело целиком
+    return LANGFLOW_STREAM_PARSE and not logger.isEnabledFor(logging.DEBUG)
+
+def _post_flow(api_url: str, payload: dict, headers: dict, message: str, timeout: float,
+               flow_id: str = FLOW_ID) -> dict:
+    # Логирование параметров запроса
+    logger.debug("API URL: %s, message: %s", api_url, truncate(message))
+
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
-        
-        # Логирование полного ответа для отладки
-        logger.debug(f"Response Status Code: {response.status_code}")
-        logger.debug(f"Response Headers: {response.headers}")
-        logger.debug(f"Response Content: {response.text}")
-
-        response.raise_for_status()  # Вызовет исключение для плохих HTTP-статусов
-        
-        return response.json()
+        with metrics.stage_timer('langflow_http'):
+            response = _session.post(
+                api_url, json=payload, headers=headers, stream=True,
+                timeout=(min(LANGFLOW_CONNECT_TIMEOUT, timeout), timeout),
+            )
+            with response:
+                # Логирование полного ответа для отладки
+                logger.debug("Response Status Code: %s", response.status_code)
+                if logger.isEnabledFor(logging.DEBUG):
+                    # Объёмные данные пишутся выборочно и в усечённом виде
+                    logger.debug("Response Headers: %s", response.headers, extra={'verbose': True})
+                    logger.debug("Response Content: %s", truncate(response.text), extra={'verbose': True})
+
+                response.raise_for_status()  # Вызовет исключение для плохих HTTP-статусов
+
+                if not _stream_parse_enabled():
+                    return response.json()
+                return stream_reader.read(response.iter_content(LANGFLOW_BODY_CHUNK_SIZE), flow_id)
     
+    except requests.exceptions.ConnectionError as e:
+        # При stream=True таймаут чтения тела приходит как ConnectionError;
+        # это таймаут чтения (поток мог выполниться), а не сбой соединения
+        if e.args and isinstance(e.args[0], ReadTimeoutError):
+            logger.error("Истекло время чтения ответа: %s", e)
+            raise requests.exceptions.ReadTimeout(*e.args, request=e.request, response=e.response) from e
+        logger.error("Ошибка при выполнении запроса: %s", e)
+        raise
     except requests.exceptions.RequestException as e:
-        logger.error(f"Ошибка при выполнении запроса: {e}")
+        logger.error("Ошибка при выполнении запроса: %s", e)
+        raise
+    except json.JSONDecodeError as e:
+        logger.error("Ошибка декодирования JSON: %s", e)
+        raise
+
+async def run_flow_async(message: str,
+                         endpoint: Optional[str] = None,
+                         output_type: str = "chat",
+                         input_type: str = "chat",
+                         tweaks: Optional[dict] = None,
+                         session_id: Optional[str] = None) -> dict:
+    """
+    Асинхронное выполнение потока Langflow через общий пул соединений.
+    Без явного endpoint запрос идёт в пул LANGFLOW_ENDPOINTS: на самый быстрый
+    поток, с повторной отправкой на другой при медленном ответе.
+    
+    :param message: Сообщение для отправки в поток
+    :param endpoint: ID или имя endpoint потока (None - пул endpoint'ов)
+    :param tweaks: Опциональные настройки для кастомизации потока
+    :param session_id: ID сессии для памяти потока на стороне сервера
+    :return: JSON-ответ от потока
+    :raises CircuitOpenError: если Langflow недоступен
+    :raises DeadlineExceeded: если время на сообщение истекло
+    """
+    if endpoint is not None:
+        api_url, payload, headers = _build_request(message, endpoint, output_type, input_type, tweaks, session_id)
+        call = lambda timeout: _post_flow_async(api_url, payload, headers, message, timeout, endpoint)
+    else:
+        payload, headers = _build_payload(message, output_type, input_type, tweaks, session_id)
+        # Потоки пула равнозначны: путь к ответу выучен под FLOW_ID
+        call = lambda timeout: endpoint_pool.call(
+            lambda target: _post_flow_async(target.url, payload, headers, message, timeout, FLOW_ID),
+            affinity=session_id,
+            # Второй запрос с session_id записал бы реплику в историю сессии дважды
+            hedge=session_id is None and FLOW_ID not in LANGFLOW_STATEFUL_FLOWS,
+        )
+
+    async def attempt():
+        timeout = request_timeout(LANGFLOW_READ_TIMEOUT)
+        return await langflow_breaker.call_async(lambda: call(timeout), is_outage_error)
+
+    return await retry_policy.run_async(attempt)
+
+async def _post_flow_async(api_url: str, payload: dict, headers: dict, message: str, timeout: float,
+                           flow_id: str = FLOW_ID) -> dict:
+    logger.debug("API URL: %s, message: %s", api_url, truncate(message))
+
+    try:
+        with metrics.stage_timer('langflow_http'):
+            # Таймаут httpx ограничивает каждое чтение, wait_for - весь запрос
+            return await asyncio.wait_for(
+                _read_flow_async(api_url, payload, headers, timeout, flow_id),
+                timeout,
+            )
+
+    except httpx.HTTPError as e:
+        logger.error("Ошибка при выполнении запроса: %s", e)
         raise
     except json.JSONDecodeError as e:
-        logger.error(f"Ошибка декодирования JSON: {e}")
+        logger.error("Ошибка декодирования JSON: %s", e)
         raise
 
-def safe_get(obj, *keys, default=''):
+async def _read_flow_async(api_url: str, payload: dict, headers: dict, timeout: float, flow_id: str) -> dict:
+    client = get_async_client()
+    async with client.stream('POST', api_url, json=payload, headers=headers,
+                             timeout=_http_timeout(timeout)) as response:
+        logger.debug("Response Status Code: %s (%s)", response.status_code, response.http_version)
+        if not _stream_parse_enabled():
+            await response.aread()
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response Content: %s", truncate(response.text), extra={'verbose': True})
+            response.raise_for_status()
+            return response.json()
+
+        response.raise_for_status()
+        return await stream_reader.read_async(response.aiter_bytes(LANGFLOW_BODY_CHUNK_SIZE), flow_id)
+
+def _parse_stream_event(line: str, pending: str):
     """
-    Безопасное получение значения из вложенных словарей и списков
-    с расширенной логикой поиска.
+    Разбор строки потокового ответа Langflow (NDJSON или SSE с префиксом data:).
     
-    :param obj: Исходный объект
-    :param keys: Цепочка ключей для доступа
-    :param default: Значение по умолчанию
-    :return: Значение или default
+    :param line: Очередная строка
+    :param pending: Накопленный незавершённый JSON
+    :return: Кортеж (событие или None, новый накопленный фрагмент)
     """
+    line = line.strip()
+    if line.startswith('data:'):
+        line = line[5:].strip()
+    if not line or line.startswith(('event:', 'id:', ':')):
+        return None, pending
+
+    pending += line
     try:
-        for key in keys:
-            if isinstance(obj, dict):
-                obj = obj.get(key, {})
-            elif isinstance(obj, list):
-                # Если ключ - число и список не пустой
-                if isinstance(key, int) and 0 <= key < len(obj):
-                    obj = obj[key]
-                else:
-                    # Попытка найти первый элемент, если ключ не число
-                    obj = obj[0] if obj else {}
-            else:
-                return default
-
-        # Финальная проверка и извлечение текста
-        if isinstance(obj, dict):
-            # Пытаемся найти текстовое значение в словаре
-            text_keys = ['message', 'text', 'content', 'value']
-            for text_key in text_keys:
-                if text_key in obj and isinstance(obj[text_key], str):
-                    return obj[text_key]
-        
-        # Возвращаем строковое представление, если это возможно
-        return str(obj).strip() if obj else default
+        return json.loads(pending), ''
+    except json.JSONDecodeError:
+        return None, pending
 
+async def stream_flow_async(message: str,
+                            endpoint: Optional[str] = None,
+                            output_type: str = "chat",
+                            input_type: str = "chat",
+                            tweaks: Optional[dict] = None,
+                            session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Потоковое выполнение потока Langflow: фрагменты текста отдаются по мере генерации.
+    Если поток не стримит токены, итоговый текст отдаётся одним фрагментом в конце.
+    Без явного endpoint поток выбирается из пула по задержке (без хеджирования:
+    повторить уже отданные фрагменты нельзя).
+    
+    :param message: Сообщение для отправки в поток
+    :param endpoint: ID или имя endpoint потока (None - пул endpoint'ов)
+    :param tweaks: Опциональные настройки для кастомизации потока
+    :param session_id: ID сессии для памяти потока на стороне сервера
+    :return: Асинхронный итератор фрагментов ответа
+    :raises CircuitOpenError: если Langflow недоступен
+    :raises DeadlineExceeded: если время на сообщение истекло
+    """
+    timeout = request_timeout(LANGFLOW_READ_TIMEOUT)
+    langflow_breaker.acquire()
+    try:
+        if endpoint is not None:
+            api_url, payload, headers = _build_request(message, endpoint, output_type, input_type, tweaks, session_id)
+            async for chunk in _stream_events(api_url, payload, headers, endpoint, timeout):
+                yield chunk
+        else:
+            async for chunk in _stream_pool_events(message, output_type, input_type, tweaks, session_id, timeout):
+                yield chunk
     except Exception as e:
-        logger.warning(f"Ошибка в safe_get: {e}")
-        return default
+        langflow_breaker.record_error(e, is_outage_error)
+        raise
+    except BaseException:
+        # Потребитель прекратил чтение - о состоянии сервиса это ничего не говорит
+        langflow_breaker.release()
+        raise
+    langflow_breaker.record_success()
+
+async def _stream_pool_events(message: str, output_type: str, input_type: str,
+                              tweaks: Optional[dict], session_id: Optional[str],
+                              timeout: float) -> AsyncIterator[str]:
+    target = endpoint_pool.select(affinity=session_id)
+    payload, headers = _build_payload(message, output_type, input_type, tweaks, session_id)
+    started = time.monotonic()
+    try:
+        async for chunk in _stream_events(target.url, payload, headers, FLOW_ID, timeout):
+            yield chunk
+    except (httpx.HTTPError, ValueError):
+        endpoint_pool.record_failure(target)
+        raise
+    endpoint_pool.record_success(target, time.monotonic() - started)
+
+async def _stream_events(api_url: str, payload: dict, headers: dict, flow_id: str,
+                         timeout: float) -> AsyncIterator[str]:
+    async with get_async_client().stream(
+        'POST', api_url, params={'stream': 'true'}, json=payload, headers=headers,
+        timeout=_http_timeout(timeout),
+    ) as response:
+        response.raise_for_status()
+
+        streamed = False
+        pending = ''
+        async for line in response.aiter_lines():
+            event, pending = _parse_stream_event(line, pending)
+            if not isinstance(event, dict):
+                continue
+
+            data = event.get('data') or {}
+            kind = event.get('event')
+
+            if kind == 'token':
+                chunk = data.get('chunk')
+                if chunk:
+                    streamed = True
+                    yield chunk
+            elif kind == 'error':
+                raise ValueError(f"Ошибка потока Langflow: {data}")
+            elif kind == 'end':
+                if not streamed:
+                    text = response_extractor.extract(data.get('result') or data, flow_id)
+                    if text:
+                        yield text
+                return
+
+def extract_response_text(response: dict, flow_id: str = FLOW_ID) -> str:
+    """
+    Извлечение текста ответа из JSON-ответа потока.
+    Сначала проверяется путь, выученный для потока, затем остальные пути
+    и, в последнюю очередь, ограниченный по глубине поиск по всему дереву.
+    
+    :param response: JSON-ответ от потока
+    :param flow_id: ID потока
+    :return: Текстовый ответ или сообщение о неудаче
+    """
+    with metrics.stage_timer('response_extraction'):
+        answer = response_extractor.extract(response, flow_id)
+    if answer:
+        logger.info("Получен ответ: %s", truncate(answer))
+        return answer
+    
+    logger.warning("Не удалось извлечь текст. Полный ответ: %s", truncate(response))
+    return NO_ANSWER_TEXT
+
+def invalidate_answer_cache(flow_id: str = None) -> int:
+    """
+    Сброс кэша ответов и выученного пути ответа, например после изменения потока.
+    
+    :param flow_id: ID потока или None для полного сброса
+    :return: Число удалённых записей
+    """
+    response_extractor.reset(flow_id)
+    removed = answer_cache.invalidate(flow_id)
+    logger.info("Кэш ответов сброшен, удалено записей: %s", removed)
+    return removed
+
+def warm_answer_cache(path: str) -> int:
+    """
+    Загрузка ответов, полученных batch_runner.py, в кэш ответов.
+
+    :param path: JSONL с записями {"message", "answer", "flow_id", "error"}
+    :return: Число загруженных ответов
+    """
+    loaded = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('error') or not record.get('answer'):
+                continue
+            if answer_cache.put(record['message'], record['answer'], record.get('flow_id', FLOW_ID)):
+                loaded += 1
+    logger.info("Кэш ответов прогрет из %s: %s записей", path, loaded)
+    return loaded
 
 def get_langflow_response(message: str) -> str:
     """
     Получение ответа от Langflow с расширенной логикой извлечения текста.
+    Частые вопросы отдаются из локального FAQ или кэша.
     
     :param message: Входящее сообщение
     :return: Текстовый ответ или сообщение об ошибке
     """
+    local = _faq_answer(message)
+    if local is not None:
+        return local
+
+    cached = answer_cache.get(message, FLOW_ID)
+    if cached is not None:
+        return cached
+
+    with deadline_scope(LANGFLOW_DEADLINE):
+        answer = _request_langflow_response(message)
+    answer_cache.put(message, answer, FLOW_ID)
+    return _with_fallback(message, answer)
+
+def _faq_answer(message: str, chat_id=None) -> Optional[str]:
+    """
+    Ответ из локального FAQ, если совпадение уверенное.
+
+    :param message: Входящее сообщение
+    :param chat_id: ID чата: ответ попадает в историю разговора
+    :return: Ответ или None
+    """
+    if not faq_index.enabled:
+        return None
+
+    with metrics.stage_timer('faq_lookup'):
+        answer = faq_index.answer(message)
+    if answer is not None:
+        _remember_turn(chat_id, message, answer)
+    return answer
+
+def _with_fallback(message: str, answer: str) -> str:
+    """
+    Пока Langflow недоступен, вместо заглушки отдаётся ответ из кэша,
+    даже устаревший.
+    """
+    if answer != UNAVAILABLE_TEXT:
+        return answer
+    return answer_cache.get(message, FLOW_ID, allow_stale=True) or answer
+
+def _request_langflow_response(message: str) -> str:
     try:
         response = run_flow(message)
-        
-        def text_generator():
-            """Генератор для эффективного поиска текста"""
-            yield from [
-                safe_get(response, 'outputs', 0, 'outputs', 0, 'results', 'message', 'text'),
-                safe_get(response, 'outputs', 0, 'outputs', 0, 'results', 'text'),
-                safe_get(response, 'outputs', 0, 'messages', 0, 'message'),
-                safe_get(response, 'messages', 0, 'message'),
-                safe_get(response, 'outputs', 0, 'results', 'message', 'data', 'text'),
-                safe_get(response, 'outputs', 0, 'results', 'data', 'text'),
-                safe_get(response, 'messages', 0, 'text'),
-                safe_get(response, 'messages', 'text')
-            ]
-        
-        # Быстрый поиск первого непустого текста
-        for msg in text_generator():
-            if msg and isinstance(msg, str):
-                cleaned_msg = msg.strip()
-                if len(cleaned_msg) > 3:
-                    logger.info(f"Получен ответ: {cleaned_msg}")
-                    return cleaned_msg
-        
-        # Глубокий поиск с оптимизацией
-        def extract_text(obj):
-            """Рекурсивный поиск текста с ограничением глубины"""
-            if isinstance(obj, str) and len(obj.strip()) > 3:
-                return obj.strip()
-            
-            if isinstance(obj, dict):
-                for value in obj.values():
-                    result = extract_text(value)
-                    if result:
-                        return result
-            
-            if isinstance(obj, list):
-                for item in obj:
-                    result = extract_text(item)
-                    if result:
-                        return result
-            
-            return None
-        
-        fallback_text = extract_text(response)
-        if fallback_text:
-            logger.info(f"Извлечен текст методом fallback: {fallback_text}")
-            return fallback_text
-        
-        logger.warning(f"Не удалось извлечь текст. Полный ответ: {response}")
-        return "Извините, не удалось получить ответ от ассистента"
+        return extract_response_text(response)
     
+    except CircuitOpenError as open_err:
+        metrics.record_error(open_err)
+        return UNAVAILABLE_TEXT
+    except (DeadlineExceeded, requests.Timeout) as timeout_err:
+        metrics.record_error(timeout_err)
+        logger.error("Истекло время ожидания ответа: %s", timeout_err)
+        return CONNECTION_ERROR_TEXT
     except requests.RequestException as req_err:
-        logger.error(f"Сетевая ошибка при запросе: {req_err}")
-        return "Проблемы с подключением к серверу"
+        metrics.record_error(req_err)
+        logger.error("Сетевая ошибка при запросе: %s", req_err)
+        return CONNECTION_ERROR_TEXT
+    except ValueError as val_err:
+        metrics.record_error(val_err)
+        logger.error("Ошибка обработки данных: %s", val_err)
+        return PROCESSING_ERROR_TEXT
+    except Exception as e:
+        metrics.record_error(e)
+        logger.error("Неожиданная ошибка при получении ответа: %s", e)
+        return UNEXPECTED_ERROR_TEXT
+
+def _session_params(chat_id):
+    """
+    Параметры сессии чата для запроса к потоку.
+
+    Продолжения разговора выделяются, только если поток принимает локальную
+    историю (LANGFLOW_HISTORY_COMPONENT): она передаётся в каждом запросе,
+    поэтому реплики, отданные из FAQ, кэша или объединённого запроса, не
+    теряются. Без компонента истории все сообщения идут общим путём без
+    session_id.
+
+    :param chat_id: ID чата или None
+    :return: Кортеж (session_id, tweaks, является ли сообщение продолжением разговора)
+    """
+    if chat_id is None or not LANGFLOW_HISTORY_COMPONENT:
+        return None, None, False
+
+    history = context_store.render_history(chat_id)
+    tweaks = {LANGFLOW_HISTORY_COMPONENT: {LANGFLOW_HISTORY_FIELD: history}}
+    return context_store.session_id(chat_id), tweaks, bool(history)
+
+def _remember_turn(chat_id, message: str, answer: str) -> None:
+    if chat_id is not None and answer not in ERROR_RESPONSES:
+        context_store.add_turn(chat_id, message, answer)
+
+async def get_langflow_response_async(message: str, chat_id=None) -> str:
+    """
+    Асинхронное получение ответа от Langflow, не блокирующее event loop.
+    Первые сообщения разговора отдаются из кэша и объединяются с одинаковыми
+    одновременными запросами без session_id; продолжения разговора (при
+    заданном LANGFLOW_HISTORY_COMPONENT) идут в поток с историей и session_id чата.
+    
+    :param message: Входящее сообщение
+    :param chat_id: ID чата для памяти разговора (None - без контекста)
+    :return: Текстовый ответ или сообщение об ошибке
+    """
+    local = _faq_answer(message, chat_id)
+    if local is not None:
+        return local
+
+    session_id, tweaks, follow_up = _session_params(chat_id)
+
+    with deadline_scope(LANGFLOW_DEADLINE):
+        if follow_up:
+            answer = await _request_langflow_response_async(message, session_id, tweaks)
+        else:
+            answer = await _get_shared_response_async(message)
+
+    _remember_turn(chat_id, message, answer)
+    return _with_fallback(message, answer)
+
+async def _get_shared_response_async(message: str) -> str:
+    # Ответ общий для всех чатов, поэтому session_id конкретного чата не передаётся
+    cached = answer_cache.get(message, FLOW_ID)
+    if cached is not None:
+        return cached
+
+    normalized = normalize_message(message)
+    if not normalized or FLOW_ID in LANGFLOW_STATEFUL_FLOWS:
+        return await _fetch_and_cache_async(message)
+
+    try:
+        return await single_flight.do(
+            (FLOW_ID, normalized),
+            lambda: _fetch_and_cache_async(message),
+            timeout=request_timeout(SINGLE_FLIGHT_TIMEOUT),
+        )
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        metrics.record_error('single_flight_timeout')
+        logger.error("Истекло ожидание объединённого запроса к Langflow")
+        return CONNECTION_ERROR_TEXT
+
+async def _fetch_and_cache_async(message: str) -> str:
+    answer = await _request_langflow_response_async(message)
+    answer_cache.put(message, answer, FLOW_ID)
+    return answer
+
+async def _request_langflow_response_async(message: str,
+                                           session_id: Optional[str] = None,
+                                           tweaks: Optional[dict] = None) -> str:
+    try:
+        response = await run_flow_async(message, tweaks=tweaks, session_id=session_id)
+        return extract_response_text(response)
+    
+    except CircuitOpenError as open_err:
+        metrics.record_error(open_err)
+        return UNAVAILABLE_TEXT
+    except (DeadlineExceeded, asyncio.TimeoutError, httpx.TimeoutException) as timeout_err:
+        metrics.record_error(timeout_err)
+        logger.error("Истекло время ожидания ответа: %s", timeout_err)
+        return CONNECTION_ERROR_TEXT
+    except httpx.HTTPError as req_err:
+        metrics.record_error(req_err)
+        logger.error("Сетевая ошибка при запросе: %s", req_err)
+        return CONNECTION_ERROR_TEXT
     except ValueError as val_err:
-        logger.error(f"Ошибка обработки данных: {val_err}")
-        return "Ошибка при обработке ответа"
+        metrics.record_error(val_err)
+        logger.error("Ошибка обработки данных: %s", val_err)
+        return PROCESSING_ERROR_TEXT
     except Exception as e:
-        logger.error(f"Неожиданная ошибка при получении ответа: {e}")
-        return "Произошла непредвиденная ошибка"
\ No newline at end of file
+        metrics.record_error(e)
+        logger.error("Неожиданная ошибка при получении ответа: %s", e)
+        return UNEXPECTED_ERROR_TEXT
+
+async def stream_langflow_response(message: str, chat_id=None) -> AsyncIterator[str]:
+    """
+    Потоковое получение ответа от Langflow.
+    Ответ из FAQ или кэша отдаётся одним фрагментом; при ошибке до первого фрагмента
+    выполняется обычный (непотоковый) запрос.
+    
+    :param message: Входящее сообщение
+    :param chat_id: ID чата для памяти разговора (None - без контекста)
+    :return: Асинхронный итератор фрагментов ответа
+    """
+    local = _faq_answer(message, chat_id)
+    if local is not None:
+        yield local
+        return
+
+    session_id, tweaks, follow_up = _session_params(chat_id)
+
+    if not follow_up:
+        # Ответ попадёт в общий кэш, поэтому запрос идёт без сессии чата
+        session_id, tweaks = None, None
+        cached = answer_cache.get(message, FLOW_ID)
+        if cached is not None:
+            _remember_turn(chat_id, message, cached)
+            yield cached
+            return
+
+    # Бюджет LANGFLOW_DEADLINE (не позже внешнего дедлайна) выставляется на каждый
+    # шаг потока, а не вокруг yield: между фрагментами контекст потребителя не меняется
+    with deadline_scope(LANGFLOW_DEADLINE) as deadline:
+        stream = stream_flow_async(message, tweaks=tweaks, session_id=session_id)
+
+    parts = []
+    try:
+        while True:
+            with deadline_scope(deadline.remaining()):
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+            parts.append(chunk)
+            yield chunk
+    except (httpx.HTTPError, ValueError, CircuitOpenError, TimeoutError, asyncio.TimeoutError) as e:
+        metrics.record_error(e)
+        logger.error("Ошибка потокового запроса: %s", e)
+        if not parts:
+            with deadline_scope(deadline.remaining()):
+                answer = await get_langflow_response_async(message, chat_id)
+            yield answer
+        return
+    finally:
+        await stream.aclose()
+
+    answer = ''.join(parts).strip()
+    if not answer:
+        yield NO_ANSWER_TEXT
+        return
+
+    if not follow_up:
+        answer_cache.put(message, answer, FLOW_ID)
+    _remember_turn(chat_id, message, answer)
+
+if ANSWER_CACHE_WARM_FILE:
+    try:
+        warm_answer_cache(ANSWER_CACHE_WARM_FILE)
+    except OSError as warm_err:
+        logger.error("Не удалось прогреть кэш ответов: %s", warm_err)
+
+metrics.register_collector('tbot_answer_cache', answer_cache.stats)
+metrics.register_collector('tbot_single_flight', single_flight.stats)
+metrics.register_collector('tbot_response_paths', lambda: response_extractor.stats()['paths'])
+metrics.register_collector('tbot_response_parse', stream_reader.stats)
+metrics.register_collector('tbot_context_store', context_store.stats)
+metrics.register_collector('tbot_faq_index', faq_index.stats)
+metrics.register_collector('tbot_endpoint_pool', endpoint_pool.stats)
+metrics.register_collector('tbot_circuit_breaker', langflow_breaker.stats)
+metrics.register_collector('tbot_langflow_retries', retry_policy.stats)
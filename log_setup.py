@@ -0,0 +1,180 @@
+"""
+Неблокирующая настройка логирования.
+
+Записи из горячего пути только кладутся в очередь; форматирование в JSON
+и запись в stdout выполняет отдельный поток QueueListener. Поддерживаются
+уровни по модулям, выборочная запись объёмных отладочных данных и
+усечение длинных тел.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Уровень корневого логгера и уровни отдельных модулей ('httpx=WARNING,langflow_client=DEBUG')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+# 'json' - структурированные записи, 'text' - прежний текстовый формат
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# Доля записей с extra={'verbose': True}, которые попадают в лог
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+# Максимальная длина тела/ответа в логе
+LOG_BODY_LIMIT = int(os.getenv('LOG_BODY_LIMIT', '500'))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Библиотеки, которые логируют каждый HTTP-запрос на уровне INFO
+DEFAULT_MODULE_LEVELS = {
+    'httpx': 'WARNING',
+    'httpcore': 'WARNING',
+}
+
+# Стандартные атрибуты LogRecord, которые не выводятся как дополнительные поля
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'verbose'}
+
+_listener = None
+
+
+class Truncated:
+    """
+    Ленивое усечение значения для лога: str() вычисляется только
+    если запись действительно будет выведена.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit: int = None):
+        self.value = value
+        self.limit = LOG_BODY_LIMIT if limit is None else limit
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [+{len(text) - self.limit} символов]"
+
+
+def truncate(value, limit: int = None) -> Truncated:
+    """
+    Обёртка для усечения длинных значений в логе.
+
+    :param value: Значение (строка, dict, ответ сервера)
+    :param limit: Максимальная длина (по умолчанию LOG_BODY_LIMIT)
+    :return: Объект, усекающий значение при форматировании
+    """
+    return Truncated(value, limit)
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирование записи в одну строку JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей, помеченных extra={'verbose': True}"""
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'verbose', False):
+            return random.random() < self.rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который подставляет аргументы в сообщение, но оставляет
+    форматирование (JSON, traceback) потоку-слушателю.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_module_levels(spec: str) -> dict:
+    """
+    Разбор строки уровней по модулям.
+
+    :param spec: Строка вида 'httpx=WARNING,langflow_client=DEBUG'
+    :return: Словарь {имя логгера: уровень}
+    """
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = None, fmt: str = None, module_levels: dict = None, stream=None) -> None:
+    """
+    Настройка неблокирующего логирования для процесса (повторные вызовы игнорируются).
+
+    :param level: Уровень корневого логгера (по умолчанию LOG_LEVEL)
+    :param fmt: 'json' или 'text' (по умолчанию LOG_FORMAT)
+    :param module_levels: Уровни отдельных логгеров (дополняют LOG_LEVELS)
+    :param stream: Поток вывода (по умолчанию stdout)
+    """
+    global _listener
+
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel((level or LOG_LEVEL).upper())
+
+    levels = dict(DEFAULT_MODULE_LEVELS)
+    levels.update(parse_module_levels(LOG_LEVELS))
+    levels.update(module_levels or {})
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Остановка потока-слушателя с записью оставшихся записей"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,14 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+import atexit
 import os
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
 import requests
-import asyncio
 
 app = Flask(__name__)
 
-# Импортируем функции из bot.py
-from bot import start_command, help_command, handle_message
+# Общий Application и постоянный event loop процесса
+import app_lifecycle
+import update_queue
+import sharded_workers
+import inline_reply
+import metrics
+from log_setup import setup_logging
+
+# Настройка неблокирующего логирования
+setup_logging()
+
+# Очередь update: webhook отвечает сразу, обработка идёт в фоне
+# WORKER_PROCESSES > 0: update распределяются по процессам-воркерам по chat_id
+if sharded_workers.WORKER_PROCESSES:
+    dispatcher = sharded_workers.ShardedDispatcher()
+else:
+    dispatcher = update_queue.UpdateDispatcher()
+atexit.register(dispatcher.stop_threadsafe)
+
+# Короткий ответ возвращается в теле webhook; воркеры-процессы этого не поддерживают
+INLINE_REPLIES = inline_reply.INLINE_REPLY_BUDGET > 0 and not sharded_workers.WORKER_PROCESSES
+metrics.register_collector('tbot_webhook_queue', dispatcher.stats)
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 WEBHOOK_URL = 'https://28598463-5ae0-4197-b7c8-1c2d09c4360e-00-20esw1zptc3g5.kirk.replit.dev'
@@ -17,6 +35,17 @@ WEBHOOK_URL = 'https://28598463-5ae0-4197-b7c8-1c2d09c4360e-00-20esw1zptc3g5.kir
 def index():
     return "Бот работает!", 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'application': app_lifecycle.get_stats(),
+        'queue': dispatcher.stats(),
+    })
+
 @app.route('/set_webhook', methods=['GET'])
 def set_webhook():
     # URL для установки webhook
@@ -32,27 +61,24 @@ def set_webhook():
     return jsonify(response.json())
 
 @app.route(f'/{TELEGRAM_BOT_TOKEN}', methods=['POST'])
-async def webhook():
+def webhook():
     # Получаем данные от Telegram
-    update_data = request.get_json(force=True)
+    update_data = request.get_json(force=True, silent=True)
+    if not update_queue.is_valid_update(update_data):
+        return 'Bad Request', 400
     
-    # Создаем Application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    
-    # Инициализируем Application
-    await application.initialize()
-    
-    # Регистрируем хендлеры
-    application.add_handler(CommandHandler('start', start_command))
-    application.add_handler(CommandHandler('help', help_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    
-    # Создаем Update объект
-    update = Update.de_json(update_data, application.bot)
-    
-    # Обработка update
-    await application.process_update(update)
+    # Ставим update в очередь и быстро отвечаем, чтобы Telegram не повторял доставку
+    inline = inline_reply.InlineReply(update_data) if INLINE_REPLIES else None
+    result = dispatcher.submit_threadsafe(update_data, inline=inline)
+    if result == update_queue.QUEUE_FULL:
+        return 'Service Unavailable', 503
+
+    # Единственный sendMessage хендлера уходит в теле ответа, без отдельного запроса к Bot API
+    if result == update_queue.ACCEPTED and inline is not None:
+        body = inline.wait(inline_reply.INLINE_REPLY_BUDGET)
+        if body is not None:
+            return jsonify(body)
     return 'OK'
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '8080')))
\ No newline at end of file
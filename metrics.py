@@ -0,0 +1,237 @@
+"""
+Метрики задержек по этапам и счётчики ошибок в формате Prometheus.
+
+Запись в горячем пути идёт без блокировок: у каждого потока своя копия
+счётчиков, копии суммируются только при чтении (/metrics).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import tracing
+
+# Границы корзин гистограммы (секунды)
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class _Sharded:
+    """Основа для метрик с отдельной копией данных на каждый поток"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+
+class Histogram(_Sharded):
+    """
+    Гистограмма с одной меткой (например, stage).
+    """
+
+    def __init__(self, name: str, documentation: str, label: str, buckets=DEFAULT_BUCKETS):
+        """
+        :param name: Имя метрики
+        :param documentation: Описание для HELP
+        :param label: Имя метки
+        :param buckets: Верхние границы корзин
+        """
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+
+    def observe(self, label_value: str, value: float) -> None:
+        """
+        Запись наблюдения.
+
+        :param label_value: Значение метки
+        :param value: Наблюдаемое значение
+        """
+        shard = self._shard()
+        series = shard.get(label_value)
+        if series is None:
+            # [счётчики корзин..., +Inf, сумма]
+            series = shard[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> Dict[str, list]:
+        """
+        Суммирование копий всех потоков.
+
+        :return: {значение метки: [счётчики корзин..., +Inf, сумма]}
+        """
+        with self._shards_lock:
+            shards = list(self._shards)
+
+        merged = {}
+        for shard in shards:
+            for label_value, series in list(shard.items()):
+                total = merged.setdefault(label_value, [0] * (len(self.buckets) + 1) + [0.0])
+                for i, value in enumerate(series):
+                    total[i] += value
+        return merged
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}')
+        return lines
+
+
+class Counter(_Sharded):
+    """
+    Счётчик с одной меткой (например, type).
+    """
+
+    def __init__(self, name: str, documentation: str, label: str):
+        """
+        :param name: Имя метрики
+        :param documentation: Описание для HELP
+        :param label: Имя метки
+        """
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        """
+        Увеличение счётчика.
+
+        :param label_value: Значение метки
+        :param amount: Величина увеличения
+        """
+        shard = self._shard()
+        shard[label_value] = shard.get(label_value, 0) + amount
+
+    def collect(self) -> Dict[str, float]:
+        with self._shards_lock:
+            shards = list(self._shards)
+
+        merged = {}
+        for shard in shards:
+            for label_value, value in list(shard.items()):
+                merged[label_value] = merged.get(label_value, 0) + value
+        return merged
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('tbot_stage_seconds', 'Длительность этапов обработки update', 'stage')
+ERRORS = Counter('tbot_errors_total', 'Ошибки по типам', 'type')
+BREAKER_TRANSITIONS = Counter('tbot_circuit_breaker_transitions_total', 'Переходы circuit breaker в состояние', 'breaker_state')
+
+# Источники мгновенных значений: имя метрики -> функция, возвращающая dict
+_collectors = {}
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """
+    Запись длительности этапа.
+
+    :param stage: Имя этапа
+    :param seconds: Длительность в секундах
+    """
+    STAGE_SECONDS.observe(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Замер длительности блока кода (работает и вокруг await).
+    Внутри трассы этап также записывается спаном.
+
+    :param stage: Имя этапа
+    """
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    finally:
+        STAGE_SECONDS.observe(stage, time.perf_counter() - started)
+
+
+def record_error(error) -> None:
+    """
+    Учёт ошибки по типу.
+
+    :param error: Исключение или имя типа ошибки
+    """
+    ERRORS.inc(error if isinstance(error, str) else type(error).__name__)
+
+
+def record_breaker_transition(breaker: str, state: str) -> None:
+    """
+    Учёт перехода circuit breaker в новое состояние.
+
+    :param breaker: Имя breaker'а
+    :param state: Новое состояние
+    """
+    BREAKER_TRANSITIONS.inc(f"{breaker}:{state}")
+
+
+def register_collector(name: str, collect: Callable[[], dict]) -> None:
+    """
+    Регистрация источника мгновенных значений (статистика кэша, очереди и т.п.).
+    Числовые значения словаря выводятся как gauge с меткой stat,
+    вложенные словари разворачиваются через '_'.
+
+    :param name: Имя метрики
+    :param collect: Функция без аргументов, возвращающая dict
+    """
+    _collectors[name] = collect
+
+
+def _flatten(stats: dict, prefix: str = ''):
+    for key, value in stats.items():
+        key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{key}_")
+        elif isinstance(value, (int, float)):
+            yield key, float(value)
+
+
+def render_prometheus() -> str:
+    """
+    Все метрики в текстовом формате Prometheus.
+
+    :return: Текст для ответа /metrics
+    """
+    lines = STAGE_SECONDS.render() + ERRORS.render() + BREAKER_TRANSITIONS.render()
+
+    for name, collect in sorted(_collectors.items()):
+        try:
+            stats = collect()
+        except Exception:
+            ERRORS.inc('metrics_collector')
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in _flatten(stats):
+            lines.append(f'{name}{{stat="{key}"}} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,361 @@
+"""
+Устойчивость вызовов внешних сервисов: дедлайн сообщения, повторы
+с экспоненциальной задержкой и джиттером, circuit breaker.
+
+Дедлайн хранится в contextvar: его устанавливает обработчик сообщения,
+а HTTP-вызовы ниже по стеку берут из него оставшееся время как таймаут.
+Повторы выполняются только для ошибок, признанных временными, и только
+пока остаётся бюджет времени. Circuit breaker после серии отказов
+отвечает отказом сразу и периодически пропускает пробный запрос.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Бюджет времени на обработку сообщения исчерпан"""
+
+
+class CircuitOpenError(Exception):
+    """Circuit breaker разомкнут: вызов не выполняется"""
+
+
+class Deadline:
+    """
+    Момент, к которому обработка должна завершиться.
+    """
+
+    def __init__(self, seconds: float, clock=time.monotonic):
+        """
+        :param seconds: Бюджет времени от текущего момента
+        :param clock: Источник времени
+        """
+        self._clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах (не меньше нуля)"""
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float = None) -> float:
+        """
+        Таймаут для очередного вызова.
+
+        :param cap: Собственный предел вызова
+        :return: Оставшееся время, но не больше cap
+        :raises DeadlineExceeded: если время уже вышло
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Время на обработку сообщения истекло")
+        return remaining if cap is None else min(cap, remaining)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Дедлайн текущего сообщения или None"""
+    return _current_deadline.get()
+
+
+def request_timeout(cap: float) -> float:
+    """
+    Таймаут HTTP-вызова с учётом дедлайна текущего сообщения.
+
+    :param cap: Собственный таймаут вызова
+    :return: Таймаут в секундах
+    :raises DeadlineExceeded: если время уже вышло
+    """
+    deadline = _current_deadline.get()
+    return cap if deadline is None else deadline.timeout(cap)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """
+    Установка дедлайна для блока кода (в том числе вокруг await).
+    Вложенный дедлайн не может быть позже внешнего.
+
+    :param seconds: Бюджет времени
+    """
+    outer = _current_deadline.get()
+    deadline = Deadline(seconds)
+    if outer is not None and outer.expires_at <= deadline.expires_at:
+        deadline = outer
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Задержка перед повтором: экспонента с полным джиттером.
+
+    :param attempt: Номер неудачной попытки, начиная с 0
+    :param base: Базовая задержка
+    :param cap: Максимальная задержка
+    :return: Случайная задержка от 0 до min(cap, base * 2^attempt)
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryPolicy:
+    """
+    Повтор временных ошибок в пределах оставшегося бюджета времени.
+    """
+
+    def __init__(self,
+                 attempts: int = 3,
+                 base_delay: float = 0.2,
+                 max_delay: float = 2.0,
+                 retryable: Callable[[Exception], bool] = lambda error: False):
+        """
+        :param attempts: Максимальное число попыток (включая первую)
+        :param base_delay: Базовая задержка перед повтором
+        :param max_delay: Максимальная задержка перед повтором
+        :param retryable: Признак временной ошибки, которую безопасно повторить
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self._stats = {'retries': 0, 'exhausted': 0, 'out_of_budget': 0}
+
+    async def run_async(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнение корутины с повторами.
+
+        :param factory: Функция, создающая корутину вызова
+        :return: Результат вызова
+        """
+        attempt = 0
+        while True:
+            try:
+                return await factory()
+            except Exception as e:
+                delay = self._next_delay(e, attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def run_sync(self, call: Callable[[], Any]) -> Any:
+        """
+        Выполнение синхронного вызова с повторами.
+
+        :param call: Функция вызова
+        :return: Результат вызова
+        """
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                delay = self._next_delay(e, attempt)
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def _next_delay(self, error: Exception, attempt: int) -> float:
+        # Повторять нельзя - исключение пробрасывается из блока except вызывающего
+        if not self.retryable(error):
+            raise error
+        if attempt + 1 >= self.attempts:
+            self._stats['exhausted'] += 1
+            raise error
+
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        deadline = _current_deadline.get()
+        if deadline is not None and deadline.remaining() <= delay:
+            self._stats['out_of_budget'] += 1
+            raise error
+
+        self._stats['retries'] += 1
+        tracing.add_event('retry', attempt=attempt + 1, delay=round(delay, 3), error=type(error).__name__)
+        logger.warning("Временная ошибка (%s), повтор через %.2f с", error, delay)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker: closed -> open после серии отказов, open -> half_open
+    по истечении recovery_timeout, half_open -> closed после успешной пробы.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    # Числовое значение состояния для метрик
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0,
+                 probe_limit: int = 1,
+                 clock=time.monotonic):
+        """
+        :param name: Имя защищаемого сервиса (для метрик и логов)
+        :param failure_threshold: Отказов подряд до размыкания
+        :param recovery_timeout: Через сколько секунд пропустить пробный запрос
+        :param probe_limit: Сколько пробных запросов одновременно в half_open
+        :param clock: Источник времени
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_limit = probe_limit
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._stats = {'rejected': 0, 'probes': 0, 'opened': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def acquire(self) -> None:
+        """
+        Разрешение на вызов. В half_open пропускается ограниченное число проб.
+
+        :raises CircuitOpenError: если вызов выполнять нельзя
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._probes < self.probe_limit:
+                self._probes += 1
+                self._stats['probes'] += 1
+                return
+            self._stats['rejected'] += 1
+        tracing.add_event('circuit_open', breaker=self.name)
+        raise CircuitOpenError(f"{self.name}: сервис временно недоступен")
+
+    def record_success(self) -> None:
+        """Вызов завершился успешно (сервис доступен)"""
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._probes = 0
+                self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """Вызов завершился отказом сервиса"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._probes = 0
+                self._opened_at = self._clock()
+                self._stats['opened'] += 1
+                self._transition(self.OPEN)
+
+    def release(self) -> None:
+        """Вызов не дал ответа о состоянии сервиса (отменён): проба освобождается"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    async def call_async(self,
+                         factory: Callable[[], Awaitable[Any]],
+                         is_failure: Callable[[Exception], bool] = lambda error: True) -> Any:
+        """
+        Выполнение корутины под защитой breaker'а.
+
+        :param factory: Функция, создающая корутину вызова
+        :param is_failure: Считать ли исключение отказом сервиса
+        :return: Результат вызова
+        :raises CircuitOpenError: если breaker разомкнут
+        """
+        self.acquire()
+        try:
+            result = await factory()
+        except Exception as e:
+            self.record_error(e, is_failure)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success()
+        return result
+
+    def call_sync(self,
+                  call: Callable[[], Any],
+                  is_failure: Callable[[Exception], bool] = lambda error: True) -> Any:
+        """
+        Выполнение синхронного вызова под защитой breaker'а.
+
+        :param call: Функция вызова
+        :param is_failure: Считать ли исключение отказом сервиса
+        :return: Результат вызова
+        :raises CircuitOpenError: если breaker разомкнут
+        """
+        self.acquire()
+        try:
+            result = call()
+        except Exception as e:
+            self.record_error(e, is_failure)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success()
+        return result
+
+    def record_error(self,
+                     error: Exception,
+                     is_failure: Callable[[Exception], bool] = lambda error: True) -> None:
+        """
+        Учёт исключения вызова.
+
+        :param error: Исключение
+        :param is_failure: Считать ли исключение отказом сервиса
+        """
+        if is_failure(error):
+            self.record_failure()
+        else:
+            # Ошибка запроса (например, 4xx) означает, что сервис отвечает
+            self.record_success()
+
+    def stats(self) -> dict:
+        """
+        Состояние (0 - closed, 1 - half_open, 2 - open) и счётчики.
+
+        :return: Словарь со статистикой
+        """
+        with self._lock:
+            self._maybe_half_open()
+            return dict(self._stats, state=self.STATE_VALUES[self._state], failures=self._failures)
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._transition(self.HALF_OPEN)
+
+    def _transition(self, state: str) -> None:
+        previous, self._state = self._state, state
+        metrics.record_breaker_transition(self.name, state)
+        log = logger.warning if state == self.OPEN else logger.info
+        log("Circuit breaker %s: %s -> %s", self.name, previous, state)
@@ -0,0 +1,176 @@
+"""
+Кэш ответов ассистента с нормализацией вопроса, TTL и LRU-вытеснением.
+"""
+import re
+import sys
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+# Латинские буквы, которые выглядят как кириллические (после приведения к нижнему регистру)
+LOOKALIKES = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к',
+    'm': 'м', 'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у',
+})
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'[а-яё]')
+
+
+def normalize_message(message: str) -> str:
+    """
+    Нормализация вопроса для ключа кэша: регистр, пробелы, пунктуация,
+    латинские буквы-двойники в кириллических словах и ё/е.
+
+    :param message: Исходное сообщение
+    :return: Нормализованная строка (пустая, если в сообщении нет слов)
+    """
+    text = unicodedata.normalize('NFKC', message).casefold()
+
+    words = []
+    for word in _WORD_RE.findall(text):
+        if _CYRILLIC_RE.search(word):
+            word = word.translate(LOOKALIKES)
+        words.append(word.replace('ё', 'е'))
+
+    return ' '.join(words)
+
+
+class ResponseCache:
+    """
+    Потокобезопасный LRU-кэш ответов с ограничением по числу записей и памяти.
+    Ключ - пара (ID потока, нормализованный вопрос).
+    Устаревшие записи не удаляются при чтении, а вытесняются по LRU: они
+    нужны как запасной ответ, пока сервис недоступен (allow_stale).
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 max_bytes: int = 4 * 1024 * 1024,
+                 ttl: float = 3600,
+                 uncacheable: Iterable[str] = (),
+                 clock=time.monotonic):
+        """
+        :param max_entries: Максимальное число записей (0 - кэш выключен)
+        :param max_bytes: Ограничение суммарного размера ключей и ответов
+        :param ttl: Время жизни записи по умолчанию в секундах
+        :param uncacheable: Ответы, которые никогда не кэшируются (ошибки)
+        :param clock: Источник времени
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.uncacheable = frozenset(uncacheable)
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'rejected': 0,
+            'stale_hits': 0,
+        }
+
+    def get(self, message: str, flow_id: str = '', allow_stale: bool = False) -> Optional[str]:
+        """
+        Поиск ответа в кэше.
+
+        :param message: Вопрос пользователя
+        :param flow_id: ID потока, для которого был получен ответ
+        :param allow_stale: Вернуть и устаревший ответ (когда сервис недоступен)
+        :return: Ответ или None
+        """
+        key = (flow_id, normalize_message(message))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            answer, expires_at, size = entry
+            if allow_stale and expires_at <= self._clock():
+                self._stats['stale_hits'] += 1
+                return answer
+            if expires_at <= self._clock():
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return answer
+
+    def put(self, message: str, answer: str, flow_id: str = '', ttl: float = None) -> bool:
+        """
+        Сохранение ответа в кэше.
+
+        :param message: Вопрос пользователя
+        :param answer: Ответ ассистента
+        :param flow_id: ID потока
+        :param ttl: Время жизни записи (по умолчанию self.ttl)
+        :return: True, если ответ сохранён
+        """
+        normalized = normalize_message(message)
+        size = sys.getsizeof(normalized) + sys.getsizeof(answer)
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        key = (flow_id, normalized)
+
+        with self._lock:
+            if (not self.max_entries or not normalized or not answer
+                    or answer in self.uncacheable or size > self.max_bytes):
+                self._stats['rejected'] += 1
+                return False
+
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (answer, expires_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+        return True
+
+    def invalidate(self, flow_id: str = None) -> int:
+        """
+        Сброс кэша целиком или только для одного потока (например, после его изменения).
+
+        :param flow_id: ID потока или None для полного сброса
+        :return: Число удалённых записей
+        """
+        with self._lock:
+            if flow_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return removed
+
+            keys = [key for key in self._entries if key[0] == flow_id]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> dict:
+        """
+        Счётчики попаданий, промахов и вытеснений.
+
+        :return: Словарь со статистикой и текущим размером кэша
+        """
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,211 @@
+"""
+Извлечение текста ответа из JSON-ответа потока Langflow.
+
+Экстрактор запоминает, какой путь дал ответ для каждого потока, и в следующий
+раз проверяет его первым; остальные пути перебираются только при промахе.
+"""
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Известные пути к тексту ответа в порядке исходного приоритета
+RESPONSE_PATHS = (
+    ('outputs', 0, 'outputs', 0, 'results', 'message', 'text'),
+    ('outputs', 0, 'outputs', 0, 'results', 'text'),
+    ('outputs', 0, 'messages', 0, 'message'),
+    ('messages', 0, 'message'),
+    ('outputs', 0, 'results', 'message', 'data', 'text'),
+    ('outputs', 0, 'results', 'data', 'text'),
+    ('messages', 0, 'text'),
+    ('messages', 'text'),
+)
+
+# Ограничение глубины для глубокого поиска текста
+MAX_SCAN_DEPTH = 32
+
+# Минимальная длина текста, который считается ответом
+MIN_ANSWER_LENGTH = 4
+
+
+def safe_get(obj, *keys, default=''):
+    """
+    Безопасное получение значения из вложенных словарей и списков
+    с расширенной логикой поиска.
+
+    :param obj: Исходный объект
+    :param keys: Цепочка ключей для доступа
+    :param default: Значение по умолчанию
+    :return: Значение или default
+    """
+    try:
+        for key in keys:
+            if isinstance(obj, dict):
+                obj = obj.get(key, {})
+            elif isinstance(obj, list):
+                # Если ключ - число и список не пустой
+                if isinstance(key, int) and 0 <= key < len(obj):
+                    obj = obj[key]
+                else:
+                    # Попытка найти первый элемент, если ключ не число
+                    obj = obj[0] if obj else {}
+            else:
+                return default
+
+        # Финальная проверка и извлечение текста
+        if isinstance(obj, dict):
+            # Пытаемся найти текстовое значение в словаре
+            text_keys = ['message', 'text', 'content', 'value']
+            for text_key in text_keys:
+                if text_key in obj and isinstance(obj[text_key], str):
+                    return obj[text_key]
+
+        # Возвращаем строковое представление, если это возможно
+        return str(obj).strip() if obj else default
+
+    except Exception as e:
+        logger.warning("Ошибка в safe_get: %s", e)
+        return default
+
+
+def path_name(path: tuple) -> str:
+    """
+    Строковое имя пути для статистики.
+
+    :param path: Кортеж ключей
+    :return: Имя вида 'outputs.0.results.text'
+    """
+    return '.'.join(str(key) for key in path)
+
+
+def _as_answer(value) -> Optional[str]:
+    if value and isinstance(value, str):
+        value = value.strip()
+        if len(value) >= MIN_ANSWER_LENGTH:
+            return value
+    return None
+
+
+def deep_scan(obj, max_depth: int = MAX_SCAN_DEPTH) -> Optional[str]:
+    """
+    Итеративный поиск первой непустой строки в дереве ответа
+    (в том же порядке, что и рекурсивный обход) с ограничением глубины.
+
+    :param obj: Дерево ответа
+    :param max_depth: Максимальная глубина вложенности
+    :return: Найденный текст или None
+    """
+    stack = [(obj, 0)]
+    while stack:
+        node, depth = stack.pop()
+
+        if isinstance(node, str):
+            answer = _as_answer(node)
+            if answer:
+                return answer
+            continue
+
+        if depth >= max_depth:
+            continue
+
+        if isinstance(node, dict):
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            continue
+
+        stack.extend((child, depth + 1) for child in reversed(list(children)))
+
+    return None
+
+
+class ResponseExtractor:
+    """
+    Самообучающийся экстрактор: для каждого потока помнит путь,
+    который последним дал ответ, и проверяет его первым.
+    """
+
+    def __init__(self, paths: tuple = RESPONSE_PATHS, max_depth: int = MAX_SCAN_DEPTH):
+        """
+        :param paths: Известные пути к тексту ответа
+        :param max_depth: Ограничение глубины глубокого поиска
+        """
+        self.paths = tuple(paths)
+        self.max_depth = max_depth
+        self._preferred = {}
+        self._lock = threading.Lock()
+        self._hits = {path_name(path): 0 for path in self.paths}
+        self._stats = {'deep_scan': 0, 'misses': 0, 'fallbacks': 0}
+
+    def preferred_path(self, flow_id: str = '') -> Optional[tuple]:
+        """
+        Путь, который последним дал ответ для потока.
+
+        :param flow_id: ID потока
+        :return: Кортеж ключей или None, если путь ещё не известен
+        """
+        return self._preferred.get(flow_id)
+
+    def extract(self, response, flow_id: str = '') -> Optional[str]:
+        """
+        Извлечение текста ответа.
+
+        :param response: JSON-ответ потока
+        :param flow_id: ID потока, для которого запоминается путь
+        :return: Текст ответа или None
+        """
+        preferred = self._preferred.get(flow_id)
+        if preferred is not None:
+            answer = _as_answer(safe_get(response, *preferred))
+            if answer:
+                self._record_hit(preferred)
+                return answer
+
+        for path in self.paths:
+            if path == preferred:
+                continue
+            answer = _as_answer(safe_get(response, *path))
+            if answer:
+                with self._lock:
+                    self._preferred[flow_id] = path
+                    if preferred is not None:
+                        self._stats['fallbacks'] += 1
+                self._record_hit(path)
+                return answer
+
+        answer = deep_scan(response, self.max_depth)
+        with self._lock:
+            self._stats['deep_scan' if answer else 'misses'] += 1
+        return answer
+
+    def stats(self) -> dict:
+        """
+        Статистика попаданий по путям.
+
+        :return: Словарь с попаданиями по каждому пути, числом глубоких поисков,
+                 промахов и выбранным путём для каждого потока
+        """
+        with self._lock:
+            return dict(
+                self._stats,
+                paths=dict(self._hits),
+                preferred={flow_id: path_name(path) for flow_id, path in self._preferred.items()},
+            )
+
+    def reset(self, flow_id: str = None) -> None:
+        """
+        Забыть выученный путь (например, после изменения схемы потока).
+
+        :param flow_id: ID потока или None для всех потоков
+        """
+        with self._lock:
+            if flow_id is None:
+                self._preferred.clear()
+            else:
+                self._preferred.pop(flow_id, None)
+
+    def _record_hit(self, path: tuple) -> None:
+        with self._lock:
+            self._hits[path_name(path)] += 1
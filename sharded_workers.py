@@ -0,0 +1,370 @@
+"""
+Режим из нескольких процессов: процесс-приёмник получает update (webhook
+или long polling) и распределяет их по N процессам-воркерам по хешу chat_id.
+
+Все update одного чата попадают в одну очередь и одного воркера, поэтому
+порядок внутри чата сохраняется, а разные чаты обрабатываются на разных
+ядрах. Очереди принадлежат приёмнику и переживают перезапуск воркера:
+перезапуск ставит в очередь маркер остановки, старый воркер дорабатывает
+всё, что было до маркера, и только после его выхода новый процесс
+продолжает с того же места.
+
+Воркеры отвечают теми же хендлерами, что и однопроцессный бот этого режима:
+в polling - "bot copy.py" (как run_polling), в webhook - BOT_HANDLERS (как main.py).
+
+Запуск приёмника в режиме polling: python sharded_workers.py --workers 4
+Режим webhook: WORKER_PROCESSES=4 python main.py
+Плавный перезапуск всех воркеров: SIGHUP процессу-приёмнику.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from typing import Optional
+
+import requests
+
+from inline_reply import InlineReply
+from update_filter import UpdateDeduplicator, is_valid_update
+from update_queue import ACCEPTED, DUPLICATE, QUEUE_FULL
+
+logger = logging.getLogger(__name__)
+
+# Число процессов-воркеров (0 - обработка в процессе приёмника)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0'))
+# Максимальная длина очереди одного воркера
+WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', '1000'))
+# Сколько ждать, пока воркер доработает очередь при остановке
+WORKER_STOP_TIMEOUT = float(os.getenv('WORKER_STOP_TIMEOUT', '30'))
+
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
+
+# Маркер остановки воркера в очереди
+_STOP = None
+
+# Объекты update, в которых есть чат
+_CHAT_PATHS = (
+    ('message', 'chat'),
+    ('edited_message', 'chat'),
+    ('channel_post', 'chat'),
+    ('edited_channel_post', 'chat'),
+    ('callback_query', 'message', 'chat'),
+    ('my_chat_member', 'chat'),
+    ('chat_member', 'chat'),
+    ('chat_join_request', 'chat'),
+)
+
+
+def chat_id_of_update(update_data: dict) -> Optional[int]:
+    """
+    ID чата из сырого update.
+
+    :param update_data: JSON-тело update
+    :return: ID чата или None
+    """
+    for path in _CHAT_PATHS:
+        node = update_data
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, dict) and 'id' in node:
+            return node['id']
+    return None
+
+
+def shard_of(update_data: dict, shards: int) -> int:
+    """
+    Номер воркера для update: по chat_id, без чата - по update_id.
+
+    :param update_data: JSON-тело update
+    :param shards: Число воркеров
+    :return: Номер от 0 до shards - 1
+    """
+    chat_id = chat_id_of_update(update_data)
+    key = chat_id if chat_id is not None else update_data['update_id']
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def _worker_main(index: int, inbound, handlers: Optional[str] = None) -> None:
+    """Тело процесса-воркера: разбор своей очереди общим Application"""
+    if handlers:
+        # До импорта app_lifecycle: он читает BOT_HANDLERS при загрузке
+        os.environ['BOT_HANDLERS'] = handlers
+
+    from log_setup import setup_logging
+    from update_queue import UpdateDispatcher
+
+    setup_logging()
+    # SIGINT получает вся группа процессов; воркер останавливает приёмник маркером
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    dispatcher = UpdateDispatcher()
+    logger.info("Воркер %s запущен (pid %s)", index, os.getpid())
+
+    while True:
+        update_data = inbound.get()
+        if update_data is _STOP:
+            break
+        # Очередь внутри процесса заполнена - ждём, а не теряем update
+        while dispatcher.submit_threadsafe(update_data) == QUEUE_FULL:
+            time.sleep(0.05)
+
+    dispatcher.stop_threadsafe(WORKER_STOP_TIMEOUT)
+    logger.info("Воркер %s остановлен", index)
+
+
+class _WorkerSlot:
+    __slots__ = ('queue', 'process', 'restarts', 'accepted', 'lock')
+
+    def __init__(self, inbound):
+        self.queue = inbound
+        self.process = None
+        self.restarts = 0
+        self.accepted = 0
+        self.lock = threading.Lock()
+
+
+class ShardedDispatcher:
+    """
+    Распределение update по процессам-воркерам с тем же интерфейсом,
+    что у update_queue.UpdateDispatcher.
+    """
+
+    def __init__(self,
+                 workers: int = WORKER_PROCESSES or os.cpu_count() or 1,
+                 max_queue: int = WORKER_QUEUE_SIZE,
+                 deduplicator: UpdateDeduplicator = None,
+                 supervise_interval: float = 1.0,
+                 handlers: str = None):
+        """
+        :param workers: Число процессов-воркеров
+        :param max_queue: Максимальная длина очереди одного воркера
+        :param deduplicator: Множество принятых update_id
+        :param supervise_interval: Как часто проверять, живы ли воркеры
+        :param handlers: Файл хендлеров воркеров (по умолчанию BOT_HANDLERS)
+        """
+        self.workers = workers
+        self.handlers = handlers
+        self.max_queue = max_queue
+        self.deduplicator = deduplicator or UpdateDeduplicator()
+        self.supervise_interval = supervise_interval
+        # spawn: воркер не наследует потоки и блокировки приёмника
+        self._context = multiprocessing.get_context('spawn')
+        self._slots = []
+        self._started = False
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._supervisor = None
+        self._stats = {'rejected_full': 0, 'crashed': 0}
+
+    def start(self) -> None:
+        """Запуск воркеров (вызывается автоматически при первом update)"""
+        with self._start_lock:
+            if self._started:
+                return
+            self._stopping.clear()
+            self._slots = [_WorkerSlot(self._context.Queue(self.max_queue)) for _ in range(self.workers)]
+            for index in range(self.workers):
+                self._spawn(index)
+            self._supervisor = threading.Thread(target=self._supervise, name='shard-supervisor', daemon=True)
+            self._supervisor.start()
+            self._started = True
+
+    def submit_threadsafe(self, update_data: dict, timeout: float = 5, inline: InlineReply = None) -> str:
+        """
+        Передача update воркеру его чата.
+
+        :param update_data: JSON-тело update
+        :param timeout: Сколько ждать места в очереди воркера
+        :param inline: Сборщик ответа в теле webhook; update обрабатывается
+                       в другом процессе, поэтому ответ всегда идёт обычным запросом
+        :return: ACCEPTED, DUPLICATE или QUEUE_FULL
+        """
+        if inline is not None:
+            inline.finish()
+        self.start()
+        if self.deduplicator.check_and_add(update_data['update_id']):
+            return DUPLICATE
+
+        slot = self._slots[shard_of(update_data, self.workers)]
+        try:
+            slot.queue.put(update_data, timeout=timeout)
+        except queue.Full:
+            self.deduplicator.discard(update_data['update_id'])
+            self._stats['rejected_full'] += 1
+            return QUEUE_FULL
+        slot.accepted += 1
+        return ACCEPTED
+
+    def restart_worker(self, index: int, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        """
+        Плавный перезапуск воркера: старый процесс дорабатывает очередь
+        до маркера, новый продолжает с того же места.
+
+        :param index: Номер воркера
+        :param timeout: Сколько ждать завершения старого процесса
+        """
+        slot = self._slots[index]
+        with slot.lock:
+            if self._stopping.is_set():
+                # Приёмник останавливается: новый процесс не нужен
+                return
+            process = slot.process
+            slot.queue.put(_STOP)
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Воркер %s не остановился за %.0f с, завершаем принудительно", index, timeout)
+                process.terminate()
+                process.join()
+            slot.restarts += 1
+            self._spawn(index)
+
+    def rolling_restart(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        """Поочерёдный перезапуск всех воркеров (остальные продолжают работу)"""
+        for index in range(len(self._slots)):
+            self.restart_worker(index, timeout)
+
+    def stop_threadsafe(self, timeout: float = WORKER_STOP_TIMEOUT) -> None:
+        """Остановка воркеров после разбора уже принятых update"""
+        if not self._started:
+            return
+        self._stopping.set()
+        for slot in self._slots:
+            # Перезапуск, начатый раньше, успевает подменить процесс, и маркер
+            # получит уже новый; начатый позже увидит _stopping
+            with slot.lock:
+                slot.queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for index, slot in enumerate(self._slots):
+            slot.process.join(max(0.0, deadline - time.monotonic()))
+            if slot.process.is_alive():
+                logger.warning("Воркер %s не остановился вовремя, завершаем принудительно", index)
+                slot.process.terminate()
+        # Иначе после нового start() работали бы два наблюдателя
+        self._supervisor.join()
+        self._started = False
+
+    def stats(self) -> dict:
+        """
+        Метрики приёмника: длина очереди и состояние каждого воркера.
+
+        :return: Словарь со статистикой
+        """
+        stats = dict(self._stats, workers=self.workers, duplicates_dropped=self.deduplicator.duplicates)
+        for index, slot in enumerate(self._slots):
+            try:
+                queued = slot.queue.qsize()
+            except NotImplementedError:
+                # qsize недоступен на macOS
+                queued = -1
+            stats[f"worker{index}"] = {
+                'alive': int(slot.process is not None and slot.process.is_alive()),
+                'queue_length': queued,
+                'accepted': slot.accepted,
+                'restarts': slot.restarts,
+            }
+        return stats
+
+    def _spawn(self, index: int) -> None:
+        slot = self._slots[index]
+        slot.process = self._context.Process(
+            target=_worker_main, args=(index, slot.queue, self.handlers), name=f'shard-worker-{index}', daemon=True,
+        )
+        slot.process.start()
+
+    def _supervise(self) -> None:
+        # Упавший воркер перезапускается; его очередь сохраняется
+        while not self._stopping.wait(self.supervise_interval):
+            for index, slot in enumerate(self._slots):
+                if not slot.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not self._stopping.is_set() and not slot.process.is_alive():
+                        self._stats['crashed'] += 1
+                        slot.restarts += 1
+                        logger.error("Воркер %s завершился с кодом %s, перезапуск", index, slot.process.exitcode)
+                        self._spawn(index)
+                finally:
+                    slot.lock.release()
+
+
+def poll_updates(dispatcher: ShardedDispatcher,
+                 token: str = TELEGRAM_BOT_TOKEN,
+                 base_url: str = TELEGRAM_API_BASE_URL,
+                 stop: threading.Event = None,
+                 poll_timeout: int = 30) -> None:
+    """
+    Приём update через getUpdates без разбора объектами telegram.
+    Смещение продвигается только после того, как update принят воркером.
+
+    :param dispatcher: Распределитель по воркерам
+    :param token: Токен бота
+    :param base_url: Адрес Bot API
+    :param stop: Событие остановки
+    :param poll_timeout: Таймаут long polling в секундах
+    """
+    stop = stop or threading.Event()
+    session = requests.Session()
+    url = f"{base_url}/bot{token}/getUpdates"
+    offset = 0
+
+    while not stop.is_set():
+        try:
+            response = session.get(
+                url, params={'offset': offset, 'timeout': poll_timeout}, timeout=poll_timeout + 10,
+            )
+            response.raise_for_status()
+            updates = response.json().get('result') or []
+        except (requests.RequestException, ValueError) as e:
+            logger.error("Ошибка getUpdates: %s", e)
+            stop.wait(1)
+            continue
+
+        for update_data in updates:
+            if not is_valid_update(update_data):
+                continue
+            while dispatcher.submit_threadsafe(update_data) == QUEUE_FULL and not stop.is_set():
+                logger.warning("Очередь воркера заполнена, ждём")
+            offset = update_data['update_id'] + 1
+
+
+def main():
+    from log_setup import setup_logging
+
+    parser = argparse.ArgumentParser(description='Приёмник update с распределением по процессам-воркерам')
+    parser.add_argument('--workers', type=int, default=WORKER_PROCESSES or os.cpu_count() or 1)
+    # Приёмник заменяет run_polling из "bot copy.py", поэтому и хендлеры по умолчанию его
+    parser.add_argument('--handlers', default=os.getenv('BOT_HANDLERS', 'bot copy.py'),
+                        help='файл хендлеров бота')
+    args = parser.parse_args()
+
+    setup_logging()
+    if not TELEGRAM_BOT_TOKEN:
+        logger.error("Токен Telegram бота не установлен!")
+        return
+
+    dispatcher = ShardedDispatcher(workers=args.workers, handlers=args.handlers)
+    dispatcher.start()
+    stop = threading.Event()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=dispatcher.rolling_restart, name='rolling-restart', daemon=True).start())
+
+    logger.info("Приёмник запущен, воркеров: %s", args.workers)
+    try:
+        poll_updates(dispatcher, stop=stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.stop_threadsafe()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight).
+
+Если запрос с тем же ключом уже выполняется, новый вызов не идёт к серверу,
+а дожидается результата уже запущенного. Ожидающие вызовы ограничены
+собственным таймаутом и не отменяют общий запрос.
+
+Общий запрос выполняется вне трасс вызывающих: он может закончиться после
+трассы первого из них. В трассе каждого вызывающего ожидание записывается
+спаном single_flight.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Группа одновременных вызовов, объединяемых по ключу.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._stats = {
+            'upstream_calls': 0,
+            'coalesced': 0,
+            'follower_timeouts': 0,
+        }
+
+    async def do(self,
+                 key: Hashable,
+                 factory: Callable[[], Awaitable[Any]],
+                 timeout: float = None) -> Any:
+        """
+        Выполнение вызова или присоединение к уже выполняющемуся.
+
+        :param key: Ключ объединения
+        :param factory: Функция, создающая корутину запроса
+        :param timeout: Таймаут ожидания для присоединившихся вызовов
+        :return: Результат общего запроса
+        :raises asyncio.TimeoutError: если присоединившийся вызов не дождался результата
+        """
+        task = self._inflight.get(key)
+
+        if task is None:
+            self._stats['upstream_calls'] += 1
+            # Запрос выполняется отдельной задачей, чтобы отмена первого
+            # вызывающего не прерывала ожидающих
+            with tracing.detached():
+                task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            with tracing.span('single_flight', role='leader'):
+                return await asyncio.shield(task)
+
+        self._stats['coalesced'] += 1
+        with tracing.span('single_flight', role='follower'):
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                self._stats['follower_timeouts'] += 1
+                raise
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        """
+        Статистика объединения: сколько запросов ушло к серверу и сколько сэкономлено.
+
+        :return: Словарь со статистикой
+        """
+        return dict(self._stats, inflight=len(self._inflight))
@@ -0,0 +1,262 @@
+"""
+Исходящая очередь сообщений Telegram с учётом лимитов Bot API.
+
+Telegram допускает около 30 сообщений в секунду на бота и около одного
+сообщения в секунду в один чат. Отправка проходит через корзину токенов
+чата и общую корзину бота; общие токены выдаются в порядке приоритета,
+поэтому короткие ответы не ждут за частями длинных. Ответ 429 (RetryAfter)
+приостанавливает отправку в этот чат на указанное время, после чего
+сообщение отправляется повторно.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from telegram.error import RetryAfter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит бота (сообщений в секунду) и допустимый всплеск
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_GLOBAL_BURST = float(os.getenv('TELEGRAM_GLOBAL_BURST', '30'))
+# Лимит одного чата
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+# Сколько раз повторять отправку после 429
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', '3'))
+
+# Приоритеты: меньше - раньше
+PRIORITY_INTERACTIVE = 0  # команды и короткие ответы из одного сообщения
+PRIORITY_NORMAL = 1       # первая часть длинного ответа
+PRIORITY_BULK = 2         # продолжение длинного ответа
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """
+    Время ожидания из ответа 429 в секундах.
+
+    :param error: Исключение RetryAfter
+    :return: Секунды ожидания
+    """
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """
+    Корзина токенов с резервированием: токены могут уходить в минус,
+    тогда резерв означает ожидание до момента, когда токен накопится.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        """
+        :param rate: Скорость пополнения (токенов в секунду)
+        :param capacity: Ёмкость корзины (размер всплеска)
+        :param clock: Источник времени
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def reserve(self) -> float:
+        """
+        Резервирование одного токена.
+
+        :return: Сколько секунд ждать до использования токена
+        """
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self) -> None:
+        """Возврат неиспользованного токена"""
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    def penalize(self, delay: float) -> None:
+        """
+        Приостановка выдачи токенов на delay секунд (ответ 429).
+
+        :param delay: Время ожидания в секундах
+        """
+        self._refill()
+        self._tokens = min(self._tokens, 0) - delay * self.rate
+
+    def is_idle(self) -> bool:
+        """Корзина полна, т.е. её можно удалить без потери состояния"""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class OutboundSender:
+    """
+    Отправка сообщений с соблюдением общего и поканального лимитов.
+    """
+
+    def __init__(self,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 global_burst: float = TELEGRAM_GLOBAL_BURST,
+                 chat_rate: float = TELEGRAM_CHAT_RATE,
+                 chat_burst: float = TELEGRAM_CHAT_BURST,
+                 max_retries: int = TELEGRAM_SEND_RETRIES,
+                 max_chats: int = 10000,
+                 clock=time.monotonic):
+        """
+        :param global_rate: Общий лимит сообщений в секунду
+        :param global_burst: Общий допустимый всплеск
+        :param chat_rate: Лимит сообщений в секунду для одного чата
+        :param chat_burst: Допустимый всплеск для одного чата
+        :param max_retries: Число повторов после RetryAfter
+        :param max_chats: Сколько корзин чатов хранить
+        :param clock: Источник времени
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock)
+        self._chats = OrderedDict()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump_task = None
+        self._loop = None
+        self._stats = {
+            'sent': 0,
+            'failed': 0,
+            'throttled_chat': 0,
+            'throttled_global': 0,
+            'retry_after': 0,
+            'retry_after_seconds': 0.0,
+        }
+
+    async def send(self,
+                   chat_id,
+                   factory: Callable[[], Awaitable[Any]],
+                   priority: int = PRIORITY_INTERACTIVE,
+                   max_retries: Optional[int] = None) -> Any:
+        """
+        Отправка с ожиданием своей очереди.
+
+        :param chat_id: ID чата получателя
+        :param factory: Функция, создающая корутину вызова Bot API
+        :param priority: Приоритет (PRIORITY_*)
+        :param max_retries: Число повторов после RetryAfter (по умолчанию
+                            self.max_retries; 0 - для вызовов, которые можно пропустить)
+        :return: Результат вызова
+        :raises RetryAfter: если лимит повторов исчерпан
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        started = self._clock()
+        attempt = 0
+
+        while True:
+            await self._acquire(chat_id, priority)
+            if attempt == 0:
+                metrics.observe_stage('telegram_send_wait', self._clock() - started)
+
+            try:
+                with metrics.stage_timer('reply_text'):
+                    result = await factory()
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                self._stats['retry_after'] += 1
+                self._stats['retry_after_seconds'] += delay
+                metrics.record_error(e)
+                self._chat_bucket(chat_id).penalize(delay)
+                attempt += 1
+                if attempt > max_retries:
+                    self._stats['failed'] += 1
+                    raise
+                logger.warning("Telegram ограничил чат %s на %.1f с (попытка %s)", chat_id, delay, attempt)
+                continue
+            except Exception:
+                self._stats['failed'] += 1
+                raise
+
+            self._stats['sent'] += 1
+            metrics.observe_stage('telegram_send', self._clock() - started)
+            return result
+
+    def stats(self) -> dict:
+        """
+        Статистика отправки: очередь, ограничения, ответы 429.
+
+        :return: Словарь со статистикой
+        """
+        return dict(self._stats, queued=len(self._waiters), chats=len(self._chats))
+
+    async def _acquire(self, chat_id, priority: int) -> None:
+        # Сначала лимит чата: порядок сообщений внутри чата сохраняется
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay > 0:
+            self._stats['throttled_chat'] += 1
+            await asyncio.sleep(delay)
+
+        self._bind_loop()
+        if not self._waiters:
+            delay = self._global.reserve()
+            if delay <= 0:
+                return
+            self._global.refund()
+
+        self._stats['throttled_global'] += 1
+        future = self._loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = self._loop.create_task(self._pump())
+        await future
+
+    async def _pump(self) -> None:
+        # Общие токены выдаются по одному самому приоритетному ожидающему
+        while self._waiters:
+            delay = self._global.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                self._global.refund()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+
+        bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self._clock)
+        while len(self._chats) > self.max_chats:
+            oldest_id, oldest = next(iter(self._chats.items()))
+            if not oldest.is_idle():
+                break
+            del self._chats[oldest_id]
+        return bucket
+
+    def _bind_loop(self) -> None:
+        # Очередь ожидающих привязана к event loop, в котором создана
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._waiters = []
+            self._pump_task = None
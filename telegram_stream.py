@@ -0,0 +1,146 @@
+"""
+Потоковая отправка ответа в Telegram: первое сообщение отправляется сразу
+после первого фрагмента, дальше текст дописывается редактированием
+с ограничением частоты. При превышении лимита длины ответ продолжается
+в новом сообщении, граница выбирается по абзацам, предложениям и словам.
+С исходящей очередью (OutboundSender) отправки и редактирования проходят
+через её лимиты Bot API, как и остальные ответы бота.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+import inline_reply
+from telegram_sender import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, OutboundSender, retry_after_seconds,
+)
+from text_processing import MAX_MESSAGE_LENGTH, StreamSplitter
+
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между редактированиями одного сообщения (секунды)
+EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+
+
+class StreamingReply:
+    """
+    Ответ на сообщение, который дописывается по мере поступления текста.
+    """
+
+    def __init__(self,
+                 message: Message,
+                 limit: int = MAX_MESSAGE_LENGTH,
+                 edit_interval: float = EDIT_INTERVAL,
+                 transform: Optional[Callable[[str], str]] = None,
+                 sender: Optional[OutboundSender] = None,
+                 clock=time.monotonic):
+        """
+        :param message: Сообщение пользователя, на которое отправляется ответ
+        :param limit: Максимальная длина одного сообщения
+        :param edit_interval: Минимальный интервал между редактированиями
+        :param transform: Обработка текста перед отправкой (например, clean_text)
+        :param sender: Исходящая очередь с лимитами Bot API (None - отправка напрямую)
+        :param clock: Источник времени
+        """
+        self.limit = limit
+        self.edit_interval = edit_interval
+        self._message = message
+        self._transform = transform
+        self._sender = sender
+        self._clock = clock
+        self._started = clock()
+        self._parts = []
+        self._splitter = StreamSplitter(limit)
+        self._sent = None
+        self._sent_text = ''
+        self._next_edit = 0.0
+        self.first_send_latency = None
+
+    async def append(self, chunk: str) -> None:
+        """
+        Добавление очередного фрагмента ответа.
+
+        :param chunk: Фрагмент текста
+        """
+        if not chunk:
+            return
+
+        for part in self._splitter.feed(chunk):
+            await self._flush(part, final=True)
+
+        if self._sent is None or self._clock() >= self._next_edit:
+            await self._flush(self._splitter.pending)
+
+    async def finish(self) -> str:
+        """
+        Отправка остатка текста и завершение ответа.
+
+        :return: Полный отправленный текст
+        """
+        rest = self._splitter.finish()
+        if rest:
+            await self._flush(rest, final=True)
+
+        if self.first_send_latency is not None:
+            logger.debug("Первый фрагмент ответа отправлен через %.3f с", self.first_send_latency)
+
+        return ''.join(self._parts)
+
+    async def _flush(self, text: str, final: bool = False) -> None:
+        if self._transform:
+            text = self._transform(text)
+        if not text.strip():
+            return
+
+        if self._sent is None:
+            # Сообщение будет редактироваться: нужен настоящий message_id, а не ответ в теле webhook
+            await inline_reply.release()
+            # Первое сообщение ответа - вне очереди, продолжения длинного ответа - после
+            priority = PRIORITY_INTERACTIVE if not self._parts else PRIORITY_BULK
+            self._sent = await self._send(lambda: self._message.reply_text(text), priority)
+            if self.first_send_latency is None:
+                self.first_send_latency = self._clock() - self._started
+        elif text != self._sent_text:
+            if not await self._edit(text, final):
+                return
+
+        self._sent_text = text
+        self._next_edit = self._clock() + self.edit_interval
+
+        if final:
+            self._parts.append(text)
+            self._sent = None
+            self._sent_text = ''
+
+    async def _send(self, factory: Callable[[], Awaitable[Any]], priority: int,
+                    max_retries: Optional[int] = None) -> Any:
+        if self._sender is None:
+            return await factory()
+        return await self._sender.send(self._message.chat_id, factory, priority, max_retries)
+
+    async def _edit(self, text: str, final: bool) -> bool:
+        sent = self._sent
+        try:
+            # Промежуточное обновление не повторяется после 429, а пропускается
+            await self._send(lambda: sent.edit_text(text),
+                             PRIORITY_NORMAL if final else PRIORITY_BULK,
+                             None if final else 0)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                raise
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            if not final:
+                self._next_edit = self._clock() + delay
+                return False
+            if self._sender is not None:
+                # Очередь уже исчерпала повторы
+                raise
+            await asyncio.sleep(delay)
+            await sent.edit_text(text)
+        return True
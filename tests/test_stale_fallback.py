@@ -0,0 +1,60 @@
+"""
+Запасной ответ из устаревшего кэша, пока Langflow недоступен.
+
+Запуск: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StaleCacheTest(unittest.TestCase):
+
+    def test_expired_entry_is_a_miss_but_kept_for_fallback(self):
+        clock = FakeClock()
+        cache = ResponseCache(ttl=60, clock=clock)
+        cache.put('Какие часы работы?', 'С 9 до 21', 'flow')
+
+        clock.now += 61
+        self.assertIsNone(cache.get('Какие часы работы?', 'flow'))
+        self.assertEqual(cache.get('Какие часы работы?', 'flow', allow_stale=True), 'С 9 до 21')
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+
+class StaleFallbackTest(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import langflow_client
+        except ImportError as e:
+            self.skipTest(f"зависимости клиента Langflow не установлены: {e}")
+        self.client = langflow_client
+
+    def test_failed_fetch_returns_stale_answer(self):
+        client = self.client
+        clock = FakeClock()
+        cache = ResponseCache(ttl=60, uncacheable=client.ERROR_RESPONSES, clock=clock)
+        cache.put('Какие часы работы?', 'С 9 до 21', client.FLOW_ID)
+        clock.now += 61
+
+        with mock.patch.object(client, 'answer_cache', cache), \
+                mock.patch.object(client.faq_index, 'answer', return_value=None), \
+                mock.patch.object(client, 'run_flow', side_effect=client.CircuitOpenError("Langflow недоступен")):
+            self.assertEqual(client.get_langflow_response('Какие часы работы?'), 'С 9 до 21')
+
+
+if __name__ == '__main__':
+    unittest.main()
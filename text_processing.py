@@ -0,0 +1,209 @@
+"""
+Постобработка ответов перед отправкой в Telegram.
+
+Очистка пробелов выполняется встроенными строковыми операциями (регулярное
+выражение - только если в тексте есть двойные пробелы), разбиение
+на сообщения - одним проходом по индексам без копирования остатка строки.
+Границы частей выбираются по абзацам, затем по концам предложений,
+затем по словам; жёсткий разрез - только если граница не найдена.
+Для потоковых ответов разбиение выполняет StreamSplitter; полный ответ
+prepare_message очищает и разбивает за один проход по строкам.
+"""
+import re
+from typing import List
+
+# Лимит длины одного сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Граница ищется не раньше этой доли лимита, чтобы не плодить короткие части
+MIN_SPLIT_FRACTION = 0.5
+
+# Двойные пробелы после знака препинания
+_PUNCT_SPACES_RE = re.compile(r'([.,?!…])  +')
+
+# Конец предложения: знак препинания, возможно закрывающие кавычки/скобки, пробел
+_SENTENCE_END_RE = re.compile(r'[.!?…]+["»”)\]]*\s')
+
+
+def clean_text(text: str) -> str:
+    """
+    Очищает текст от лишних пробелов после точек и запятых
+    и от пробелов в начале и конце строк.
+
+    :param text: Исходный текст
+    :return: Очищенный текст
+    """
+    return '\n'.join([_clean_line(line) for line in text.split('\n')])
+
+
+def _clean_line(line: str) -> str:
+    # Регулярное выражение нужно только при наличии двойных пробелов
+    if '  ' in line:
+        line = _PUNCT_SPACES_RE.sub(r'\1 ', line)
+    return line.strip()
+
+
+def find_split(text: str, start: int, limit: int) -> int:
+    """
+    Выбор конца части, начинающейся с позиции start.
+
+    :param text: Полный текст
+    :param start: Начало части
+    :param limit: Максимальная длина части
+    :return: Позиция конца части (не включительно)
+    """
+    end = start + limit
+    if end >= len(text):
+        return len(text)
+
+    lowest = start + int(limit * MIN_SPLIT_FRACTION)
+
+    # Абзац: граница - пустая строка
+    pos = text.rfind('\n\n', lowest, end)
+    if pos != -1:
+        return pos
+
+    # Конец предложения (знак препинания остаётся в текущей части)
+    last = -1
+    for match in _SENTENCE_END_RE.finditer(text, lowest, end + 1):
+        last = match.end() - 1
+    if last != -1:
+        return last
+
+    # Перевод строки или любой пробельный символ
+    pos = text.rfind('\n', lowest, end)
+    if pos != -1:
+        return pos
+    for pos in range(end, lowest - 1, -1):
+        if text[pos].isspace():
+            return pos
+
+    return end
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Разбиение текста на сообщения не длиннее limit.
+
+    :param text: Текст ответа
+    :param limit: Максимальная длина одного сообщения
+    :return: Список непустых частей
+    """
+    parts = []
+    start = 0
+    length = len(text)
+
+    while start < length:
+        end = find_split(text, start, limit)
+        part = text[start:end].strip()
+        if part:
+            parts.append(part)
+        start = end
+        # Пробелы на границе не переносятся в начало следующей части
+        while start < length and text[start].isspace():
+            start += 1
+
+    return parts
+
+
+def prepare_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Очистка и разбиение полного ответа за один проход: каждая строка
+    очищается и сразу передаётся StreamSplitter, очищенная копия всего
+    текста не создаётся. Результат совпадает с split_message(clean_text(text)).
+
+    :param text: Текст ответа
+    :param limit: Максимальная длина одного сообщения
+    :return: Список непустых частей
+    """
+    splitter = StreamSplitter(limit)
+    parts = []
+    # Строки передаются пачками чуть больше лимита: меньше вызовов feed
+    separator, batch, batch_length = '', [], 0
+    for line in text.split('\n'):
+        line = _clean_line(line)
+        batch.append(line)
+        batch_length += len(line) + 1
+        if batch_length > limit:
+            parts.extend(splitter.feed(separator + '\n'.join(batch)))
+            separator, batch, batch_length = '\n', [], 0
+    if batch:
+        parts.extend(splitter.feed(separator + '\n'.join(batch)))
+    rest = splitter.finish()
+    if rest:
+        parts.append(rest)
+    return parts
+
+
+class StreamSplitter:
+    """
+    Разбиение ответа, поступающего фрагментами: готовые части отдаются,
+    как только накоплено больше лимита, граница выбирается так же,
+    как в split_message.
+    """
+
+    def __init__(self, limit: int = MAX_MESSAGE_LENGTH):
+        """
+        :param limit: Максимальная длина одного сообщения
+        """
+        self.limit = limit
+        self._chunks = []
+        self._length = 0
+        # Часть только что закрыта: пробелы в начале следующей отбрасываются
+        self._at_boundary = False
+
+    @property
+    def pending(self) -> str:
+        """Текст текущей (ещё не завершённой) части"""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Добавление фрагмента.
+
+        :param chunk: Фрагмент текста
+        :return: Завершённые части (обычно пустой список)
+        """
+        if self._at_boundary:
+            chunk = chunk.lstrip()
+        if not chunk:
+            return []
+
+        self._at_boundary = False
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        if self._length <= self.limit:
+            return []
+
+        text = self.pending
+        parts = []
+        start = 0
+        # Последняя часть остаётся открытой: к ней ещё может прийти текст
+        while len(text) - start > self.limit:
+            end = find_split(text, start, self.limit)
+            part = text[start:end].strip()
+            if part:
+                parts.append(part)
+            start = end
+            while start < len(text) and text[start].isspace():
+                start += 1
+
+        rest = text[start:]
+        self._chunks = [rest] if rest else []
+        self._length = len(rest)
+        self._at_boundary = not rest
+        return parts
+
+    def finish(self) -> str:
+        """
+        Завершение потока.
+
+        :return: Остаток текста (может быть пустым)
+        """
+        rest = self.pending.strip()
+        self._chunks = []
+        self._length = 0
+        self._at_boundary = False
+        return rest
@@ -0,0 +1,480 @@
+"""
+Трассировка обработки update: трасса на каждый update (update_id, chat_id)
+с вложенными спанами этапов и внешних HTTP-вызовов, включая повторы.
+
+Текущий спан хранится в contextvar, поэтому вложенность сохраняется через
+await и в задачах, созданных внутри спана (например, хеджированных запросах).
+Без активной трассы span() ничего не делает, так что вызовы в горячем пути
+почти бесплатны.
+
+Ошибка спана видна в его записи, но неудавшейся трасса считается, только
+если ошибка дошла до корня (или хендлер вызвал mark_failed()): повтор после
+сбоя, проигравший хеджированный запрос и переключение на другой endpoint
+обработку не проваливают.
+
+Решение о сохранении принимается по завершении трассы (tail sampling):
+медленные (TRACE_SLOW_SECONDS) и неудавшиеся трассы сохраняются всегда,
+остальные - с вероятностью TRACE_SAMPLE_RATE. Трассы пишутся по одной на
+строку JSONL в TRACE_FILE с ротацией по размеру; запись выполняет отдельный
+поток.
+
+Поиск самых медленных трасс: python tracing.py slowest [--limit 10] [--chat ID]
+Дерево спанов трассы:       python tracing.py show <trace_id | update_id>
+"""
+import argparse
+import contextvars
+import glob
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Файл трасс (пустой - трассировка выключена)
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+# Трассы не короче этого порога сохраняются всегда
+TRACE_SLOW_SECONDS = float(os.getenv('TRACE_SLOW_SECONDS', '5'))
+# Доля сохраняемых обычных трасс
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+# Ротация файла трасс
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', str(10 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv('TRACE_BACKUP_COUNT', '3'))
+# Ограничение числа спанов в одной трассе (например, при долгом потоковом ответе)
+TRACE_MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '256'))
+
+_current_span = contextvars.ContextVar('span', default=None)
+
+
+class Span:
+    """
+    Этап обработки внутри трассы.
+    """
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes', 'events', 'error')
+
+    def __init__(self, trace: 'Trace', span_id: int, parent_id: Optional[int], name: str,
+                 start: float, attributes: dict):
+        self.trace = trace
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+        self.events = None
+        self.error = None
+
+    def set(self, **attributes) -> None:
+        """Добавление атрибутов спана"""
+        self.attributes.update(attributes)
+
+    def event(self, name: str, **attributes) -> None:
+        """
+        Событие внутри спана (повтор, отказ breaker'а).
+
+        :param name: Имя события
+        :param attributes: Атрибуты события
+        """
+        if self.events is None:
+            self.events = []
+        self.events.append(dict(attributes, name=name, at=round(time.monotonic() - self.trace.started, 6)))
+
+    def to_dict(self) -> dict:
+        record = {
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'start': round(self.start - self.trace.started, 6),
+            'duration': round((self.end or time.monotonic()) - self.start, 6),
+        }
+        if self.attributes:
+            record['attributes'] = self.attributes
+        if self.events:
+            record['events'] = self.events
+        if self.error:
+            record['error'] = self.error
+        return record
+
+
+class Trace:
+    """
+    Дерево спанов обработки одного update.
+    """
+
+    __slots__ = ('trace_id', 'started', 'wall_started', 'spans', 'dropped_spans', 'failed')
+
+    def __init__(self, started: float):
+        self.trace_id = os.urandom(8).hex()
+        self.started = started
+        self.wall_started = time.time() - (time.monotonic() - started)
+        self.spans = []
+        self.dropped_spans = 0
+        self.failed = False
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def new_span(self, name: str, parent: Optional[Span], start: float, attributes: dict,
+                 max_spans: int) -> Optional[Span]:
+        if len(self.spans) >= max_spans:
+            self.dropped_spans += 1
+            return None
+        span = Span(self, len(self.spans), parent.span_id if parent else None, name, start, attributes)
+        self.spans.append(span)
+        return span
+
+    def to_dict(self, reason: str) -> dict:
+        root = self.root
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name,
+            'ts': round(self.wall_started, 3),
+            'duration': round(root.end - root.start, 6),
+            'failed': self.failed,
+            'sampled': reason,
+            'attributes': root.attributes,
+            'dropped_spans': self.dropped_spans,
+            'spans': [span.to_dict() for span in self.spans],
+        }
+
+
+class _TraceFormatter(logging.Formatter):
+    # Сериализация выполняется в потоке записи, а не в горячем пути
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class Tracer:
+    """
+    Создание трасс и спанов, tail sampling и экспорт в JSONL.
+    """
+
+    def __init__(self,
+                 path: str = TRACE_FILE,
+                 slow_seconds: float = TRACE_SLOW_SECONDS,
+                 sample_rate: float = TRACE_SAMPLE_RATE,
+                 max_bytes: int = TRACE_MAX_BYTES,
+                 backup_count: int = TRACE_BACKUP_COUNT,
+                 max_spans: int = TRACE_MAX_SPANS):
+        """
+        :param path: Файл трасс (пустой - трассировка выключена)
+        :param slow_seconds: Порог медленной трассы
+        :param sample_rate: Доля сохраняемых обычных трасс
+        :param max_bytes: Размер файла, после которого он ротируется
+        :param backup_count: Сколько ротированных файлов хранить
+        :param max_spans: Ограничение числа спанов в трассе
+        """
+        self.path = path
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_spans = max_spans
+        self._queue = None
+        self._listener = None
+        self._stats = {'started': 0, 'exported': 0, 'dropped': 0, 'slow': 0, 'failed': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @contextmanager
+    def trace(self, name: str, started_at: float = None, **attributes):
+        """
+        Трасса обработки update. Внутри уже активной трассы - обычный спан.
+
+        :param name: Имя корневого спана
+        :param started_at: Начало по time.monotonic() (например, момент постановки в очередь)
+        :param attributes: Атрибуты трассы (update_id, chat_id)
+        """
+        if not self.enabled or _current_span.get() is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+
+        started = time.monotonic() if started_at is None else started_at
+        trace = Trace(started)
+        root = trace.new_span(name, None, started, attributes, self.max_spans)
+        self._stats['started'] += 1
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            if self._record_error(root, e):
+                trace.failed = True
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end = time.monotonic()
+            self._finish(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Вложенный спан (работает и вокруг await). Без активной трассы ничего не делает.
+
+        :param name: Имя этапа
+        :param attributes: Атрибуты спана
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = parent.trace.new_span(name, parent, time.monotonic(), attributes, self.max_spans)
+        if span is None:
+            yield None
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self._record_error(span, e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end = time.monotonic()
+
+    def record_span(self, name: str, start: float, end: float = None, **attributes) -> None:
+        """
+        Спан для уже прошедшего интервала (например, ожидания в очереди).
+
+        :param name: Имя этапа
+        :param start: Начало по time.monotonic()
+        :param end: Конец по time.monotonic() (по умолчанию - сейчас)
+        """
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = parent.trace.new_span(name, parent, start, attributes, self.max_spans)
+        if span is not None:
+            span.end = time.monotonic() if end is None else end
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def close(self) -> None:
+        """Дописать очередь трасс в файл"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def _record_error(self, span: Span, error: BaseException) -> bool:
+        # Возвращает, является ли исключение ошибкой обработки
+        if isinstance(error, GeneratorExit):
+            return False
+        span.error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        # Отмена (например, проигравшего хеджированного запроса) - не ошибка обработки
+        return not isinstance(error, (KeyboardInterrupt, SystemExit)) and type(error).__name__ != 'CancelledError'
+
+    def _finish(self, trace: Trace) -> None:
+        duration = trace.root.end - trace.root.start
+        if trace.failed:
+            reason = 'failed'
+        elif duration >= self.slow_seconds:
+            reason = 'slow'
+        elif random.random() < self.sample_rate:
+            reason = 'sampled'
+        else:
+            self._stats['dropped'] += 1
+            return
+
+        if reason != 'sampled':
+            self._stats[reason] += 1
+        self._stats['exported'] += 1
+        self._export(trace.to_dict(reason))
+
+    def _export(self, record: dict) -> None:
+        if self._listener is None:
+            self._start_listener()
+        self._queue.put(logging.makeLogRecord({'msg': record}))
+
+    def _start_listener(self) -> None:
+        import atexit
+        import logging.handlers
+
+        handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8', delay=True,
+        )
+        handler.setFormatter(_TraceFormatter())
+        self._queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+        atexit.register(self.close)
+
+
+tracer = Tracer()
+
+
+def trace(name: str, started_at: float = None, **attributes):
+    """Трасса обработки update в общем трассировщике (см. Tracer.trace)"""
+    return tracer.trace(name, started_at, **attributes)
+
+
+def span(name: str, **attributes):
+    """Спан в общем трассировщике (см. Tracer.span)"""
+    return tracer.span(name, **attributes)
+
+
+def record_span(name: str, start: float, end: float = None, **attributes) -> None:
+    """Спан для прошедшего интервала в общем трассировщике"""
+    tracer.record_span(name, start, end, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """Текущий спан или None вне трассы"""
+    return _current_span.get()
+
+
+@contextmanager
+def detached():
+    """
+    Блок вне текущей трассы: задачи, созданные внутри, не пишут в неё спаны.
+    Нужен для работы, общей для нескольких трасс (объединённый запрос),
+    которая может пережить трассу, её запустившую.
+    """
+    token = _current_span.set(None)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def add_event(name: str, **attributes) -> None:
+    """
+    Событие в текущем спане (ничего не делает вне трассы).
+
+    :param name: Имя события
+    :param attributes: Атрибуты события
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.event(name, **attributes)
+
+
+def mark_failed(error: BaseException = None) -> None:
+    """
+    Обработка update не удалась, хотя исключение перехвачено (например,
+    хендлер ответил сообщением об ошибке): трасса сохраняется как неудавшаяся.
+
+    :param error: Перехваченное исключение (записывается в корневой спан)
+    """
+    span = _current_span.get()
+    if span is None:
+        return
+    root = span.trace.root
+    if error is not None and root.error is None:
+        root.error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+    span.trace.failed = True
+
+
+def annotate_trace(**attributes) -> None:
+    """Атрибуты корневого спана текущей трассы (например, chat_id, ставший известным позже)"""
+    span = _current_span.get()
+    if span is not None:
+        span.trace.root.attributes.update(attributes)
+
+
+def read_traces(path: str = TRACE_FILE):
+    """
+    Трассы из файла и его ротированных копий.
+
+    :param path: Файл трасс
+    :return: Итератор словарей трасс
+    """
+    for name in sorted(glob.glob(glob.escape(path) + '.*'), reverse=True) + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def format_trace(record: dict) -> str:
+    """
+    Дерево спанов трассы для вывода в терминал.
+
+    :param record: Трасса
+    :return: Текст
+    """
+    lines = [
+        f"{record['trace_id']}  {record['duration']:.3f} с  {record['sampled']}  "
+        f"{json.dumps(record.get('attributes', {}), ensure_ascii=False)}"
+    ]
+    children = {}
+    for span in record['spans']:
+        children.setdefault(span['parent'], []).append(span)
+
+    def walk(parent_id, depth):
+        for span in sorted(children.get(parent_id, ()), key=lambda s: s['start']):
+            details = json.dumps(span['attributes'], ensure_ascii=False) if span.get('attributes') else ''
+            error = f"  ОШИБКА {span['error']}" if span.get('error') else ''
+            lines.append(f"{span['start']:>9.3f} {span['duration']:>9.3f}  {'  ' * depth}{span['name']} {details}{error}")
+            for event in span.get('events', ()):
+                extra = {k: v for k, v in event.items() if k not in ('name', 'at')}
+                lines.append(f"{event['at']:>9.3f} {'':>9}  {'  ' * (depth + 1)}* {event['name']} "
+                             f"{json.dumps(extra, ensure_ascii=False)}")
+            walk(span['id'], depth + 1)
+
+    walk(None, 0)
+    if record.get('dropped_spans'):
+        lines.append(f"(пропущено спанов: {record['dropped_spans']})")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск по сохранённым трассам')
+    parser.add_argument('--file', default=TRACE_FILE or 'traces.jsonl')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    slowest = commands.add_parser('slowest', help='Самые медленные трассы')
+    slowest.add_argument('--limit', type=int, default=10)
+    slowest.add_argument('--chat', type=int, help='Только трассы чата')
+    slowest.add_argument('--since', type=float, help='Только за последние N минут')
+    slowest.add_argument('--failed', action='store_true', help='Только трассы с ошибкой')
+
+    show = commands.add_parser('show', help='Дерево спанов трассы')
+    show.add_argument('key', help='trace_id или update_id')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        for record in read_traces(args.file):
+            if args.key in (record['trace_id'], str(record.get('attributes', {}).get('update_id'))):
+                print(format_trace(record))
+                return
+        print("Трасса не найдена", file=sys.stderr)
+        sys.exit(1)
+
+    since = time.time() - args.since * 60 if args.since else None
+    selected = [
+        record for record in read_traces(args.file)
+        if (args.chat is None or record.get('attributes', {}).get('chat_id') == args.chat)
+        and (since is None or record['ts'] >= since)
+        and (not args.failed or record['failed'])
+    ]
+    selected.sort(key=lambda record: record['duration'], reverse=True)
+
+    print(f"{'длит., с':>9}  {'время':19}  {'update_id':>10}  {'chat_id':>12}  {'':6}  trace_id  (самый долгий этап)")
+    for record in selected[:args.limit]:
+        attributes = record.get('attributes', {})
+        stages = [span for span in record['spans'] if span['parent'] is not None]
+        slowest_stage = max(stages, key=lambda span: span['duration'], default=None)
+        stage = f"{slowest_stage['name']} {slowest_stage['duration']:.2f} с" if slowest_stage else ''
+        print(f"{record['duration']:>9.3f}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['ts']))}  "
+              f"{attributes.get('update_id', ''):>10}  {attributes.get('chat_id', ''):>12}  "
+              f"{'ошибка' if record['failed'] else '':6}  {record['trace_id']}  ({stage})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Проверка и дедупликация входящих update без зависимостей от asyncio и telegram,
+чтобы их можно было выполнить до загрузки тяжёлых модулей на холодном старте.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEDUP_MAX_SIZE = int(os.getenv('DEDUP_MAX_SIZE', '10000'))
+DEDUP_TTL = float(os.getenv('DEDUP_TTL', '3600'))
+
+
+def is_valid_update(update_data) -> bool:
+    """
+    Минимальная проверка тела update от Telegram.
+
+    :param update_data: Разобранное JSON-тело запроса
+    :return: True, если это похоже на update
+    """
+    return (
+        isinstance(update_data, dict)
+        and isinstance(update_data.get('update_id'), int)
+        and not isinstance(update_data.get('update_id'), bool)
+    )
+
+
+class UpdateDeduplicator:
+    """
+    Ограниченное по размеру и времени множество уже принятых update_id.
+    """
+
+    def __init__(self, max_size: int = DEDUP_MAX_SIZE, ttl: float = DEDUP_TTL, clock=time.monotonic):
+        """
+        :param max_size: Максимальное число запоминаемых update_id
+        :param ttl: Сколько секунд помнить update_id
+        :param clock: Источник времени
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def check_and_add(self, update_id: int) -> bool:
+        """
+        Регистрация update_id.
+
+        :param update_id: ID update
+        :return: True, если update уже встречался (повторная доставка)
+        """
+        now = self._clock()
+        with self._lock:
+            # update_id добавляются по времени, поэтому устаревшие всегда в начале
+            while self._seen and next(iter(self._seen.values())) <= now:
+                self._seen.popitem(last=False)
+
+            if update_id in self._seen:
+                self.duplicates += 1
+                return True
+
+            self._seen[update_id] = now + self.ttl
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return False
+
+    def discard(self, update_id: int) -> None:
+        """
+        Забыть update_id, который не удалось принять: повторная доставка
+        не должна считаться дубликатом.
+
+        :param update_id: ID update
+        """
+        with self._lock:
+            self._seen.pop(update_id, None)
+
+    def __len__(self) -> int:
+        return len(self._seen)
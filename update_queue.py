@@ -0,0 +1,174 @@
+"""
+Очередь входящих update для webhook с быстрым ответом Telegram.
+
+Webhook проверяет update, кладёт его в очередь внутри процесса и сразу
+отвечает 'OK' (или ждёт короткий ответ для тела webhook, см. inline_reply);
+в постоянном event loop очередь разбирается по порядку, и каждый update
+обрабатывается своей задачей. Порядок внутри чата и параллелизм задаёт
+планировщик (ChatUpdateProcessor): очередь не ждёт обработки update, поэтому
+длинная серия сообщений одного чата не задерживает остальные чаты.
+Повторные доставки одного update_id отбрасываются.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import app_lifecycle
+import tracing
+from inline_reply import InlineReply
+from update_filter import UpdateDeduplicator, is_valid_update
+
+logger = logging.getLogger(__name__)
+
+# Сколько update одновременно передано в обработку; при достижении предела
+# очередь перестаёт разбираться и заполняется (503 для Telegram)
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', '256'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+
+# Результаты приёма update
+ACCEPTED = 'accepted'
+DUPLICATE = 'duplicate'
+QUEUE_FULL = 'queue_full'
+
+
+class UpdateDispatcher:
+    """
+    Очередь update и их обработка в постоянном event loop процесса.
+    """
+
+    def __init__(self,
+                 max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT,
+                 max_queue: int = WEBHOOK_QUEUE_SIZE,
+                 deduplicator: UpdateDeduplicator = None):
+        """
+        :param max_in_flight: Максимум update, одновременно переданных в обработку
+        :param max_queue: Максимальная длина очереди
+        :param deduplicator: Множество принятых update_id
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.deduplicator = deduplicator or UpdateDeduplicator()
+        self._queue = None
+        self._in_flight = None
+        self._dispatcher = None
+        self._tasks = set()
+        self._stats = {
+            'accepted': 0,
+            'rejected_full': 0,
+            'processed': 0,
+            'failed': 0,
+            'lag_seconds_last': 0.0,
+            'lag_seconds_max': 0.0,
+            'lag_seconds_total': 0.0,
+        }
+
+    async def submit(self, update_data: dict, inline: InlineReply = None) -> str:
+        """
+        Постановка update в очередь (вызывается внутри event loop).
+
+        :param update_data: JSON-тело update
+        :param inline: Сборщик ответа в теле webhook
+        :return: ACCEPTED, DUPLICATE или QUEUE_FULL
+        """
+        self._ensure_started()
+
+        if self._queue.full():
+            self._stats['rejected_full'] += 1
+            return QUEUE_FULL
+
+        if self.deduplicator.check_and_add(update_data['update_id']):
+            return DUPLICATE
+
+        self._queue.put_nowait((time.monotonic(), update_data, inline))
+        self._stats['accepted'] += 1
+        return ACCEPTED
+
+    def submit_threadsafe(self, update_data: dict, timeout: float = 5, inline: InlineReply = None) -> str:
+        """
+        Постановка update в очередь из синхронного кода (например, из Flask).
+
+        :param update_data: JSON-тело update
+        :param timeout: Максимальное время ожидания
+        :param inline: Сборщик ответа в теле webhook
+        :return: ACCEPTED, DUPLICATE или QUEUE_FULL
+        """
+        return app_lifecycle.run_sync(self.submit(update_data, inline), timeout)
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Остановка после обработки уже принятых update.
+
+        :param timeout: Максимальное время ожидания разбора очереди
+        """
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь update не разобрана при остановке: %d", self._queue.qsize())
+
+        tasks = [self._dispatcher, *self._tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = set()
+        self._dispatcher = None
+        self._queue = None
+
+    def stop_threadsafe(self, timeout: float = 10) -> None:
+        """Остановка из синхронного кода (например, в atexit)"""
+        if self._queue is not None:
+            app_lifecycle.run_sync(self.stop(timeout), timeout + 1)
+
+    def stats(self) -> dict:
+        """
+        Метрики очереди: длина, задержка обработки, отброшенные дубликаты.
+
+        :return: Словарь со статистикой
+        """
+        processed = self._stats['processed'] + self._stats['failed']
+        return dict(
+            self._stats,
+            queue_length=self._queue.qsize() if self._queue is not None else 0,
+            in_flight=len(self._tasks),
+            lag_seconds_avg=self._stats['lag_seconds_total'] / processed if processed else 0.0,
+            duplicates_dropped=self.deduplicator.duplicates,
+        )
+
+    def _ensure_started(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(self.max_queue)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        # Update передаются в обработку по порядку очереди и не ожидаются здесь:
+        # ожидание блокировки чата в планировщике не держит очередь
+        while True:
+            await self._in_flight.acquire()
+            item = await self._queue.get()
+            task = asyncio.ensure_future(self._process(*item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, enqueued: float, update_data: dict, inline: InlineReply) -> None:
+        try:
+            lag = time.monotonic() - enqueued
+            self._stats['lag_seconds_last'] = lag
+            self._stats['lag_seconds_max'] = max(self._stats['lag_seconds_max'], lag)
+            self._stats['lag_seconds_total'] += lag
+
+            with tracing.trace('update', started_at=enqueued, update_id=update_data.get('update_id'),
+                               source='webhook'):
+                tracing.record_span('webhook_queue', enqueued)
+                await app_lifecycle.process_update_data(update_data, inline)
+            self._stats['processed'] += 1
+        except Exception:
+            self._stats['failed'] += 1
+            logger.exception("Ошибка обработки update %s", update_data.get('update_id'))
+        finally:
+            self._in_flight.release()
+            self._queue.task_done()
@@ -0,0 +1,248 @@
+"""
+Планировщик обработки update с ограничением параллелизма и порядком внутри чата.
+
+- update разных чатов обрабатываются параллельно (не больше max_concurrent);
+- update одного чата обрабатываются строго по очереди;
+- /start и /help идут по быстрой полосе и не ждут вызовов LLM;
+- при переполнении очереди новые update ставятся в очередь или
+  отклоняются с вежливым ответом;
+- быстрые серии сообщений чата склеиваются в один вопрос (BURST_WINDOW > 0).
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import tracing
+from burst_aggregator import BURST_WINDOW, BurstAggregator, processing
+from telegram_sender import PRIORITY_BULK, OutboundSender
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_MAX_CONCURRENT = int(os.getenv('SCHEDULER_MAX_CONCURRENT', '8'))
+SCHEDULER_MAX_BACKLOG = int(os.getenv('SCHEDULER_MAX_BACKLOG', '100'))
+# 'queue' - продолжать ставить в очередь, 'shed' - отклонять с ответом
+SCHEDULER_OVERLOAD_POLICY = os.getenv('SCHEDULER_OVERLOAD_POLICY', 'shed')
+
+FAST_LANE_COMMANDS = frozenset({'start', 'help'})
+
+OVERLOAD_TEXT = (
+    "Извините, сейчас очень много обращений. "
+    "Пожалуйста, повторите вопрос через минуту."
+)
+
+# Верхняя граница числа update, одновременно принятых в планировщик
+_ADMISSION_LIMIT = 1 << 16
+
+# Сколько последних замеров ожидания хранить для перцентилей
+_WAIT_SAMPLES = 1024
+
+
+def chat_id_of(update: object):
+    """
+    ID чата update или None, если update не относится к чату.
+
+    :param update: Объект update
+    :return: ID чата или None
+    """
+    if isinstance(update, Update) and update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+def command_of(update: object):
+    """
+    Имя команды бота из текста сообщения (без '/' и @username).
+
+    :param update: Объект update
+    :return: Имя команды или None
+    """
+    if not isinstance(update, Update) or not update.effective_message:
+        return None
+    text = update.effective_message.text or ''
+    if not text.startswith('/'):
+        return None
+    parts = text[1:].split(maxsplit=1)
+    return parts[0].split('@', 1)[0].lower() if parts else None
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Процессор update для Application.concurrent_updates(...).
+    """
+
+    def __init__(self,
+                 max_concurrent: int = SCHEDULER_MAX_CONCURRENT,
+                 max_backlog: int = SCHEDULER_MAX_BACKLOG,
+                 overload_policy: str = SCHEDULER_OVERLOAD_POLICY,
+                 fast_lane_commands=FAST_LANE_COMMANDS,
+                 overload_text: str = OVERLOAD_TEXT,
+                 aggregator: BurstAggregator = None,
+                 sender: OutboundSender = None):
+        """
+        :param max_concurrent: Максимум одновременно обрабатываемых update
+        :param max_backlog: Порог очереди ожидающих update
+        :param overload_policy: 'queue' или 'shed'
+        :param fast_lane_commands: Команды, обрабатываемые вне очереди
+        :param overload_text: Ответ при отклонении update
+        :param aggregator: Склейка серий сообщений (по умолчанию - при BURST_WINDOW > 0)
+        :param sender: Исходящая очередь для ответов о перегрузке (None - отправка напрямую)
+        """
+        if overload_policy not in ('queue', 'shed'):
+            raise ValueError(f"Неизвестная политика перегрузки: {overload_policy}")
+
+        super().__init__(max_concurrent_updates=_ADMISSION_LIMIT)
+        self.max_concurrent = max_concurrent
+        self.max_backlog = max_backlog
+        self.overload_policy = overload_policy
+        self.fast_lane_commands = frozenset(fast_lane_commands)
+        self.overload_text = overload_text
+        if aggregator is None and BURST_WINDOW > 0:
+            aggregator = BurstAggregator()
+        self.aggregator = aggregator
+        self.sender = sender
+
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._chat_locks = {}
+        self._backlog = 0
+        self._active = 0
+        self._waits = deque(maxlen=_WAIT_SAMPLES)
+        self._stats = {
+            'processed': 0,
+            'fast_lane': 0,
+            'shed': 0,
+            'overflowed': 0,
+            'max_backlog_seen': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if command_of(update) in self.fast_lane_commands:
+            self._stats['fast_lane'] += 1
+            await coroutine
+            return
+
+        if self._backlog >= self.max_backlog:
+            if self.overload_policy == 'shed':
+                self._stats['shed'] += 1
+                coroutine.close()
+                await self._reply_overloaded(update)
+                return
+            self._stats['overflowed'] += 1
+
+        chat_id = chat_id_of(update)
+        burst = None
+        # Серия собирается до очереди чата, иначе следующие сообщения ждали бы окно первого
+        if self.aggregator is not None and chat_id is not None and self.aggregator.accepts(update):
+            try:
+                burst = await self.aggregator.collect(chat_id, update)
+            finally:
+                if burst is None:
+                    # Сообщение вошло в серию другого update (или ожидание прервано)
+                    coroutine.close()
+            if burst is None:
+                return
+
+        enqueued = time.monotonic()
+        self._backlog += 1
+        self._stats['max_backlog_seen'] = max(self._stats['max_backlog_seen'], self._backlog)
+        started = False
+
+        lock = self._acquire_chat_lock(chat_id)
+        try:
+            # При webhook трасса уже открыта очередью update, при polling начинается здесь
+            started_at = burst.started if burst is not None else enqueued
+            with tracing.trace('update', started_at=started_at, update_id=getattr(update, 'update_id', None)):
+                tracing.annotate_trace(chat_id=chat_id)
+                async with lock, self._slots:
+                    self._backlog -= 1
+                    started = True
+                    self._record_wait(time.monotonic() - enqueued)
+                    tracing.record_span('chat_queue_wait', enqueued)
+                    if burst is not None:
+                        tracing.record_span('burst_window', burst.started, enqueued, messages=len(burst.updates))
+
+                    self._active += 1
+                    try:
+                        with processing(burst):
+                            await coroutine
+                    finally:
+                        self._active -= 1
+                        self._stats['processed'] += 1
+        finally:
+            if not started:
+                self._backlog -= 1
+                coroutine.close()
+            self._release_chat_lock(chat_id)
+
+    def stats(self) -> dict:
+        """
+        Метрики планировщика: глубина очереди, активные задачи, время ожидания,
+        склейка серий сообщений.
+
+        :return: Словарь со статистикой
+        """
+        waits = sorted(self._waits)
+        percentiles = {}
+        for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            percentiles[f'wait_seconds_{name}'] = waits[int(q * (len(waits) - 1))] if waits else 0.0
+
+        stats = dict(
+            self._stats,
+            backlog=self._backlog,
+            active=self._active,
+            chats=len(self._chat_locks),
+            **percentiles,
+        )
+        if self.aggregator is not None:
+            stats['burst'] = self.aggregator.stats()
+        return stats
+
+    def _acquire_chat_lock(self, chat_id):
+        if chat_id is None:
+            return contextlib.nullcontext()
+        entry = self._chat_locks.get(chat_id)
+        if entry is None:
+            entry = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_chat_lock(self, chat_id) -> None:
+        if chat_id is None:
+            return
+        entry = self._chat_locks[chat_id]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._chat_locks[chat_id]
+
+    def _record_wait(self, wait: float) -> None:
+        self._waits.append(wait)
+        self._stats['wait_seconds_total'] += wait
+        self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], wait)
+
+    async def _reply_overloaded(self, update: object) -> None:
+        if not isinstance(update, Update) or not update.effective_message:
+            return
+        message = update.effective_message
+        try:
+            if self.sender is None:
+                await message.reply_text(self.overload_text)
+            else:
+                # Уведомление не должно вытеснять ответы и не повторяется после 429
+                await self.sender.send(message.chat_id, lambda: message.reply_text(self.overload_text),
+                                       PRIORITY_BULK, max_retries=0)
+        except Exception as e:
+            logger.error("Не удалось отправить ответ о перегрузке: %s", e)